@@ -0,0 +1,334 @@
+"""Local HTTP/JSON service around one warm downloader.
+
+Instead of everyone running master_downloader.py by hand, one process
+keeps the driver pool, the HTTP session and the aria2 daemon running and
+works through the shared job queue; clients only submit and watch.
+
+    python api_server.py [--host 127.0.0.1] [--port 8765] [--token SECRET | --no-token]
+
+    POST /jobs          {"classes": [url | {"url", "title", "has_notes"}, ...],
+                         "course": "...", "subject": "...",
+                         "use_youtube": false, "quality": "max 720p",
+                         "requeue": false}
+    GET  /jobs          every job, ?state=pending|running|done|dead|parked
+    POST /jobs/retry    give dead jobs a fresh set of attempts
+    GET  /status        queue counts and the transfers in progress
+    GET  /events        server-sent events: 'job' on every state change,
+                        'progress' once a second while something runs,
+                        'resolved' when a course/subject filter is queued
+    POST /cookies       {"cookies": "..."} replaces the session cookies
+
+course/subject filters are matched (case-insensitive, substring) against
+catalogue.json when it exists, otherwise the matching listings are crawled
+on the pooled browsers. Classes already downloaded or given up on are only
+queued again with "requeue": true.
+
+Every request needs "Authorization: Bearer SECRET"; without --token a
+random one is made and printed at startup, --no-token turns the check off.
+POST bodies must be sent as application/json and requests from a web page
+of another origin are refused, so a page open in the browser cannot queue
+downloads behind the user's back.
+"""
+import argparse
+import json
+import queue
+import secrets
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from rich.console import Console
+
+EVENT_INTERVAL = 1.0
+SUBSCRIBER_BACKLOG = 1000
+
+
+def matches(text, wanted):
+    return not wanted or wanted.strip().lower() in (text or '').lower()
+
+
+class EventBus:
+    """One thread turns queue changes and progress into events for every subscriber"""
+
+    def __init__(self, master):
+        self.master = master
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+
+    def subscribe(self):
+        events = queue.Queue(SUBSCRIBER_BACKLOG)
+        with self._lock:
+            self._subscribers.add(events)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='api-events', daemon=True)
+                self._thread.start()
+        return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            self._subscribers.discard(events)
+
+    def publish(self, kind, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait((kind, data))
+            except queue.Full:
+                # A client that stopped reading does not hold up the others
+                self.unsubscribe(events)
+
+    def _run(self):
+        # (updated_at, id) of the last job published, jobs can share a timestamp
+        since, last_id = time.time(), 0
+        while True:
+            time.sleep(EVENT_INTERVAL)
+            for job in self.master.jobs.changed_since(since, last_id):
+                since, last_id = job['updated_at'], job['id']
+                self.publish('job', job)
+            progress = self.master.video_downloader.progress.snapshot()
+            if progress['active']:
+                self.publish('progress', progress)
+
+
+class DownloadService:
+    """The shared MasterDownloader plus the worker thread that drains its queue"""
+
+    def __init__(self, master, console):
+        self.master = master
+        self.console = console
+        self.downloader = master.video_downloader
+        self.events = EventBus(master)
+        self._wake = threading.Event()
+        self._cookies = self.downloader.load_cookies() or ''
+        self._worker = threading.Thread(target=self._work, name='api-worker', daemon=True)
+
+    def start(self):
+        if self._cookies:
+            self.set_cookies(self._cookies)
+        else:
+            self.console.print("[yellow]No cookies.txt yet, POST /cookies before submitting jobs[/yellow]")
+        # Unfinished jobs of an earlier run are picked up right away, also
+        # those an interactive run set aside
+        self.master.jobs.unpark()
+        self._worker.start()
+        self._wake.set()
+
+    def set_cookies(self, cookies_string):
+        self.downloader.sessions.load(cookies_string)
+        self.downloader.save_cookies(cookies_string)
+        self._cookies = cookies_string
+        valid = self.downloader.sessions.probe(max_age=0)
+        if not valid:
+            self.console.print("[red]✗ Cookies are expired or invalid, POST /cookies with new ones[/red]")
+        return valid
+
+    def _work(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.master.run_queue(self._cookies, interrupt=self._wake)
+            except Exception as e:
+                self.console.print(f"[red]Queue worker stopped on an error: {str(e)}[/red]")
+                time.sleep(5)
+                self._wake.set()
+
+    def submit(self, request):
+        """Queue the classes a request names, returns the ids queued now"""
+        from quality_policy import QualityPolicy
+        policy = QualityPolicy.parse(request.get('quality'))
+        use_youtube = bool(request.get('use_youtube'))
+        requeue = bool(request.get('requeue'))
+        queued = []
+        for entry in request.get('classes') or []:
+            class_info = {'url': entry} if isinstance(entry, str) else dict(entry)
+            if not class_info.get('url'):
+                raise ValueError("every class needs a url")
+            class_info.setdefault('title', None)
+            queued.extend(self.master.enqueue_class(class_info, use_youtube, policy, request.get('subject'),
+                                                    requeue=requeue).values())
+
+        resolving = bool(request.get('course') or (request.get('subject') and not request.get('classes')))
+        if resolving:
+            threading.Thread(target=self._resolve, args=(request, use_youtube, policy), daemon=True).start()
+        if queued:
+            self._wake.set()
+        return {'queued': queued, 'resolving': resolving}
+
+    def _resolve(self, request, use_youtube, policy):
+        """Classes of every matching course/subject, from the catalogue or a fresh crawl"""
+        from catalogue import CatalogueBuilder, DEFAULT_CATALOGUE_FILE, load_catalogue
+        course, subject = request.get('course'), request.get('subject')
+        try:
+            try:
+                classes = load_catalogue(request.get('catalogue') or DEFAULT_CATALOGUE_FILE)['classes']
+            except FileNotFoundError:
+                builder = CatalogueBuilder(self.master)
+                classes = []
+                for course_option, subject_option in builder.list_pairs(self._cookies):
+                    if matches(course_option['text'], course) and matches(subject_option['text'], subject):
+                        classes.extend(builder.crawl_pair(course_option, subject_option))
+            selected = [c for c in classes if matches(c.get('course'), course) and matches(c.get('subject'), subject)]
+            for class_info in selected:
+                self.master.enqueue_class(class_info, use_youtube, policy, requeue=bool(request.get('requeue')))
+            self.console.print(f"[cyan]Queued {len(selected)} classes for {course or 'any course'} / {subject or 'any subject'}[/cyan]")
+            self.events.publish('resolved', {'course': course, 'subject': subject, 'classes': len(selected)})
+            if selected:
+                self._wake.set()
+        except Exception as e:
+            self.console.print(f"[red]Could not resolve {course} / {subject}: {str(e)}[/red]")
+            self.events.publish('resolved', {'course': course, 'subject': subject, 'error': str(e)})
+
+    def retry(self):
+        revived = self.master.jobs.retry_dead()
+        if revived:
+            self._wake.set()
+        return {'revived': revived}
+
+    def status(self):
+        return {
+            'queue': self.master.jobs.counts(),
+            'progress': self.downloader.progress.snapshot(),
+            'drivers': self.downloader.driver_pool.size
+        }
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    service = None
+    token = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _authorized(self):
+        origin = self.headers.get('Origin')
+        if origin and urlsplit(origin).netloc != self.headers.get('Host'):
+            # A browser sends Origin on cross-site requests, only our own pages may call in
+            self.close_connection = True
+            self._send(HTTPStatus.FORBIDDEN, {'error': f'requests from {origin} are not allowed'})
+            return False
+        if not self.token or secrets.compare_digest(self.headers.get('Authorization') or '', f"Bearer {self.token}"):
+            return True
+        self.close_connection = True
+        self._send(HTTPStatus.UNAUTHORIZED, {'error': 'missing or wrong token'})
+        return False
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        if not isinstance(body, dict):
+            raise ValueError("the request body must be a JSON object")
+        return body
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        url = urlsplit(self.path)
+        if url.path == '/status':
+            self._send(HTTPStatus.OK, self.service.status())
+        elif url.path == '/jobs':
+            state = parse_qs(url.query).get('state', [None])[0]
+            self._send(HTTPStatus.OK, {'jobs': self.service.master.jobs.jobs(state)})
+        elif url.path == '/events':
+            self._stream_events()
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {'error': f'no such endpoint: {url.path}'})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        path = urlsplit(self.path).path
+        # A plain form or text/plain POST is the kind a foreign page can send without a preflight
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            self.close_connection = True
+            self._send(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, {'error': 'send the body as application/json'})
+            return
+        try:
+            body = self._body()
+            if path == '/jobs':
+                self._send(HTTPStatus.ACCEPTED, self.service.submit(body))
+            elif path == '/jobs/retry':
+                self._send(HTTPStatus.OK, self.service.retry())
+            elif path == '/cookies':
+                if not body.get('cookies'):
+                    raise ValueError("cookies is required")
+                self._send(HTTPStatus.OK, {'valid': self.service.set_cookies(body['cookies'])})
+            else:
+                self._send(HTTPStatus.NOT_FOUND, {'error': f'no such endpoint: {path}'})
+        except ValueError as e:
+            # Bad JSON, an unknown quality policy or a class without url
+            self._send(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+
+    def _stream_events(self):
+        events = self.service.events.subscribe()
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                try:
+                    kind, data = events.get(timeout=15)
+                    message = f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+                except queue.Empty:
+                    # Keeps proxies and idle timeouts from closing the stream
+                    message = ": keep-alive\n\n"
+                self.wfile.write(message.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.service.events.unsubscribe(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the downloader over a local HTTP/JSON API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--token', help="require 'Authorization: Bearer TOKEN' on every request, random if not given")
+    parser.add_argument('--no-token', action='store_true', help="accept requests without a token")
+    args, _ = parser.parse_known_args()
+
+    console = Console()
+    token = None if args.no_token else args.token or secrets.token_urlsafe(24)
+    if not token and args.host not in ('127.0.0.1', 'localhost', '::1'):
+        console.print("[yellow]Listening beyond localhost with --no-token, anyone on the network can queue downloads[/yellow]")
+
+    from master_downloader import MasterDownloader
+    master = MasterDownloader()
+    service = DownloadService(master, console)
+    service.start()
+
+    ApiHandler.service = service
+    ApiHandler.token = token
+    server = ThreadingHTTPServer((args.host, args.port), ApiHandler)
+    server.daemon_threads = True
+    console.print(f"[bold green]Serving on http://{args.host}:{args.port}[/bold green] (Ctrl+C to stop)")
+    if token and not args.token:
+        console.print(f"[cyan]Token for this run: {token}[/cyan]")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        console.print("\n[bold yellow]👋 Server stopped[/bold yellow]")
+
+
+if __name__ == '__main__':
+    main()
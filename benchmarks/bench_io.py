@@ -0,0 +1,97 @@
+"""CPU cost per GB of the old chunked write loop versus fast_io.stream_to_file.
+
+A local socketpair stands in for the HTTP connection so that both paths pay
+real recv/write syscalls, the sender runs in its own thread and only the
+receiving thread's CPU time is counted.
+
+    python benchmarks/bench_io.py [size_mb]
+"""
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fast_io import _raw_reader, stream_to_file
+
+
+class FakeResponse:
+    """Just enough of requests.Response for both code paths"""
+
+    def __init__(self, fp):
+        self.headers = {}
+        self.raw = self
+        self._fp = fp
+
+    def readinto(self, buffer):
+        # What urllib3's HTTPResponse offers stream_to_file through response.raw
+        return self._fp.readinto(buffer)
+
+    def iter_content(self, chunk_size):
+        while True:
+            chunk = self._fp.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def old_loop(response, filename, chunk_size):
+    with open(filename, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                f.write(chunk)
+
+
+def run(label, size, consume):
+    reader, writer = socket.socketpair()
+    payload = os.urandom(1024 * 1024)
+
+    def send():
+        remaining = size
+        while remaining:
+            n = min(remaining, len(payload))
+            writer.sendall(payload[:n])
+            remaining -= n
+        writer.close()
+
+    sender = threading.Thread(target=send)
+    fd, filename = tempfile.mkstemp(prefix='bench_io_')
+    os.close(fd)
+    try:
+        sender.start()
+        fp = reader.makefile('rb')
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        consume(FakeResponse(fp), filename)
+        cpu = time.thread_time() - cpu
+        wall = time.perf_counter() - wall
+        sender.join()
+        assert os.path.getsize(filename) == size
+    finally:
+        reader.close()
+        os.remove(filename)
+
+    gb = size / (1024 ** 3)
+    print(f"{label:<36} {cpu / gb:6.2f} CPU s/GB   {size / wall / (1024 ** 2):8.1f} MB/s")
+    return cpu / gb
+
+
+def fast_path(response, filename, size):
+    # Otherwise stream_to_file quietly times its iter_content fallback
+    assert _raw_reader(response) is not None, "FakeResponse must take the readinto path"
+    stream_to_file(response, filename, expected_size=size)
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 * 1024 if len(sys.argv) > 1 else 1024 * 1024 * 1024
+    print(f"Streaming {size // (1024 * 1024)} MB per run\n")
+    run("old loop, 8 KB chunks (notes)", size, lambda r, f: old_loop(r, f, 8192))
+    run("old loop, 128 KB chunks (fallback)", size, lambda r, f: old_loop(r, f, 128 * 1024))
+    run("old loop, 1 MB chunks (video)", size, lambda r, f: old_loop(r, f, 1024 * 1024))
+    run("stream_to_file, 4 MB readinto", size, lambda r, f: fast_path(r, f, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Parse time of a large synthetic PastClasses listing, full soup versus listing.py.
+
+Every box looks like the real card markup and the page carries the usual
+navigation and script noise around the listing. BeautifulSoup and lxml rows
+are skipped when the library is not installed; every row must find all
+classes.
+
+    python benchmarks/bench_listing.py [classes]
+"""
+import importlib.util
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import listing
+
+BOX = """
+<div class="col-md-6 displayClass">
+  <div class="card uu-card">
+    <img src="/images/thumb-{i}.jpg" alt="">
+    <h4 class="uu-routine-title">Physics Class {i} - Chapter {chapter}</h4>
+    <div class="uu-latex-body-style">Topic {i}: vectors, <span>projectile</span> motion and $v = u + at$</div>
+    <div class="uu-routine-actions">
+      <a class="btn" href="/Routine/ClassDetails?id={id}&amp;type=1">Watch</a>
+      {note}
+      <a class="btn" href="/Routine/Feedback?id={id}">Feedback</a>
+    </div>
+  </div>
+</div>"""
+NOTE = '<a class="btn" href="/Routine/ClassDetails?id={id}&amp;isNotes=true">Note</a>'
+NOISE = '<nav>' + ''.join(f'<a href="/menu/{i}">Menu {i}</a>' for i in range(200)) + '</nav>'
+SCRIPT = '<script>var config = {' + ', '.join(f'"k{i}": {i}' for i in range(2000)) + '};</script>'
+
+
+def synthetic_listing(classes):
+    boxes = ''.join(
+        BOX.format(i=i, chapter=i % 12, id=100000 + i, note=NOTE.format(id=100000 + i) if i % 3 else '')
+        for i in range(classes)
+    )
+    return (f'<!DOCTYPE html><html><head><title>Past Classes</title>{SCRIPT}</head><body>{NOISE}'
+            f'<div class="container"><div class="row uu-routine-box">{boxes}</div></div>{SCRIPT}</body></html>')
+
+
+def full_soup(html, parser):
+    """What a naive port of get_class_links would do: the whole page, then select"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, parser)
+    results = []
+    for box in soup.select('.uu-routine-box .displayClass'):
+        results.append({
+            'url': box.select_one("a[href*='ClassDetails']")['href'],
+            'title': box.select_one('.uu-routine-title').get_text(strip=True),
+            'topic': box.select_one('.uu-latex-body-style').get_text(strip=True),
+            'has_notes': box.select_one("a[href*='isNotes=true']") is not None
+        })
+    return results
+
+
+def strained_soup(html):
+    """The SoupStrainer variant: only .uu-routine-box subtrees become soup"""
+    from bs4 import BeautifulSoup, SoupStrainer
+    strainer = SoupStrainer(attrs={'class': lambda value: bool(value) and 'uu-routine-box' in (
+        value.split() if isinstance(value, str) else value)})
+    soup = BeautifulSoup(html, 'html.parser', parse_only=strainer)
+    return [
+        {
+            'url': box.find('a', href=lambda href: bool(href) and 'ClassDetails' in href)['href'],
+            'title': box.find(class_='uu-routine-title').get_text(strip=True),
+            'topic': box.find(class_='uu-latex-body-style').get_text(strip=True),
+            'has_notes': box.find('a', href=lambda href: bool(href) and 'isNotes=true' in href) is not None
+        }
+        for box in soup.find_all(class_='displayClass')
+    ]
+
+
+def run(label, parse, html, classes, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = parse(html)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    assert len(found) == classes, f"{label} found {len(found)} of {classes} classes"
+    print(f"{label:<36} {best * 1000:8.1f} ms   {best * 1e6 / classes:7.1f} µs/class")
+    return best
+
+
+def main():
+    classes = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    html = synthetic_listing(classes)
+    print(f"{classes} classes, {len(html) / (1024 * 1024):.1f} MB of HTML\n")
+
+    if importlib.util.find_spec('bs4'):
+        run("BeautifulSoup html.parser, full page", lambda h: full_soup(h, 'html.parser'), html, classes)
+        if listing.LXML_AVAILABLE:
+            run("BeautifulSoup lxml, full page", lambda h: full_soup(h, 'lxml'), html, classes)
+        run("SoupStrainer .uu-routine-box", strained_soup, html, classes)
+    run("ListingParser (html.parser stream)", lambda h: list(listing._iter_stdlib([h], '')), html, classes)
+    if listing.LXML_AVAILABLE:
+        run("lxml HTMLPullParser", lambda h: list(listing._iter_lxml([h], '')), html, classes)
+        # An HTTP response arrives in chunks, the pull parser never needs the whole page
+        chunks = [html[i:i + 64 * 1024] for i in range(0, len(html), 64 * 1024)]
+        run("lxml HTMLPullParser, 64 KB chunks", lambda c: list(listing._iter_lxml(c, '')), chunks, classes)
+
+
+if __name__ == '__main__':
+    main()
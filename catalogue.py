@@ -0,0 +1,129 @@
+import concurrent.futures
+import json
+import os
+import time
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
+from lazy import lazy_import
+
+By = lazy_import('selenium.webdriver.common.by', 'By')
+WebDriverWait = lazy_import('selenium.webdriver.support.ui', 'WebDriverWait')
+Select = lazy_import('selenium.webdriver.support.ui', 'Select')
+EC = lazy_import('selenium.webdriver.support.expected_conditions')
+
+PAST_CLASSES_URL = "https://online.utkorsho.tech/Routine/PastClasses"
+DEFAULT_CATALOGUE_FILE = 'catalogue.json'
+
+
+class CatalogueBuilder:
+    """Walk every course × subject of the account and collect one catalogue of classes"""
+
+    def __init__(self, master):
+        self.master = master
+        self.console = master.console
+        self.pool = master.video_downloader.driver_pool
+
+    def open_listing(self, driver):
+        driver.get(PAST_CLASSES_URL)
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.ID, "Course"))
+        )
+
+    def select_course(self, driver, course_value):
+        Select(driver.find_element(By.ID, "Course")).select_by_value(course_value)
+        time.sleep(2)
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.ID, "Subject"))
+        )
+
+    def get_subject_options(self, driver):
+        subject_select = Select(driver.find_element(By.ID, "Subject"))
+        subjects = []
+        for option in subject_select.options:
+            subjects.append({
+                'value': option.get_attribute('value') or "-1",
+                'text': option.text
+            })
+        # The "all subjects" entry would only repeat the others
+        specific = [s for s in subjects if s['value'] != "-1"]
+        return specific or subjects
+
+    def list_pairs(self, cookies_string):
+        """Every (course, subject) pair, found with a single browser"""
+        self.master.video_downloader.get_cookies_dict(cookies_string)
+        pairs = []
+        with self.pool.driver() as driver:
+            self.open_listing(driver)
+            for course in self.master.get_course_options(driver):
+                self.select_course(driver, course['value'])
+                for subject in self.get_subject_options(driver):
+                    pairs.append((course, subject))
+        return pairs
+
+    def crawl_pair(self, course, subject):
+        with self.pool.driver() as driver:
+            self.open_listing(driver)
+            self.select_course(driver, course['value'])
+            Select(driver.find_element(By.ID, "Subject")).select_by_value(subject['value'])
+            time.sleep(2)
+            entries = []
+            for class_info in self.master.iter_class_links(driver):
+                entries.append({
+                    **class_info,
+                    'course': course['text'],
+                    'course_value': course['value'],
+                    'subject': subject['text'],
+                    'subject_value': subject['value']
+                })
+            return entries
+
+    def discover(self, cookies_string, workers=None):
+        """Build the full catalogue, crawling subjects on several pooled browsers at once"""
+        pairs = self.list_pairs(cookies_string)
+        workers = workers or self.pool.size
+        classes = []
+        seen = set()
+        failed = []
+
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TaskProgressColumn(),
+            console=self.console
+        ) as progress:
+            task = progress.add_task(f"[cyan]Crawling {len(pairs)} subjects...", total=len(pairs))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(self.crawl_pair, course, subject): (course, subject)
+                           for course, subject in pairs}
+                for future in concurrent.futures.as_completed(futures):
+                    course, subject = futures[future]
+                    try:
+                        for entry in future.result():
+                            # The same class can be listed under several courses
+                            if entry['url'] not in seen:
+                                seen.add(entry['url'])
+                                classes.append(entry)
+                    except Exception as e:
+                        failed.append(f"{course['text']} / {subject['text']}")
+                        self.console.print(f"[red]✗ {course['text']} / {subject['text']}: {str(e)}[/red]")
+                    progress.advance(task)
+
+        return {
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'pairs': [{'course': c['text'], 'course_value': c['value'],
+                       'subject': s['text'], 'subject_value': s['value']} for c, s in pairs],
+            'failed': failed,
+            'classes': classes
+        }
+
+
+def save_catalogue(catalogue, path=DEFAULT_CATALOGUE_FILE):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(catalogue, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def load_catalogue(path=DEFAULT_CATALOGUE_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,74 @@
+from lazy import lazy_import
+from network_capture import LOGGING_PREFS
+
+Options = lazy_import('selenium.webdriver.chrome.options', 'Options')
+
+# Scraping only needs the DOM and the URLs the page asks for. Blocked
+# requests still show up in the network log, so NetworkCapture sees media
+# and PDF URLs without Chrome downloading them.
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.css', '*.css?*',
+    '*.mp4', '*.mp4?*', '*.webm', '*.m3u8', '*.m3u8?*', '*.mpd', '*.mpd?*', '*.m4s', '*.ts',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*facebook.net*', '*connect.facebook.com*', '*hotjar.com*', '*clarity.ms*',
+]
+
+# Only real content settings; Chrome has none for stylesheets or fonts, those
+# are blocked by URL in apply_blocking()
+LEAN_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.managed_default_content_settings.media_stream': 2,
+    'profile.managed_default_content_settings.plugins': 2,
+    'profile.managed_default_content_settings.popups': 2,
+    'profile.managed_default_content_settings.geolocation': 2,
+    'profile.managed_default_content_settings.notifications': 2,
+}
+
+LEAN_ARGUMENTS = [
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-background-timer-throttling',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-translate',
+    '--metrics-recording-only',
+    '--no-first-run',
+    '--mute-audio',
+    '--blink-settings=imagesEnabled=false',
+]
+
+
+def build_chrome_options(config):
+    """Chrome options for every pooled driver, lean unless config says 'chrome_profile': 'full'"""
+    options = Options()
+    options.add_argument('--headless')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--log-level=3')
+    options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    # DevTools network events, read back by NetworkCapture
+    options.set_capability('goog:loggingPrefs', LOGGING_PREFS)
+
+    if config.get('chrome_profile', 'lean') == 'lean':
+        for argument in LEAN_ARGUMENTS:
+            options.add_argument(argument)
+        options.add_experimental_option('prefs', LEAN_PREFS)
+        # DOMContentLoaded is enough, the scrapers wait for their own elements
+        options.page_load_strategy = 'eager'
+    return options
+
+
+def apply_blocking(driver, config):
+    """Block non-essential resources on a new driver through CDP"""
+    if config.get('chrome_profile', 'lean') != 'lean':
+        return
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    except Exception:
+        # Not a Chromium driver, the preferences still cover images
+        pass
@@ -0,0 +1,206 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from rich.console import Console
+from integrity import hash_file
+
+
+INDEX_FILE = '.dedup.sqlite3'
+
+
+def file_signature(path):
+    """(size, mtime in ns, inode): what has to stay the same for an indexed hash to still hold"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class DedupStore:
+    """Content-hash index of the library that hardlinks identical downloads.
+
+    One row per path holds the hash of its current content, so a file that
+    is refreshed or remuxed simply moves to its new hash and never stays a
+    link source for content it no longer has. The row also keeps the file's
+    size, mtime and inode; a link source whose stat no longer matches was
+    changed behind the index and is hashed again before it is trusted.
+    """
+
+    def __init__(self, config, console=None):
+        self.config = config
+        self.console = console or Console()
+        self.index_file = os.path.join(config['download_path'], INDEX_FILE)
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        """The index connection, opened on first use; call with self._lock held"""
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_file)), exist_ok=True)
+            db = sqlite3.connect(self.index_file, timeout=30, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, hash TEXT NOT NULL, "
+                       "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (hash)")
+            self._db = db
+        return self._db
+
+    def _record(self, db, path, content_hash, signature):
+        db.execute("INSERT OR REPLACE INTO files (path, hash, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?)",
+                   (path, content_hash, *signature))
+
+    def _still_holds(self, path, content_hash, recorded):
+        """True if an indexed file still has the content its row says, re-hashing it when its stat changed"""
+        try:
+            signature = file_signature(path)
+        except OSError:
+            return False
+        if signature == recorded:
+            return True
+        if signature[0] != recorded[0]:
+            current = None
+        else:
+            # Same size but touched since: only the content can tell
+            current = hash_file(path).content.hexdigest()
+        with self._lock:
+            db = self._connect()
+            if current:
+                self._record(db, path, current, signature)
+            else:
+                db.execute("DELETE FROM files WHERE path = ?", (path,))
+        return current == content_hash
+
+    def _link(self, source, target):
+        """Replace target with a hardlink to source, returns bytes freed"""
+        try:
+            if os.path.samefile(source, target):
+                return 0
+            size = os.path.getsize(target)
+            tmp = target + '.dedup-tmp'
+            os.link(source, tmp)
+            os.replace(tmp, target)
+            return size
+        except OSError as e:
+            # Different filesystems or no hardlink support, keep both copies
+            self.console.print(f"[yellow]Could not hardlink {os.path.basename(target)}: {str(e)}[/yellow]")
+            return 0
+
+    def add(self, filename, content_hash=None):
+        """Register a finished file, hardlinking it to an identical copy if one exists"""
+        if not os.path.exists(filename):
+            return 0
+        if not content_hash:
+            content_hash = hash_file(filename).content.hexdigest()
+
+        path = os.path.abspath(filename)
+        with self._lock:
+            db = self._connect()
+            self._record(db, path, content_hash, file_signature(path))
+            candidates = db.execute(
+                "SELECT path, size, mtime_ns, inode FROM files WHERE hash = ? AND path != ?", (content_hash, path)
+            ).fetchall()
+        # Changed behind the index's back (another tool, a copy from elsewhere), not a twin any more
+        source = next((row[0] for row in candidates if self._still_holds(row[0], content_hash, tuple(row[1:]))), None)
+        if source is None:
+            return 0
+        freed = self._link(source, path)
+        if freed:
+            with self._lock:
+                # Now the source's inode
+                self._record(self._connect(), path, content_hash, file_signature(path))
+            self.console.print(
+                f"[green]♻ {os.path.basename(path)} is identical to "
+                f"{os.path.basename(source)}, hardlinked ({freed / (1024 * 1024):.1f} MB saved)[/green]"
+            )
+        return freed
+
+    def scan(self, root=None, link=False):
+        """Hash every file under root and rebuild the index, optionally hardlinking duplicates"""
+        root = root or self.config['download_path']
+        groups = {}
+        # Files already hardlinked together only need hashing once
+        seen_inodes = {}
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if name.startswith('.') or name.endswith(('.tmp', '.part', '.aria2', '.dedup-tmp')):
+                    continue
+                path = os.path.abspath(os.path.join(dirpath, name))
+                st = os.stat(path)
+                key = (st.st_dev, st.st_ino)
+                if key not in seen_inodes:
+                    seen_inodes[key] = hash_file(path).content.hexdigest()
+                groups.setdefault(seen_inodes[key], []).append(path)
+
+        freed = 0
+        if link:
+            for paths in groups.values():
+                for path in paths[1:]:
+                    freed += self._link(paths[0], path)
+
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM files")
+                db.executemany("INSERT INTO files (path, hash, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?)",
+                               [(path, content_hash, *file_signature(path)) for content_hash, paths in groups.items()
+                                for path in paths])
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return freed
+
+    def report(self):
+        """Return (duplicate groups, bytes still wasted, bytes already shared by hardlinks)"""
+        index = {}
+        with self._lock:
+            rows = self._connect().execute("SELECT path, hash FROM files").fetchall()
+        for path, content_hash in rows:
+            index.setdefault(content_hash, []).append(path)
+
+        duplicates = []
+        wasted = 0
+        shared = 0
+        for content_hash, paths in index.items():
+            paths = [p for p in paths if os.path.exists(p)]
+            if len(paths) < 2:
+                continue
+            duplicates.append(paths)
+            inodes = {}
+            for p in paths:
+                st = os.stat(p)
+                inodes.setdefault((st.st_dev, st.st_ino), st.st_size)
+            size = next(iter(inodes.values()))
+            wasted += size * (len(inodes) - 1)
+            shared += size * (len(paths) - len(inodes))
+        return duplicates, wasted, shared
+
+    def print_report(self):
+        duplicates, wasted, shared = self.report()
+        self.console.print("\n[yellow]╭─── Duplicate Report ───╮[/yellow]")
+        for paths in duplicates:
+            self.console.print(f"[cyan]│ {len(paths)} copies:[/cyan]")
+            for p in paths:
+                self.console.print(f"[cyan]│    {os.path.basename(p)}[/cyan]")
+        self.console.print(f"[cyan]│ Wasted by separate copies: {wasted / (1024 * 1024):.1f} MB[/cyan]")
+        self.console.print(f"[cyan]│ Saved by hardlinks: {shared / (1024 * 1024):.1f} MB[/cyan]")
+        self.console.print("[yellow]╰────────────────────────╯[/yellow]")
+
+
+def main():
+    config = {'download_path': 'downloads'}
+    if os.path.exists('config.json'):
+        with open('config.json', 'r') as f:
+            config.update(json.load(f))
+
+    store = DedupStore(config)
+    root = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].startswith('--') else None
+    freed = store.scan(root, link='--link' in sys.argv)
+    if freed:
+        store.console.print(f"[green]✓ Freed {freed / (1024 * 1024):.1f} MB[/green]")
+    store.print_report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import contextlib
+import threading
+from lazy import lazy_import
+
+webdriver = lazy_import('selenium.webdriver')
+
+
+class DriverPool:
+    """Reusable Chrome instances that all share the SessionManager cookie jar"""
+
+    def __init__(self, options_factory, sessions, size=3, setup=None):
+        self.options_factory = options_factory
+        self.sessions = sessions
+        # Called with every new driver, e.g. to install CDP request blocking,
+        # and may return a wrapper to hand out instead of the driver
+        self.setup = setup
+        self.size = max(1, size)
+        self._idle = []
+        self._generations = {}
+        self._created = 0
+        self._cond = threading.Condition()
+
+    def _create(self):
+        driver = webdriver.Chrome(options=self.options_factory())
+        self.sessions.apply_to_driver(driver)
+        if self.setup is not None:
+            driver = self.setup(driver) or driver
+        self._generations[id(driver)] = self.sessions.generation
+        return driver
+
+    def acquire(self):
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                self._cond.wait()
+            if self._idle:
+                driver = self._idle.pop()
+            else:
+                self._created += 1
+                driver = None
+
+        if driver is None:
+            try:
+                return self._create()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+
+        # A browser that crashed while idle is replaced instead of handed out
+        try:
+            driver.current_url
+        except Exception:
+            self.release(driver, broken=True)
+            return self.acquire()
+
+        # The jar changed since this browser last saw it
+        if self._generations.get(id(driver)) != self.sessions.generation:
+            self.sessions.apply_to_driver(driver)
+            self._generations[id(driver)] = self.sessions.generation
+        return driver
+
+    def release(self, driver, broken=False):
+        if driver is None:
+            return
+        if not broken:
+            try:
+                self.sessions.absorb_driver(driver)
+                self._generations[id(driver)] = self.sessions.generation
+            except Exception:
+                broken = True
+
+        with self._cond:
+            if broken:
+                self._created -= 1
+                self._generations.pop(id(driver), None)
+            else:
+                self._idle.append(driver)
+            self._cond.notify()
+
+        if broken:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    @contextlib.contextmanager
+    def driver(self):
+        driver = self.acquire()
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for driver in idle:
+            try:
+                driver.quit()
+            except Exception:
+                pass
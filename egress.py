@@ -0,0 +1,262 @@
+"""Spread transfers over several egress routes, fastest healthy route first.
+
+The video CDN throttles a single IP after a few parallel transfers. With
+'egress' in config.json every request of the shared session, every aria2
+download and every yt-dlp video goes out through one of several routes:
+
+    "egress": ["direct", "http://10.0.0.2:3128", "socks5://127.0.0.1:1080", "192.168.1.20"]
+
+A route is "direct", a proxy URL, a local source address to bind to, or
+{"proxy": ..., "source_address": ...} for both. aria2 only speaks plain
+http:// proxies, so aria2 downloads only lease such routes and the others
+(SOCKS, https://) are left to the native engine and yt-dlp. Each route is scored on
+the throughput of its finished transfers (EWMA) and its recent error rate,
+divided by the transfers it is already carrying. A route that fails
+several times in a row cools down for a while and is only used again once
+every other route is cooling down too.
+"""
+import contextlib
+import threading
+import time
+import weakref
+from rich.console import Console
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes that mean the route, not the request, is the problem
+THROTTLED = (403, 407, 429, 502, 503, 504)
+
+
+class NoRoute(RuntimeError):
+    pass
+
+
+class Endpoint:
+    """One route out: a proxy, a source address, both or neither"""
+
+    def __init__(self, proxy=None, source_address=None, name=None):
+        self.proxy = proxy
+        self.source_address = source_address
+        self.name = name or proxy or source_address or 'direct'
+        self.throughput = None
+        self.error_rate = 0.0
+        self.active = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    @classmethod
+    def parse(cls, spec):
+        if isinstance(spec, dict):
+            return cls(spec.get('proxy'), spec.get('source_address'), spec.get('name'))
+        if spec in (None, '', 'direct'):
+            return cls()
+        if '://' in spec:
+            return cls(proxy=spec)
+        return cls(source_address=spec)
+
+    def __repr__(self):
+        return f"Endpoint({self.name})"
+
+    @property
+    def proxies(self):
+        return {'http': self.proxy, 'https': self.proxy} if self.proxy else {}
+
+    @property
+    def aria2_capable(self):
+        # aria2's all-proxy takes http:// proxies only, not SOCKS or https://
+        return not self.proxy or self.proxy.lower().startswith('http://')
+
+    def aria2_options(self):
+        """aria2c options for this route, None if aria2 cannot use it"""
+        options = {}
+        if not self.aria2_capable:
+            return None
+        if self.proxy:
+            options['all-proxy'] = self.proxy
+        if self.source_address:
+            # aria2 takes an address as well as an interface name here
+            options['interface'] = self.source_address
+        return options
+
+    def ytdlp_options(self):
+        options = {}
+        if self.proxy:
+            options['proxy'] = self.proxy
+        if self.source_address:
+            options['source_address'] = self.source_address
+        return options
+
+
+class EgressPool:
+    """Scores the configured routes and hands out the best one, thread safe.
+
+    Disabled (pick() returns None) when 'egress' is empty, so callers can
+    pass its options through unconditionally.
+    """
+
+    def __init__(self, config, console=None):
+        self.console = console or Console()
+        self.endpoints = [Endpoint.parse(spec) for spec in config.get('egress') or []]
+        self.cooldown = config.get('egress_cooldown', 60)
+        self.max_failures = config.get('egress_max_failures', 3)
+        self.alpha = 0.3
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.endpoints)
+
+    def score(self, endpoint, best_known):
+        # An unmeasured route is assumed as good as the best one, so each gets tried
+        throughput = endpoint.throughput if endpoint.throughput is not None else best_known
+        return throughput * (1 - endpoint.error_rate) / (endpoint.active + 1)
+
+    def pick(self, accept=None):
+        """The healthy route with the best score, counted as busy until release().
+
+        accept(endpoint) narrows the choice to routes the caller can use;
+        None when the pool is disabled or accepts none of them.
+        """
+        endpoints = [e for e in self.endpoints if accept is None or accept(e)]
+        if not endpoints:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            healthy = [e for e in endpoints if e.cooldown_until <= now]
+            if not healthy:
+                # Everything is cooling down, the one back soonest beats none at all
+                healthy = [min(endpoints, key=lambda e: e.cooldown_until)]
+            best_known = max((e.throughput for e in self.endpoints if e.throughput), default=1.0)
+            # On a tie the unmeasured route goes first
+            endpoint = max(healthy, key=lambda e: (self.score(e, best_known), e.throughput is None))
+            endpoint.active += 1
+            return endpoint
+
+    def release(self, endpoint):
+        with self._lock:
+            endpoint.active = max(0, endpoint.active - 1)
+
+    def succeeded(self, endpoint, nbytes=0, seconds=0):
+        """A transfer went through; nbytes over seconds feeds the throughput score"""
+        with self._lock:
+            endpoint.error_rate *= 1 - self.alpha
+            endpoint.failures = 0
+            # Tiny bodies measure latency, not bandwidth
+            if nbytes >= 256 * 1024 and seconds > 0:
+                rate = nbytes / seconds
+                endpoint.throughput = rate if endpoint.throughput is None else \
+                    self.alpha * rate + (1 - self.alpha) * endpoint.throughput
+
+    def failed(self, endpoint):
+        with self._lock:
+            endpoint.error_rate = self.alpha + (1 - self.alpha) * endpoint.error_rate
+            endpoint.failures += 1
+            if endpoint.failures < self.max_failures or len(self.endpoints) == 1:
+                return
+            # Longer each time it trips again, at most eight cooldowns
+            trips = min(endpoint.failures - self.max_failures, 3)
+            endpoint.cooldown_until = time.monotonic() + self.cooldown * 2 ** trips
+            if trips:
+                return
+        self.console.print(f"[yellow]Route {endpoint.name} keeps failing, resting it for a while[/yellow]")
+
+    @contextlib.contextmanager
+    def lease(self, accept=None):
+        """Route for a whole transfer run outside the session (aria2, yt-dlp).
+
+        Yields None when the pool is disabled. An exception counts as a failure
+        of the route; the caller reports the bytes it moved with succeeded().
+        Raises NoRoute, without blaming any route, when accept rules out all.
+        """
+        endpoint = self.pick(accept)
+        if endpoint is None and self.enabled:
+            raise NoRoute("no configured route can carry this transfer")
+        try:
+            yield endpoint
+        except Exception:
+            if endpoint is not None:
+                self.failed(endpoint)
+            raise
+        finally:
+            if endpoint is not None:
+                self.release(endpoint)
+
+    def observe(self, response, nbytes, seconds):
+        """Report a streamed session response's body, releases its route"""
+        lease = getattr(response, 'egress', None)
+        if lease is None:
+            return
+        endpoint, release = lease
+        self.succeeded(endpoint, nbytes, seconds)
+        release()
+
+    def broken(self, response):
+        """A streamed session response's body broke off, counts against its route"""
+        lease = getattr(response, 'egress', None)
+        if lease is None or not response.ok:
+            # Error statuses were already judged when the headers came in
+            return
+        endpoint, release = lease
+        self.failed(endpoint)
+        release()
+
+
+class SourceAddressAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections, direct or to a proxy, leave from one local address"""
+
+    def __init__(self, source_address=None, **kwargs):
+        self.source_address = source_address
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.source_address:
+            kwargs['source_address'] = (self.source_address, 0)
+        super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        if self.source_address:
+            proxy_kwargs['source_address'] = (self.source_address, 0)
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
+
+
+class EgressAdapter(HTTPAdapter):
+    """Mounted on the shared session: sends each request over the best route.
+
+    Connection errors and throttling status codes count against the route.
+    A streamed response keeps its route busy until EgressPool.observe() or
+    until the response is garbage collected.
+    """
+
+    def __init__(self, pool, pool_size=10, **kwargs):
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size, **kwargs)
+        self.egress = pool
+        # One connection pool per route, a source address is fixed per socket
+        self.routes = {endpoint: SourceAddressAdapter(endpoint.source_address, pool_connections=pool_size,
+                                                      pool_maxsize=pool_size)
+                       for endpoint in pool.endpoints}
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        endpoint = self.egress.pick()
+        adapter = self.routes[endpoint]
+        try:
+            response = adapter.send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                                    proxies=endpoint.proxies or proxies)
+        except (requests.ConnectionError, requests.Timeout):
+            self.egress.failed(endpoint)
+            self.egress.release(endpoint)
+            raise
+        if response.status_code in THROTTLED:
+            self.egress.failed(endpoint)
+        elif not stream:
+            self.egress.succeeded(endpoint)
+        if not stream:
+            # The body is read right after this, a short request scores on errors only
+            self.egress.release(endpoint)
+            return response
+        response.egress = (endpoint, weakref.finalize(response, self.egress.release, endpoint))
+        return response
+
+    def close(self):
+        for adapter in self.routes.values():
+            adapter.close()
+        super().close()
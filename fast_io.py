@@ -0,0 +1,92 @@
+import os
+
+
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024  # 4MB, a multiple of every common block size
+
+
+def preallocate(fd, size):
+    """Reserve size bytes on disk up front, silently skipped where unsupported"""
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, size)
+        return True
+    except OSError:
+        # tmpfs, some network filesystems and FAT do not support it
+        return False
+
+
+def _raw_reader(response):
+    """Best readinto() source for a streamed requests response, or None if it must be decoded"""
+    if response.headers.get('content-encoding', 'identity').lower() not in ('identity', ''):
+        return None
+    raw = response.raw
+    # urllib3's own reader, so its retries, timeouts and length checks stay in force
+    if hasattr(raw, 'readinto'):
+        return raw
+    return None
+
+
+def write_all(fd, view):
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def stream_to_file(response, filename, on_chunk=None, buffer_size=DEFAULT_BUFFER_SIZE,
+                   expected_size=0, offset=0, truncate=True):
+    """Stream a requests response to disk through one reusable buffer.
+
+    The buffer is filled completely before each write, so the disk sees large
+    aligned writes and no bytes object is allocated per chunk. on_chunk gets a
+    memoryview that is only valid until the next call. Returns bytes written.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+    if truncate and not offset:
+        flags |= os.O_TRUNC
+    fd = os.open(filename, flags, 0o644)
+    written = 0
+    try:
+        if expected_size and not offset:
+            preallocate(fd, expected_size)
+        if offset:
+            os.lseek(fd, offset, os.SEEK_SET)
+
+        reader = _raw_reader(response)
+        if reader is None:
+            # Compressed body, let requests decode it and just write the chunks
+            for chunk in response.iter_content(chunk_size=buffer_size):
+                if chunk:
+                    write_all(fd, memoryview(chunk))
+                    written += len(chunk)
+                    if on_chunk:
+                        on_chunk(chunk)
+        else:
+            buf = bytearray(buffer_size)
+            view = memoryview(buf)
+            eof = False
+            while not eof:
+                filled = 0
+                while filled < buffer_size:
+                    n = reader.readinto(view[filled:])
+                    if not n:
+                        eof = True
+                        break
+                    filled += n
+                if filled:
+                    write_all(fd, view[:filled])
+                    written += filled
+                    if on_chunk:
+                        on_chunk(view[:filled])
+
+        # urllib3 1.x does not enforce Content-Length, a cut connection just looks like EOF
+        length = response.headers.get('content-length')
+        if reader is not None and length and length.isdigit() and written != int(length):
+            raise ConnectionError(f"connection closed after {written} of {length} bytes")
+    finally:
+        # Drop any preallocated tail the server did not send, also when the
+        # connection broke, so a resume starts from the bytes really received
+        if expected_size and not offset and written < expected_size:
+            os.ftruncate(fd, written)
+        os.close(fd)
+    return written
@@ -0,0 +1,354 @@
+"""Record a real run into a fixture archive and replay it without network.
+
+    python master_downloader.py --record [fixtures.zip]
+    python master_downloader.py --replay [fixtures.zip]
+
+The archive is a zip of deduplicated bodies plus JSON indexes. Two layers
+are captured:
+
+- HTTP: every request through the shared requests session (notes, direct
+  videos, HLS/DASH segments, cookie probes) via FixtureAdapter. Bodies
+  larger than fixtures_max_body keep only their head and are padded with
+  zeros on replay, enough for timing the engines but not for playback.
+- Browser: the DOM of every page a pooled Chrome visited, taken just before
+  it navigates away, together with the DevTools network events that
+  NetworkCapture reads. Replay loads the snapshot from a local file with
+  all http(s) requests blocked, so selectors run against the recorded page.
+
+Pages are keyed by URL, so a replay follows the choices of the recording
+(same course, subject and classes). aria2 and yt-dlp open their own
+connections and are not part of either layer; aria2 is skipped in both
+modes and YouTube downloads cannot be replayed.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from rich.console import Console
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+
+DEFAULT_ARCHIVE = 'fixtures.zip'
+SCRIPT_TAG = re.compile(r'<script\b.*?</script\s*>', re.IGNORECASE | re.DOTALL)
+HEAD_TAG = re.compile(r'<head\b[^>]*>', re.IGNORECASE)
+# Only the events NetworkCapture looks at, the rest of the log is noise
+RECORDED_EVENTS = ('"Network.requestWillBeSent"', '"Network.requestWillBeSentExtraInfo"', '"Network.responseReceived"')
+READ_SIZE = 1024 * 1024
+
+
+def fixture_mode(argv):
+    """('record' | 'replay', archive path) from the command line, or (None, None)"""
+    for flag in ('--record', '--replay'):
+        if flag in argv:
+            args = argv[argv.index(flag) + 1:]
+            path = args[0] if args and not args[0].startswith('--') else DEFAULT_ARCHIVE
+            return flag[2:], path
+    return None, None
+
+
+def response_key(method, url, byte_range=None):
+    return f"{method.upper()} {url}" + (f" {byte_range}" if byte_range else '')
+
+
+class PaddedBody(io.RawIOBase):
+    """A stored body head followed by zeros up to the original size"""
+
+    def __init__(self, head, size):
+        self.head = head
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        n = min(len(view), self.size - self.position)
+        if n <= 0:
+            return 0
+        stored = max(0, min(n, len(self.head) - self.position))
+        if stored:
+            view[:stored] = self.head[self.position:self.position + stored]
+        view[stored:n] = bytes(n - stored)
+        self.position += n
+        return n
+
+
+class FixtureArchive:
+    """Responses and page snapshots in one zip, safe to use from many threads"""
+
+    def __init__(self, path, mode, max_body=16 * 1024 * 1024, console=None):
+        self.path = path
+        self.mode = mode
+        self.max_body = max_body
+        self.console = console or Console()
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._pages = {}
+        self._members = set()
+        self._page_dir = None
+        self._closed = False
+        if mode == 'replay' and not os.path.exists(path):
+            raise FileNotFoundError(f"No fixture archive at {path}, record one with --record first")
+        self._zip = zipfile.ZipFile(path, 'a' if mode == 'record' else 'r', zipfile.ZIP_DEFLATED)
+        self._load_indexes()
+
+    def _load_indexes(self):
+        # Every recording run adds its own index, later runs win
+        names = sorted(name for name in self._zip.namelist() if name.startswith('index-'))
+        self._members = set(self._zip.namelist())
+        for name in names:
+            index = json.loads(self._zip.read(name))
+            self._responses.update(index.get('responses', {}))
+            self._pages.update(index.get('pages', {}))
+
+    def _store(self, data=None, fileobj=None):
+        """Write a body once per content hash, returns its member name"""
+        if fileobj is not None:
+            digest = hashlib.sha1()
+            fileobj.seek(0)
+            for chunk in iter(lambda: fileobj.read(READ_SIZE), b''):
+                digest.update(chunk)
+        else:
+            digest = hashlib.sha1(data)
+        name = f"bodies/{digest.hexdigest()}"
+        with self._lock:
+            if name in self._members:
+                return name
+            self._members.add(name)
+            if fileobj is None:
+                self._zip.writestr(name, data)
+            else:
+                fileobj.seek(0)
+                with self._zip.open(name, 'w', force_zip64=True) as out:
+                    for chunk in iter(lambda: fileobj.read(READ_SIZE), b''):
+                        out.write(chunk)
+        return name
+
+    def _read(self, name):
+        with self._lock:
+            return self._zip.read(name)
+
+    # HTTP layer
+
+    def record_response(self, request, response):
+        """Keep a copy of a live response and hand back an equivalent one to the caller"""
+        raw = response.raw
+        spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        size = 0
+        while True:
+            # Stored as sent, a replayed gzip body is decoded by requests like the real one
+            chunk = raw.read(READ_SIZE, decode_content=False)
+            if not chunk:
+                break
+            spool.write(chunk)
+            size += len(chunk)
+        raw.release_conn()
+
+        if size > self.max_body:
+            spool.seek(0)
+            body = self._store(spool.read(self.max_body))
+        else:
+            body = self._store(fileobj=spool) if size else None
+        entry = {
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': list(raw.headers.items()),
+            'body': body,
+            'size': size
+        }
+        key = response_key(request.method, request.url, request.headers.get('Range'))
+        with self._lock:
+            self._responses[key] = entry
+
+        spool.seek(0)
+        response.raw = HTTPResponse(
+            body=spool, headers=raw.headers, status=raw.status, reason=raw.reason,
+            preload_content=False, decode_content=True,
+            request_method=request.method, request_url=request.url
+        )
+        return response
+
+    def _lookup(self, method, url, byte_range):
+        entry = self._responses.get(response_key(method, url, byte_range))
+        if entry is not None:
+            return entry, None
+        if byte_range or method == 'HEAD':
+            # Served from the full GET: a slice for ranges, just the headers for HEAD
+            full = self._responses.get(response_key('GET', url))
+            if full is not None:
+                return full, byte_range
+        return None, None
+
+    def replay_response(self, adapter, request):
+        byte_range = request.headers.get('Range')
+        entry, slice_range = self._lookup(request.method, request.url, byte_range)
+        if entry is None:
+            raise requests.ConnectionError(f"Replay: no recorded response for {request.method} {request.url}", request=request)
+
+        headers = HTTPHeaderDict(entry['headers'])
+        status, reason = entry['status'], entry['reason']
+        head = self._read(entry['body']) if entry['body'] else b''
+        body = PaddedBody(head, entry['size'])
+        if request.method == 'HEAD':
+            body = io.BytesIO(b'')
+        elif slice_range:
+            match = re.match(r'bytes=(\d+)-(\d*)', slice_range)
+            start = int(match.group(1)) if match else 0
+            end = min(int(match.group(2)) if match and match.group(2) else entry['size'] - 1, entry['size'] - 1)
+            body.position = start
+            body.size = end + 1
+            status, reason = 206, 'Partial Content'
+            headers['Content-Range'] = f"bytes {start}-{end}/{entry['size']}"
+            headers['Content-Length'] = str(end - start + 1)
+
+        raw = HTTPResponse(
+            body=io.BufferedReader(body) if isinstance(body, PaddedBody) else body,
+            headers=headers, status=status, reason=reason,
+            preload_content=False, decode_content=True,
+            request_method=request.method, request_url=request.url
+        )
+        return adapter.build_response(request, raw)
+
+    # Browser layer
+
+    def record_page(self, url, html, log):
+        html = SCRIPT_TAG.sub('', html)
+        entry = {'html': self._store(html.encode('utf-8')), 'log': self._store(json.dumps(log).encode('utf-8'))}
+        with self._lock:
+            self._pages[url] = entry
+
+    def page(self, url):
+        """(local file URL of the snapshot, recorded log entries) or None"""
+        entry = self._pages.get(url)
+        if entry is None:
+            return None
+        html = self._read(entry['html']).decode('utf-8')
+        # Relative links resolve against the original page, as the scrapers expect
+        base = f'<base href="{url}">'
+        html, found = HEAD_TAG.subn(lambda m: m.group(0) + base, html, count=1)
+        if not found:
+            html = base + html
+        with self._lock:
+            if self._page_dir is None:
+                self._page_dir = tempfile.mkdtemp(prefix='udvash-replay-')
+        path = os.path.join(self._page_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        return Path(path).as_uri(), json.loads(self._read(entry['log']))
+
+    def wrap_driver(self, driver):
+        if self.mode == 'replay':
+            try:
+                # Nothing the snapshot refers to may reach the live site
+                driver.execute_cdp_cmd('Network.enable', {})
+                driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': ['http://*', 'https://*']})
+            except Exception:
+                pass
+            return ReplayDriver(driver, self)
+        return RecordingDriver(driver, self)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self.mode == 'record':
+                index = {'responses': self._responses, 'pages': self._pages}
+                self._zip.writestr(f"index-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json", json.dumps(index))
+            self._zip.close()
+        if self.mode == 'record':
+            self.console.print(f"[cyan]Recorded {len(self._responses)} responses and {len(self._pages)} pages to {self.path}[/cyan]")
+
+
+class FixtureAdapter(HTTPAdapter):
+    """Transport adapter that records every response or serves recorded ones"""
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(self, request, stream=False, **kwargs):
+        if self.archive.mode == 'replay':
+            return self.archive.replay_response(self, request)
+        response = super().send(request, stream=True, **kwargs)
+        return self.archive.record_response(request, response)
+
+
+class RecordingDriver:
+    """Passes everything to Chrome, snapshotting each page before it is left"""
+
+    def __init__(self, driver, archive):
+        self._driver = driver
+        self._archive = archive
+        self._url = None
+        self._log = []
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    def snapshot(self):
+        if self._url is None:
+            return
+        try:
+            self.get_log('performance')
+            self._archive.record_page(self._url, self._driver.page_source, self._log)
+        except Exception as e:
+            self._archive.console.print(f"[yellow]Could not record {self._url}: {str(e)}[/yellow]")
+
+    def get(self, url):
+        self.snapshot()
+        self._url, self._log = url, []
+        return self._driver.get(url)
+
+    def get_log(self, log_type):
+        entries = self._driver.get_log(log_type)
+        if log_type == 'performance' and self._url is not None:
+            self._log.extend(entry for entry in entries
+                             if any(event in entry.get('message', '') for event in RECORDED_EVENTS))
+        return entries
+
+    def quit(self):
+        self.snapshot()
+        self._url = None
+        return self._driver.quit()
+
+
+class ReplayDriver:
+    """Chrome showing recorded snapshots, with the recorded network log"""
+
+    def __init__(self, driver, archive):
+        self._driver = driver
+        self._archive = archive
+        self._url = None
+        self._log = []
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    @property
+    def current_url(self):
+        # The live URL is a temp file, callers resolve links against the page they asked for
+        return self._url if self._url is not None else self._driver.current_url
+
+    def get(self, url):
+        page = self._archive.page(url)
+        if page is None:
+            raise RuntimeError(f"Replay: no recorded page for {url}")
+        file_url, self._log = page
+        self._url = url
+        return self._driver.get(file_url)
+
+    def get_log(self, log_type):
+        if log_type != 'performance':
+            return self._driver.get_log(log_type)
+        entries, self._log = self._log, []
+        return entries
@@ -0,0 +1,365 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+from rich.console import Console
+
+
+BLOCK_SIZE = 4 * 1024 * 1024  # 4MB reads when hashing from disk
+INDEX_FILE = '.integrity.sqlite3'
+# Digest header names (RFC 3230 / 9530) to hashlib names
+DIGEST_ALGORITHMS = {'sha-512': 'sha512', 'sha-256': 'sha256', 'sha': 'sha1', 'md5': 'md5'}
+
+
+class BlockHasher:
+    """Whole-file content hash and size, fed while writing"""
+
+    def __init__(self):
+        self.content = hashlib.blake2b(digest_size=20)
+        self.size = 0
+
+    def update(self, data):
+        self.content.update(data)
+        self.size += len(data)
+
+    def digest(self):
+        return {
+            'size': self.size,
+            'content_hash': self.content.hexdigest()
+        }
+
+
+def hash_file(filename, block_size=BLOCK_SIZE):
+    hasher = BlockHasher()
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            hasher.update(data)
+    return hasher
+
+
+def server_checksum(headers):
+    """'algorithm:hexdigest' from Repr-Digest, Digest, x-goog-hash or Content-MD5, None without one"""
+    offers = []
+    for header in ('repr-digest', 'digest', 'x-goog-hash'):
+        for part in (headers.get(header) or '').split(','):
+            name, _, value = part.strip().partition('=')
+            offers.append((name.strip().lower(), value.strip().strip(':')))
+    if headers.get('content-md5'):
+        offers.append(('md5', headers['content-md5'].strip()))
+    for name, value in offers:
+        algorithm = DIGEST_ALGORITHMS.get(name)
+        if algorithm and value:
+            try:
+                return f"{algorithm}:{base64.b64decode(value, validate=True).hex()}"
+            except ValueError:
+                continue
+    return None
+
+
+def file_checksum(filename, algorithm, block_size=BLOCK_SIZE):
+    digest = hashlib.new(algorithm)
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def remote_validators(headers):
+    """What identifies the server's version of a file: ETag, Last-Modified, Content-Length and checksum"""
+    remote = {}
+    for key, header in (('etag', 'etag'), ('last_modified', 'last-modified'), ('content_length', 'content-length')):
+        if headers.get(header):
+            remote[key] = headers[header]
+    checksum = server_checksum(headers)
+    if checksum:
+        remote['checksum'] = checksum
+    return remote
+
+
+def conditional_headers(remote):
+    """If-None-Match / If-Modified-Since for a stored remote_validators() dict"""
+    headers = {}
+    if remote.get('etag'):
+        headers['If-None-Match'] = remote['etag']
+    if remote.get('last_modified'):
+        headers['If-Modified-Since'] = remote['last_modified']
+    return headers
+
+
+def looks_like_html(head):
+    head = head.lstrip()[:512].lower()
+    return head.startswith(b'<!doctype html') or head.startswith(b'<html') or b'<head' in head
+
+
+def check_mp4_boxes(filename):
+    """Walk the top-level MP4 boxes, returns (ok, bad_offset)"""
+    size = os.path.getsize(filename)
+    found = set()
+    offset = 0
+    with open(filename, 'rb') as f:
+        while offset < size:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                return False, offset
+            box_size, box_type = struct.unpack('>I4s', header)
+            if box_size == 1:
+                large = f.read(8)
+                if len(large) < 8:
+                    return False, offset
+                box_size = struct.unpack('>Q', large)[0]
+            elif box_size == 0:
+                box_size = size - offset
+            if box_size < 8:
+                return False, offset
+            if offset + box_size > size:
+                # Box runs past the end of the file, everything from here is missing
+                found.add(box_type)
+                return False, offset
+            found.add(box_type)
+            offset += box_size
+
+    if b'ftyp' not in found or b'moov' not in found:
+        return False, 0
+    return True, None
+
+
+def check_pdf_markers(filename):
+    """Returns (ok, bad_offset), a missing %%EOF means the tail was cut off"""
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        if not f.read(1024).lstrip().startswith(b'%PDF'):
+            return False, 0
+        f.seek(max(0, size - 2048))
+        if b'%%EOF' not in f.read():
+            return False, max(0, size - 2048)
+    return True, None
+
+
+class IntegrityChecker:
+    """Verify finished downloads and repair only the broken byte ranges.
+
+    What each file should look like is kept in a SQLite index in the
+    download folder, one row per file, so recording a download does not
+    rewrite the whole library's entries and processes sharing the folder
+    (shard_runner.py) do not lose each other's updates.
+    """
+
+    def __init__(self, config, console=None, sessions=None):
+        self.config = config
+        self.console = console or Console()
+        self.sessions = sessions
+        self.index_file = os.path.join(config['download_path'], INDEX_FILE)
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        """The index connection, opened on first use; call with self._lock held"""
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_file)), exist_ok=True)
+            db = sqlite3.connect(self.index_file, timeout=30, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+            self._db = db
+        return self._db
+
+    def _put(self, filename, entry):
+        with self._lock:
+            self._connect().execute("INSERT OR REPLACE INTO files (path, entry) VALUES (?, ?)",
+                                    (os.path.abspath(filename), json.dumps(entry)))
+
+    def record(self, filename, url=None, expected_size=0, hasher=None, digest=None, remote=None):
+        """Remember what a finished download should look like, from a hasher or a ready digest.
+
+        remote holds the server's validators (see remote_validators) for later
+        conditional re-syncs. Its checksum applies to the bytes as downloaded,
+        a file recorded again after post-processing is passed the stored
+        'remote', which no longer has it.
+        """
+        entry = {'url': url, 'expected_size': expected_size or 0}
+        if hasher is not None:
+            digest = hasher.digest()
+        if digest is not None:
+            entry['size'] = digest['size']
+            entry['content_hash'] = digest['content_hash']
+        if remote:
+            remote = dict(remote)
+            checksum = remote.pop('checksum', None)
+            if checksum:
+                entry['checksum'] = checksum
+            entry['remote'] = remote
+        self._put(filename, entry)
+
+    def remember_remote(self, filename, remote):
+        """Attach server validators to an existing entry"""
+        entry = self.entry(filename)
+        if entry and remote:
+            entry['remote'] = {k: v for k, v in remote.items() if k != 'checksum'}
+            self._put(filename, entry)
+
+    def mark_pending(self, filename, url=None, expected_size=0):
+        """Flag a file as being written, until record() replaces the entry"""
+        self._put(filename, {'url': url, 'expected_size': expected_size or 0, 'pending': True})
+
+    def entry(self, filename):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT entry FROM files WHERE path = ?", (os.path.abspath(filename),)
+            ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def verify(self, filename, expected_size=None):
+        """Return a list of (start, end) byte ranges that need re-fetching, end=None means EOF.
+
+        A file is judged by its size against Content-Length (or the bytes
+        counted while it was written), by the server's checksum when it sent
+        one, and by the MP4 box / PDF marker structure.
+        """
+        if not os.path.exists(filename):
+            return [(0, None)]
+
+        entry = self.entry(filename)
+        expected_size = expected_size or entry.get('expected_size') or entry.get('size') or 0
+        size = os.path.getsize(filename)
+
+        if size == 0:
+            return [(0, None)]
+
+        with open(filename, 'rb') as f:
+            if looks_like_html(f.read(1024)):
+                # Error page saved instead of the file, nothing worth keeping
+                return [(0, None)]
+
+        if expected_size and size > expected_size:
+            return [(0, None)]
+        if expected_size and size < expected_size:
+            return [(size, expected_size - 1)]
+
+        # The server's own hash can't point at a range, a mismatch means all of it
+        if entry.get('checksum'):
+            algorithm, _, value = entry['checksum'].partition(':')
+            if file_checksum(filename, algorithm) != value:
+                return [(0, None)]
+
+        # Structure checks only make sense once the size is right
+        lower = filename.lower()
+        if lower.endswith('.mp4'):
+            ok, offset = check_mp4_boxes(filename)
+        elif lower.endswith('.pdf'):
+            ok, offset = check_pdf_markers(filename)
+        else:
+            ok, offset = True, None
+        return [] if ok else [(offset, None)]
+
+    def _http(self):
+        if self.sessions is not None:
+            return self.sessions.session
+        import requests
+        return requests
+
+    def repair(self, filename, url, bad_ranges, cookies=None, headers=None):
+        """Re-download only the given ranges in place, falls back to a full fetch"""
+        http = self._http()
+        headers = dict(headers or self.config['headers'])
+        if any(start == 0 and end is None for start, end in bad_ranges):
+            return self._refetch(filename, url, cookies, headers)
+
+        for start, end in bad_ranges:
+            range_headers = {**headers, 'Range': f"bytes={start}-{'' if end is None else end}"}
+            with http.get(url, headers=range_headers, cookies=cookies, stream=True) as r:
+                if r.status_code != 206:
+                    # Server ignores ranges, only a full download can fix it
+                    return self._refetch(filename, url, cookies, headers)
+                mode = 'r+b' if os.path.exists(filename) else 'wb'
+                with open(filename, mode) as f:
+                    f.seek(start)
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        if chunk:
+                            f.write(chunk)
+                    if end is None:
+                        f.truncate()
+        return True
+
+    def _refetch(self, filename, url, cookies, headers):
+        hasher = BlockHasher()
+        with self._http().get(url, headers=headers, cookies=cookies, stream=True) as r:
+            r.raise_for_status()
+            with open(filename, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
+                    if chunk:
+                        f.write(chunk)
+                        hasher.update(chunk)
+        self.record(filename, url, int(r.headers.get('content-length', 0)), hasher, remote=remote_validators(r.headers))
+        return True
+
+    def remote_changed(self, filename, url, cookies=None, headers=None):
+        """Whether url now serves a different version than the one saved at filename.
+
+        Sends a HEAD with the stored ETag / Last-Modified, 304 means unchanged.
+        Servers that ignore the condition are judged by the validators they
+        send back. Files recorded before validators were kept are compared by
+        size once and get the server's validators for next time.
+        """
+        entry = self.entry(filename)
+        remote = entry.get('remote') or {}
+        request_headers = {**(headers or self.config['headers']), **conditional_headers(remote)}
+        http = self._http()
+        r = http.head(url, headers=request_headers, cookies=cookies, allow_redirects=True)
+        if r.status_code >= 400:
+            # Some CDNs refuse HEAD, a conditional GET that is closed unread asks the same
+            r = http.get(url, headers=request_headers, cookies=cookies, stream=True)
+            r.close()
+        if r.status_code == 304:
+            return False
+        r.raise_for_status()
+        current = remote_validators(r.headers)
+        if not remote:
+            size = entry.get('expected_size') or os.path.getsize(filename)
+            changed = 'content_length' in current and int(current['content_length']) != size
+            if not changed:
+                self.remember_remote(filename, current)
+            return changed
+        for key in ('etag', 'last_modified', 'content_length'):
+            if key in remote and key in current:
+                return remote[key] != current[key]
+        return False
+
+    def verify_and_repair(self, filename, url=None, cookies=None, headers=None, expected_size=None):
+        """Verify a file and repair it up to max_retries times, returns True when it is good"""
+        name = os.path.basename(filename)
+        expected_size = expected_size or self.entry(filename).get('expected_size') or 0
+        for attempt in range(self.config.get('max_retries', 3) + 1):
+            bad = self.verify(filename, expected_size)
+            if not bad:
+                if attempt:
+                    self.console.print(f"[green]✓ Repaired {name}[/green]")
+                    # The hash from before the repair no longer applies
+                    entry = self.entry(filename)
+                    remote = dict(entry.get('remote') or {})
+                    if entry.get('checksum'):
+                        remote['checksum'] = entry['checksum']
+                    self.record(filename, url, expected_size, hash_file(filename), remote=remote)
+                return True
+
+            if not url or attempt == self.config.get('max_retries', 3):
+                break
+
+            described = ', '.join(f"{s}-{'EOF' if e is None else e}" for s, e in bad)
+            self.console.print(f"[yellow]Integrity check failed for {name} (bytes {described}), re-downloading...[/yellow]")
+            try:
+                self.repair(filename, url, bad, cookies, headers)
+            except Exception as e:
+                self.console.print(f"[red]Repair failed: {str(e)}[/red]")
+
+        self.console.print(f"[red]✗ {name} failed integrity check[/red]")
+        return False
+
@@ -0,0 +1,271 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from naming import class_id
+from scheduler import DEFAULT_ESTIMATES, QueueOrder
+
+QUEUE_FILE = '.jobs.sqlite3'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    class_url TEXT NOT NULL,
+    title TEXT,
+    artifact TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_retry_at REAL NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    subject TEXT,
+    class_number INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (class_url, artifact)
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, next_retry_at);
+"""
+
+
+def class_number(url):
+    """Numeric class ID for newest/oldest ordering, 0 when the URL has none"""
+    number = class_id(url)
+    return int(number) if number.isdigit() else 0
+
+
+class JobQueue:
+    """SQLite-backed queue with one job per class per artifact.
+
+    States: pending -> running -> done, or back to pending with an
+    exponential backoff until max_retries is reached, then dead. Jobs the
+    user chose not to resume are parked until they are resumed or queued
+    again.
+    """
+
+    def __init__(self, config, path=None, order=None):
+        self.path = path or os.path.join(config['download_path'], QUEUE_FILE)
+        self.max_retries = max(1, config['max_retries'])
+        self.backoff_base = config.get('retry_backoff', 30)
+        self.backoff_max = config.get('retry_backoff_max', 3600)
+        self.order = order or QueueOrder(['listing'])
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def _row(self, row):
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        return job
+
+    def enqueue(self, class_url, artifact, title=None, options=None, requeue=False, subject=None):
+        """Add a job and return its id.
+
+        An existing job for the same class and artifact keeps its state, unless
+        requeue is set, which gives a finished or dead job a fresh start. A job
+        that has not started yet takes the new options, a parked one is back
+        to pending.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO jobs (class_url, title, artifact, options, subject, class_number, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (class_url, title, artifact, json.dumps(options or {}), subject, class_number(class_url), now, now)
+            )
+            if subject:
+                self._db.execute(
+                    "UPDATE jobs SET subject = ? WHERE class_url = ? AND artifact = ?", (subject, class_url, artifact)
+                )
+            self._db.execute(
+                "UPDATE jobs SET state = 'pending', options = ?, updated_at = ? "
+                "WHERE class_url = ? AND artifact = ? AND state IN ('pending', 'parked')",
+                (json.dumps(options or {}), now, class_url, artifact)
+            )
+            if requeue:
+                self._db.execute(
+                    "UPDATE jobs SET state = 'pending', attempts = 0, last_error = NULL, next_retry_at = 0, "
+                    "options = ?, updated_at = ? WHERE class_url = ? AND artifact = ? AND state IN ('done', 'dead')",
+                    (json.dumps(options or {}), now, class_url, artifact)
+                )
+            return self._db.execute(
+                "SELECT id FROM jobs WHERE class_url = ? AND artifact = ?", (class_url, artifact)
+            ).fetchone()[0]
+
+    def recover(self):
+        """Jobs left running by a crashed or interrupted run go back to pending"""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET state = 'pending', updated_at = ? WHERE state = 'running'", (time.time(),)
+            )
+            return cur.rowcount
+
+    def estimates(self):
+        """Expected bytes of a note and a video job whose size is not known yet"""
+        estimates = dict(DEFAULT_ESTIMATES)
+        rows = self._db.execute(
+            "SELECT artifact = 'note' AS note, AVG(size) FROM jobs WHERE state = 'done' AND size > 0 GROUP BY note"
+        ).fetchall()
+        for note, average in rows:
+            estimates['note' if note else 'video'] = int(average)
+        return estimates
+
+    def claim_class(self):
+        """Atomically claim the next due work in queue order.
+
+        Every due job of the class is claimed together so one page visit
+        serves them all, unless the order splits classes (see scheduler.py),
+        then only the first job is.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                order_by, params = self.order.sql(self.estimates())
+                row = self._db.execute(
+                    f"SELECT * FROM jobs WHERE state = 'pending' AND next_retry_at <= ? "
+                    f"ORDER BY {order_by} LIMIT 1", (now, *params)
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return []
+                if self.order.together:
+                    rows = self._db.execute(
+                        "SELECT * FROM jobs WHERE class_url = ? AND state = 'pending' AND next_retry_at <= ?",
+                        (row['class_url'], now)
+                    ).fetchall()
+                else:
+                    rows = [row]
+                self._db.execute(
+                    f"UPDATE jobs SET state = 'running', updated_at = ? WHERE id IN ({','.join('?' * len(rows))})",
+                    (now, *[r['id'] for r in rows])
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [self._row(r) for r in rows]
+
+    def claim(self, job_id):
+        """Mark a job running that the caller is about to process itself"""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET state = 'running', updated_at = ? WHERE id = ? AND state = 'pending'",
+                (time.time(), job_id)
+            )
+            return cur.rowcount > 0
+
+    def set_size(self, job_id, size):
+        """Remember a job's size once a probe or a download has shown it"""
+        if size:
+            with self._lock:
+                self._db.execute("UPDATE jobs SET size = ? WHERE id = ?", (int(size), job_id))
+
+    def settle(self, job_id, ok, error=None):
+        if ok:
+            self.complete(job_id)
+            return 'done'
+        return self.fail(job_id, error or "failed")
+
+    def complete(self, job_id):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET state = 'done', last_error = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        """Record a failure, schedule a retry with backoff or move the job to the dead-letter list"""
+        now = time.time()
+        with self._lock:
+            attempts = self._db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] + 1
+            if attempts >= self.max_retries:
+                state, next_retry_at = 'dead', 0
+            else:
+                state = 'pending'
+                next_retry_at = now + min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+            self._db.execute(
+                "UPDATE jobs SET state = ?, attempts = ?, last_error = ?, next_retry_at = ?, updated_at = ? WHERE id = ?",
+                (state, attempts, str(error)[:1000], next_retry_at, now, job_id)
+            )
+            return state
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {'pending': 0, 'running': 0, 'done': 0, 'dead': 0, 'parked': 0}
+        counts.update({state: n for state, n in rows})
+        return counts
+
+    def unfinished(self):
+        counts = self.counts()
+        return counts['pending'] + counts['running'] + counts['parked']
+
+    def park(self):
+        """Set every pending job aside, claim_class() skips them until unpark()"""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET state = 'parked', updated_at = ? WHERE state = 'pending'", (time.time(),)
+            )
+            return cur.rowcount
+
+    def unpark(self):
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET state = 'pending', updated_at = ? WHERE state = 'parked'", (time.time(),)
+            )
+            return cur.rowcount
+
+    def next_wakeup(self):
+        """Time of the earliest pending retry, or None when nothing is pending"""
+        with self._lock:
+            row = self._db.execute("SELECT MIN(next_retry_at) FROM jobs WHERE state = 'pending'").fetchone()
+        return row[0]
+
+    def dead_letters(self):
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs WHERE state = 'dead' ORDER BY updated_at").fetchall()
+        return [self._row(r) for r in rows]
+
+    def retry_dead(self):
+        """Give every dead job a fresh set of attempts"""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, next_retry_at = 0, updated_at = ? WHERE state = 'dead'",
+                (time.time(),)
+            )
+            return cur.rowcount
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def jobs(self, state=None):
+        with self._lock:
+            if state:
+                rows = self._db.execute("SELECT * FROM jobs WHERE state = ? ORDER BY id", (state,)).fetchall()
+            else:
+                rows = self._db.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+        return [self._row(r) for r in rows]
+
+    def changed_since(self, timestamp, last_id=0):
+        """Jobs changed after the (updated_at, id) cursor of the last one seen, oldest change first.
+
+        Several jobs can share an updated_at, the id tells apart which of
+        them the caller already has.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE updated_at > ? OR (updated_at = ? AND id > ?) ORDER BY updated_at, id",
+                (timestamp, timestamp, last_id)
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def close(self):
+        self._db.close()
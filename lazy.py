@@ -0,0 +1,41 @@
+import importlib
+import threading
+
+
+class LazyImport:
+    """Stand-in for a module (or an attribute of one) that is imported on first use.
+
+    Lets heavy dependencies such as selenium and requests keep their usual
+    module-level names without being loaded until a code path touches them.
+    """
+
+    def __init__(self, module_name, attr=None):
+        self._module_name = module_name
+        self._attr = attr
+        self._target = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    target = importlib.import_module(self._module_name)
+                    if self._attr:
+                        target = getattr(target, self._attr)
+                    self._target = target
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        name = f"{self._module_name}.{self._attr}" if self._attr else self._module_name
+        state = 'loaded' if self._target is not None else 'not loaded'
+        return f"<LazyImport {name} ({state})>"
+
+
+def lazy_import(module_name, attr=None):
+    return LazyImport(module_name, attr)
@@ -0,0 +1,199 @@
+"""Class entries from PastClasses listing HTML without building the whole page.
+
+A long listing holds thousands of class boxes but iter_class_links only
+needs four things from each: the ClassDetails link, the title, the topic
+and whether an isNotes=true link exists. With lxml the HTML is fed to an
+HTMLPullParser and every box is read and dropped as soon as it closes, so
+memory stays flat and chunks of an HTTP response can be parsed as they
+arrive. Without lxml the standard library's HTMLParser does the same
+with a stack of open tags.
+
+BeautifulSoup is not used: building the soup costs several times the raw
+parse, and a SoupStrainer on `.uu-routine-box` barely helps because its
+match runs for every tag (see the benchmark).
+
+    python benchmarks/bench_listing.py [classes]
+"""
+import importlib.util
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+LXML_AVAILABLE = importlib.util.find_spec('lxml') is not None
+
+# Same boxes as the ".uu-routine-box .displayClass" selector
+CONTAINER_CLASS = 'uu-routine-box'
+BOX_CLASS = 'displayClass'
+TITLE_CLASS = 'uu-routine-title'
+TOPIC_CLASS = 'uu-latex-body-style'
+
+
+def _normalize(text):
+    return ' '.join((text or '').split())
+
+
+def _entry(link, title, topic, has_notes, base_url):
+    # A box without these is a placeholder or a broken card
+    if not link or title is None or topic is None:
+        return None
+    return {
+        'url': urljoin(base_url, link),
+        'title': _normalize(title),
+        'topic': _normalize(topic),
+        'has_notes': has_notes
+    }
+
+
+def _lxml_box(box, base_url):
+    """One pass over a box subtree, no selector compilation per box"""
+    link = title = topic = None
+    has_notes = False
+    for element in box.iter():
+        tag = element.tag
+        if not isinstance(tag, str):
+            # Comments and processing instructions
+            continue
+        if tag == 'a':
+            href = element.get('href') or ''
+            if link is None and 'ClassDetails' in href:
+                link = href
+            if 'isNotes=true' in href:
+                has_notes = True
+        classes = (element.get('class') or '').split()
+        if title is None and TITLE_CLASS in classes:
+            title = ''.join(element.itertext())
+        elif topic is None and TOPIC_CLASS in classes:
+            topic = ''.join(element.itertext())
+    return _entry(link, title, topic, has_notes, base_url)
+
+
+def _in_container(element):
+    parent = element.getparent()
+    while parent is not None:
+        if CONTAINER_CLASS in (parent.get('class') or '').split():
+            return True
+        parent = parent.getparent()
+    return False
+
+
+def _iter_lxml(chunks, base_url):
+    from lxml import etree
+
+    parser = etree.HTMLPullParser(events=('end',))
+
+    def drain():
+        for _, element in parser.read_events():
+            if BOX_CLASS not in (element.get('class') or '').split() or not _in_container(element):
+                continue
+            entry = _lxml_box(element, base_url)
+            # Finished boxes are never looked at again
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if entry:
+                yield entry
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+             'meta', 'param', 'source', 'track', 'wbr'}
+
+
+class ListingParser(HTMLParser):
+    """Streaming extractor on the standard library parser, used when lxml is missing.
+
+    Keeps a stack of open tags instead of a tree; text is only collected
+    inside a box's title and topic elements.
+    """
+
+    def __init__(self, base_url=''):
+        super().__init__()
+        self.base_url = base_url
+        self.entries = []
+        self._stack = []
+        self._containers = 0
+        self._box = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        box = self._box
+        if tag == 'a' and box is not None:
+            href = attrs.get('href') or ''
+            if box['link'] is None and 'ClassDetails' in href:
+                box['link'] = href
+            if 'isNotes=true' in href:
+                box['has_notes'] = True
+        if tag in VOID_TAGS:
+            return
+
+        classes = (attrs.get('class') or '').split()
+        role = None
+        if box is None and self._containers and BOX_CLASS in classes:
+            role = 'box'
+            self._box = {'link': None, 'title': None, 'topic': None, 'has_notes': False, 'capture': None}
+        elif CONTAINER_CLASS in classes:
+            role = 'container'
+            self._containers += 1
+        elif box is not None and box['capture'] is None:
+            if box['title'] is None and TITLE_CLASS in classes:
+                role = 'title'
+            elif box['topic'] is None and TOPIC_CLASS in classes:
+                role = 'topic'
+            if role:
+                box[role] = []
+                box['capture'] = role
+        self._stack.append((tag, role))
+
+    def handle_data(self, data):
+        if self._box is not None and self._box['capture']:
+            self._box[self._box['capture']].append(data)
+
+    def handle_endtag(self, tag):
+        # Unclosed tags (<p>, <li>) end with their parent, like browsers do
+        if not any(open_tag == tag for open_tag, _ in self._stack):
+            return
+        while self._stack:
+            open_tag, role = self._stack.pop()
+            if role == 'container':
+                self._containers -= 1
+            elif role in ('title', 'topic'):
+                self._box[role] = ''.join(self._box[role])
+                self._box['capture'] = None
+            elif role == 'box':
+                box, self._box = self._box, None
+                title, topic = box['title'], box['topic']
+                entry = _entry(box['link'], title if isinstance(title, str) else None,
+                               topic if isinstance(topic, str) else None, box['has_notes'], self.base_url)
+                if entry:
+                    self.entries.append(entry)
+            if open_tag == tag:
+                return
+
+
+def _iter_stdlib(chunks, base_url):
+    parser = ListingParser(base_url)
+    for chunk in chunks:
+        parser.feed(chunk.decode('utf-8', 'replace') if isinstance(chunk, bytes) else chunk)
+        yield from parser.entries
+        parser.entries.clear()
+    parser.close()
+    yield from parser.entries
+
+
+def iter_listing(chunks, base_url=''):
+    """Yield class entries from listing HTML given as an iterable of str or bytes chunks.
+
+    Entries are dicts with url, title, topic and has_notes; links
+    are made absolute against base_url and incomplete boxes are skipped.
+    """
+    if LXML_AVAILABLE:
+        return _iter_lxml(chunks, base_url)
+    return _iter_stdlib(chunks, base_url)
+
+
+def parse_listing(html, base_url=''):
+    return list(iter_listing([html], base_url))
@@ -1,31 +1,33 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait, Select
-from selenium.webdriver.support import expected_conditions as EC
 import time
+STARTED_AT = time.perf_counter()
+
 from rich.console import Console
 from rich.prompt import Prompt, Confirm
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
+from lazy import lazy_import
 from video_downloader import VideoDownloader
-import json
-import os
-import requests
+from listing import parse_listing
+import video_downloader
+import concurrent.futures
+import sys
+import threading
+
+By = lazy_import('selenium.webdriver.common.by', 'By')
+WebDriverWait = lazy_import('selenium.webdriver.support.ui', 'WebDriverWait')
+Select = lazy_import('selenium.webdriver.support.ui', 'Select')
+EC = lazy_import('selenium.webdriver.support.expected_conditions')
 
 class MasterDownloader:
     def __init__(self):
         self.console = Console()
         self.video_downloader = VideoDownloader()
-        self.setup_chrome_options()
+        self._jobs = None
+        self._probes = None
         
-    def setup_chrome_options(self):
-        self.chrome_options = Options()
-        self.chrome_options.add_argument('--headless')
-        self.chrome_options.add_argument('--disable-gpu')
-        self.chrome_options.add_argument('--no-sandbox')
-        self.chrome_options.add_argument('--disable-dev-shm-usage')
-        self.chrome_options.add_argument('--log-level=3')
-        self.chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    @property
+    def chrome_options(self):
+        # One profile for every browser, see chrome_profile.py
+        return self.video_downloader.chrome_options
 
     def get_course_options(self, driver):
         try:
@@ -45,56 +47,258 @@ class MasterDownloader:
             self.console.print(f"[red]Error getting course options: {str(e)}[/red]")
             return []
 
-    def get_class_links(self, driver):
-        try:
-            # Wait for class boxes to load
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".uu-routine-box"))
-            )
-            time.sleep(2)  # Additional wait for dynamic content
+    # Selectors tried, in order, to move to the next page of the listing
+    NEXT_PAGE_SELECTORS = [
+        "a[rel='next']",
+        ".pagination li.next:not(.disabled) a",
+        ".pagination .page-item:not(.disabled) a[aria-label='Next']",
+        "#loadMore:not([disabled])",
+        ".load-more:not([disabled])"
+    ]
+
+    # Stylesheets are blocked in the lean profile (see chrome_profile.py), so
+    # is_displayed() calls every button visible; judge by the markup the
+    # page's own CSS would act on instead
+    HIDDEN_SCRIPT = """
+        const button = arguments[0];
+        for (let node = button; node && node.nodeType === 1; node = node.parentElement) {
+            if (node.hidden || node.getAttribute('aria-hidden') === 'true' || node.style.display === 'none'
+                || ['d-none', 'hidden', 'disabled'].some(name => node.classList.contains(name))) {
+                return true;
+            }
+        }
+        return button.disabled || button.getAttribute('aria-disabled') === 'true';
+    """
+    # Pagination still in flight: a page loading, a new URL or a grown page
+    PAGE_STATE_SCRIPT = "return [document.readyState, location.href, document.body ? document.body.scrollHeight : 0];"
+
+    def _load_more(self, driver):
+        """Follow the listing's pagination, or scroll to trigger lazy loading"""
+        for selector in self.NEXT_PAGE_SELECTORS:
+            buttons = driver.find_elements(By.CSS_SELECTOR, selector)
+            if buttons and not driver.execute_script(self.HIDDEN_SCRIPT, buttons[0]):
+                driver.execute_script("arguments[0].click();", buttons[0])
+                return True
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        return False
+
+    def iter_class_links(self, driver, poll_interval=0.5, idle_timeout=None):
+        """Yield class entries as soon as they appear, following pagination and lazy scroll.
+
+        The listing is complete once idle_timeout seconds ('listing_idle_timeout'
+        in config.json) pass without new entries and without the page still
+        loading, changing URL or growing.
+        """
+        if idle_timeout is None:
+            idle_timeout = self.video_downloader.config['listing_idle_timeout']
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".uu-routine-box"))
+        )
+        
+        seen = set()
+        idle_since = time.time()
+        page_state = None
+        while True:
+            state = driver.execute_script(self.PAGE_STATE_SCRIPT)
+            if state != page_state or state[0] != 'complete':
+                page_state = state
+                idle_since = time.time()
+            # One page_source call per poll instead of four WebDriver calls per box, see listing.py
+            for class_info in parse_listing(driver.page_source, driver.current_url):
+                if class_info['url'] not in seen:
+                    seen.add(class_info['url'])
+                    idle_since = time.time()
+                    yield class_info
+            
+            # Nothing new and a settled page for a while even after paging or scrolling, the listing is complete
+            if time.time() - idle_since > idle_timeout:
+                return
+            self._load_more(driver)
+            time.sleep(poll_interval)
+
+    def get_class_links(self, driver, attempts=3):
+        """Every class of the listing; iter_class_links waits for it to settle, only errors are retried"""
+        for attempt in range(attempts):
+            try:
+                return list(self.iter_class_links(driver))
+            except Exception as e:
+                # No class box appeared at all: the listing is empty, asking again will not change that
+                if type(e).__name__ == 'TimeoutException':
+                    return []
+                self.console.print(f"[red]Error getting class links: {str(e)}[/red]")
+                if attempt + 1 < attempts:
+                    time.sleep(1)
+        return []
+
+    def stream_download(self, cookies_string, driver, use_youtube, quality_policy, subject=None):
+        """Download classes while the listing is still being crawled on another thread"""
+        crawl_done = threading.Event()
+        crawled = []
+        
+        def crawl():
+            try:
+                for class_info in self.iter_class_links(driver):
+                    crawled.append(class_info)
+                    self.enqueue_class(class_info, use_youtube, quality_policy, subject)
+            except Exception as e:
+                self.console.print(f"[red]Error getting class links: {str(e)}[/red]")
+            finally:
+                crawl_done.set()
+        
+        crawler = threading.Thread(target=crawl, daemon=True)
+        crawler.start()
+        self.run_queue(cookies_string, crawl_done)
+        crawler.join()
+        self.print_job_summary()
+        return crawled
+
+    @property
+    def jobs(self):
+        """Persistent job queue in the download folder, see job_queue.py"""
+        if self._jobs is None:
+            from job_queue import JobQueue
+            from scheduler import order_from
+            # Which job goes next: shortest first, notes first, ... see scheduler.py
+            order = order_from(self.video_downloader.config, sys.argv)
+            self._jobs = JobQueue(self.video_downloader.config, order=order)
+            # Anything still marked running was cut off by the last exit
+            self._jobs.recover()
+        return self._jobs
+
+    def enqueue_class(self, class_info, use_youtube, quality_policy, subject=None, requeue=True):
+        """One job for the chosen video variant and one for the note, returns their ids.
+
+        requeue gives finished and dead jobs of the class a fresh start, see JobQueue.enqueue.
+        """
+        options = {'use_youtube': use_youtube, 'policy': str(quality_policy)}
+        # One video job per source, a different policy only changes its options
+        variant = f"video:{'youtube' if use_youtube else 'direct'}"
+        subject = class_info.get('subject') or subject
+        # Older file names without the class ID are only reused when no other listed class shares them
+        self.video_downloader.names.claim(class_info['url'], (class_info['title'],))
+        ids = {'video': self.jobs.enqueue(class_info['url'], variant, class_info['title'], options, requeue=requeue, subject=subject)}
+        if class_info.get('has_notes', True):
+            ids['note'] = self.jobs.enqueue(class_info['url'], 'note', class_info['title'], options, requeue=requeue, subject=subject)
+        if not use_youtube:
+            self.probe_size(ids['video'], class_info['url'], quality_policy)
+        return ids
+
+    def probe_size(self, job_id, class_url, quality_policy):
+        """Look up a queued direct video's size in the background, ordering a fresh queue by real sizes"""
+        workers = self.video_downloader.config['size_probe_workers']
+        job = self.jobs.get(job_id)
+        if not workers or job['size'] or job['state'] != 'pending':
+            return
+        if self._probes is None:
+            self._probes = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='size-probe')
+
+        def probe():
+            self.jobs.set_size(job_id, self.video_downloader.probe_class_size(class_url, quality_policy))
+        self._probes.submit(probe)
+
+    def settle_job(self, job_id, title, artifact, ok, error=None):
+        state = self.jobs.settle(job_id, ok, error)
+        if state == 'dead':
+            self.console.print(f"[red]✗ Giving up on the {artifact} of {title}: {error}[/red]")
+        elif state == 'pending':
+            self.console.print(f"[yellow]↻ {artifact.capitalize()} of {title} failed, will retry later ({error})[/yellow]")
+        return state
+
+    def run_queue(self, cookies_string, crawl_done=None, interrupt=None):
+        """Work through the job queue until nothing is left, waiting out retry backoffs.
+
+        crawl_done is set by a crawler that is still adding jobs, until then an
+        empty queue only means the next class has not been found yet. Setting
+        interrupt cuts a backoff wait short, e.g. when new jobs were submitted.
+        """
+        from quality_policy import QualityPolicy
+        
+        storage = self.video_downloader.storage
+        while True:
+            # Nothing new starts while every download folder is nearly full
+            storage.wait_for_space()
+            claimed = self.jobs.claim_class()
+            if not claimed:
+                if crawl_done is not None and not crawl_done.is_set():
+                    crawl_done.wait(0.5)
+                    continue
+                wakeup = self.jobs.next_wakeup()
+                if wakeup is None:
+                    break
+                delay = wakeup - time.time()
+                if delay > 0:
+                    self.console.print(f"[cyan]Waiting {delay:.0f}s before retrying failed downloads...[/cyan]")
+                    if interrupt is not None:
+                        interrupt.wait(delay)
+                        interrupt.clear()
+                    else:
+                        time.sleep(delay)
+                continue
             
-            class_boxes = driver.find_elements(By.CSS_SELECTOR, ".uu-routine-box .displayClass")
-            links = []
+            title = claimed[0]['title'] or claimed[0]['class_url']
+            counts = self.jobs.counts()
+            self.console.print(f"\n[yellow]Processing ({counts['pending']} queued): {title}[/yellow]")
             
-            for box in class_boxes:
+            # The note rides along with the first video variant, one page visit each
+            notes = [job for job in claimed if job['artifact'] == 'note']
+            videos = [job for job in claimed if job['artifact'] != 'note'] or [None]
+            for video in videos:
+                batch = ([video] if video else []) + notes
+                notes = []
+                if not batch:
+                    continue
+                options = batch[0]['options']
+                kinds = {job['id']: 'note' if job['artifact'] == 'note' else 'video' for job in batch}
                 try:
-                    video_link = box.find_element(By.CSS_SELECTOR, "a[href*='ClassDetails']").get_attribute('href')
-                    title = box.find_element(By.CSS_SELECTOR, ".uu-routine-title").text.strip()
-                    topic = box.find_element(By.CSS_SELECTOR, ".uu-latex-body-style").text.strip()
-                    
-                    # Check if notes are available
-                    has_notes = len(box.find_elements(By.CSS_SELECTOR, "a[href*='isNotes=true']")) > 0
-                    
-                    links.append({
-                        'url': video_link,
-                        'title': title,
-                        'topic': topic,
-                        'has_notes': has_notes
-                    })
+                    results = self.video_downloader.process_class_artifacts(
+                        cookies_string, batch[0]['class_url'], tuple(kinds.values()),
+                        use_youtube=options.get('use_youtube', False),
+                        quality_policy=QualityPolicy.parse(options.get('policy')),
+                        title=batch[0]['title']
+                    )
                 except Exception as e:
-                    self.console.print(f"[yellow]Warning: Skipped a class due to error: {str(e)}[/yellow]")
-                    continue
-                    
-            return links
-        except Exception as e:
-            self.console.print(f"[red]Error getting class links: {str(e)}[/red]")
-            return []
+                    results = {kind: (False, str(e)) for kind in kinds.values()}
+                # Probed and downloaded sizes order the retries and the estimates for later jobs
+                sizes = self.video_downloader.class_sizes.pop(batch[0]['class_url'], {})
+                for job in batch:
+                    self.jobs.set_size(job['id'], sizes.get(kinds[job['id']]))
+                    ok, error = results.get(kinds[job['id']], (False, "not processed"))
+                    self.settle_job(job['id'], title, kinds[job['id']], ok, error)
+
+    def print_job_summary(self):
+        counts = self.jobs.counts()
+        dead = self.jobs.dead_letters()
+        color = "red" if dead else "bold green"
+        self.console.print(f"\n[{color}]╭─── Done ───╮[/{color}]")
+        self.console.print(f"[{color}]│ {counts['done']} finished, {counts['pending']} waiting, {counts['dead']} failed[/{color}]")
+        for job in dead:
+            self.console.print(f"[red]│ ✗ {job['title']} ({job['artifact']}), {job['attempts']} attempts: {job['last_error']}[/red]")
+        if dead:
+            self.console.print("[red]│ Run with --retry-failed to try these again[/red]")
+        self.console.print(f"[{color}]╰────────────╯[/{color}]")
+
+    def merge_subject_notes(self, subject, class_links):
+        """Queue one PDF with every downloaded note of a subject, in listing order"""
+        postprocess = self.video_downloader.postprocess
+        if not postprocess.enabled:
+            return
+        names = self.video_downloader.names
+        output_path = self.video_downloader.output_path
+        notes = [output_path(f"{names.base_for(info['url'], info['title'])}_note.pdf") for info in class_links]
+        output = output_path(f"{self.video_downloader.sanitize_filename(subject)}_notes.pdf")
+        postprocess.submit_merge(notes, output)
 
     def process_single_class(self, cookies_string, class_info):
         try:
             self.console.print(f"\n[yellow]Processing: {class_info['title']}[/yellow]")
             
-            # Initialize driver for this class
-            driver = webdriver.Chrome(options=self.chrome_options)
-            driver.get("https://online.utkorsho.tech")
-            
-            # Add cookies
+            # Borrow a pooled driver that already has the session cookies
             cookies_dict = self.video_downloader.get_cookies_dict(cookies_string)
-            for name, value in cookies_dict.items():
-                driver.add_cookie({'name': name, 'value': value})
+            driver = self.video_downloader.driver_pool.acquire()
+            base_filename = self.video_downloader.names.base_for(class_info['url'], class_info['title'])
             
-            # Load class page
-            driver.get(class_info['url'])
+            # Load class page, recording its network requests
+            capture = self.video_downloader.load_class_page(driver, class_info['url'])
             time.sleep(2)
             
             # Switch to video tab first
@@ -105,10 +309,8 @@ class MasterDownloader:
             video_sources = self.video_downloader.get_video_sources(driver, cookies_dict)
             
             if not video_sources:
-                # Try alternative method
-                video_url = self.video_downloader.get_video_url(cookies_string, class_info['url'])
-                if video_url:
-                    video_sources = [('direct', video_url, '720')]
+                # Try alternative method, the requests the player made
+                video_sources = self.video_downloader.network_video_sources(capture)
             
             if video_sources:
                 # Extract YouTube ID if available
@@ -120,19 +322,16 @@ class MasterDownloader:
                 
                 # Handle YouTube option if available
                 if youtube_id and self.video_downloader.ask_youtube_preference(youtube_id):
-                    filename = os.path.join(
-                        self.video_downloader.config['download_path'],
-                        f"{class_info['title']}_youtube.mp4"
-                    )
+                    filename = self.video_downloader.output_path(f"{base_filename}_youtube.mp4")
                     if not self.video_downloader.download_youtube(youtube_id, filename):
                         self.console.print("[yellow]Falling back to direct download...[/yellow]")
                         # Process direct video sources
                         if video_sources:
-                            self.video_downloader.process_direct_sources(video_sources, class_info['title'], cookies_string)
+                            self.video_downloader.process_direct_sources(video_sources, base_filename, cookies_string)
                 else:
                     # Process direct video sources
                     if video_sources:
-                        self.video_downloader.process_direct_sources(video_sources, class_info['title'], cookies_string)
+                        self.video_downloader.process_direct_sources(video_sources, base_filename, cookies_string)
             
             # Handle notes download if available
             if class_info['has_notes']:
@@ -141,10 +340,7 @@ class MasterDownloader:
                 
                 note_url = self.video_downloader.get_note_url_from_link(driver)
                 if note_url:
-                    note_filename = os.path.join(
-                        self.video_downloader.config['download_path'],
-                        f"{class_info['title']}_note.pdf"
-                    )
+                    note_filename = self.video_downloader.output_path(f"{base_filename}_note.pdf")
                     self.video_downloader.download_note(note_url, cookies_string, note_filename)
             
             return True
@@ -154,10 +350,92 @@ class MasterDownloader:
             return False
         finally:
             if 'driver' in locals():
-                driver.quit()
+                self.video_downloader.driver_pool.release(driver)
+
+    def download_youtube_classes(self, cookies_string, selected_links, quality_policy, subject=None):
+        """Scrape every selected class first, then hand all YouTube IDs to one batch"""
+        jobs = []
+        job_ids = {}
+        direct_only = []
+        # Before any class is scanned, see NameIndex.claim()
+        for class_info in selected_links:
+            self.video_downloader.names.claim(class_info['url'], (class_info['title'],))
+
+        for i, class_info in enumerate(selected_links, 1):
+            ids = self.enqueue_class(class_info, True, quality_policy, subject)
+            # Another worker on the same queue (api_server.py) may be busy with them
+            ids = {artifact: job_id for artifact, job_id in ids.items() if self.jobs.claim(job_id)}
+            if not ids:
+                self.console.print(f"\n[cyan]Already being downloaded elsewhere: {class_info['title']}[/cyan]")
+                continue
+            self.console.print(f"\n[yellow]Scanning ({i}/{len(selected_links)}): {class_info['title']}[/yellow]")
+            info = self.video_downloader.collect_class_info(
+                cookies_string, class_info['url'], want_note='note' in ids, title=class_info['title']
+            )
+            if not info:
+                for artifact, job_id in ids.items():
+                    self.settle_job(job_id, class_info['title'], artifact, False, "could not read class page")
+                continue
+
+            if 'note' in ids:
+                note_filename = self.video_downloader.output_path(f"{info['base_filename']}_note.pdf")
+                ok = True
+                refresh = self.video_downloader.config['refresh']
+                if info['note_url'] and (refresh or not self.video_downloader.names.exists(note_filename)):
+                    ok = self.video_downloader.download_note(info['note_url'], cookies_string, note_filename)
+                self.settle_job(ids['note'], class_info['title'], 'note', ok, "note download failed")
+
+            if 'video' not in ids:
+                continue
+            if info['youtube_id']:
+                filename = self.video_downloader.output_path(f"{info['base_filename']}_youtube.mp4")
+                jobs.append((info['youtube_id'], filename))
+                job_ids[filename] = (ids['video'], class_info['title'])
+            else:
+                self.console.print("[yellow]No YouTube version, will use direct download[/yellow]")
+                direct_only.append((class_info, ids['video']))
+
+        if jobs:
+            self.console.print(f"\n[cyan]Downloading {len(jobs)} YouTube videos...[/cyan]")
+            results = self.video_downloader.download_youtube_batch(jobs, quality_policy.as_ytdlp_selector())
+            for filename, ok in results.items():
+                job_id, title = job_ids[filename]
+                self.settle_job(job_id, title, 'video', ok, "YouTube download failed")
+
+        for class_info, job_id in direct_only:
+            self.console.print(f"\n[yellow]Processing: {class_info['title']}[/yellow]")
+            results = self.video_downloader.process_class_artifacts(
+                cookies_string, class_info['url'], ('video',), quality_policy=quality_policy,
+                title=class_info['title']
+            )
+            sizes = self.video_downloader.class_sizes.pop(class_info['url'], {})
+            self.jobs.set_size(job_id, sizes.get('video'))
+            self.settle_job(job_id, class_info['title'], 'video', *results['video'])
+
+        # Whatever failed above is retried from the queue with backoff
+        self.run_queue(cookies_string)
+        self.print_job_summary()
+
+    def discover_catalogue(self, cookies_string, path=None):
+        """Crawl every course and subject into one catalogue file, see catalogue.py"""
+        from catalogue import CatalogueBuilder, save_catalogue, DEFAULT_CATALOGUE_FILE
+        
+        path = path or DEFAULT_CATALOGUE_FILE
+        self.console.print("\n[cyan]Discovering every course and subject...[/cyan]")
+        catalogue = CatalogueBuilder(self).discover(cookies_string)
+        save_catalogue(catalogue, path)
+        
+        self.console.print("\n[bold green]╭─── Catalogue ───╮[/bold green]")
+        self.console.print(f"[bold green]│ {len(catalogue['pairs'])} course/subject pairs[/bold green]")
+        self.console.print(f"[bold green]│ {len(catalogue['classes'])} classes saved to {path}[/bold green]")
+        if catalogue['failed']:
+            self.console.print(f"[red]│ {len(catalogue['failed'])} subjects failed, run again to retry[/red]")
+        self.console.print("[bold green]╰─────────────────╯[/bold green]")
+        return catalogue
 
     def download_classes(self, cookies_string):
-        driver = webdriver.Chrome(options=self.chrome_options)
+        self.video_downloader.get_cookies_dict(cookies_string)
+        driver = self.video_downloader.driver_pool.acquire()
         try:
             # Load the page with nice UI
             with Progress(
@@ -168,18 +446,9 @@ class MasterDownloader:
                 console=self.console
             ) as progress:
                 task = progress.add_task("[cyan]Loading page...", total=100)
-                
-                # Load initial page
-                driver.get("https://online.utkorsho.tech/Routine/PastClasses")
                 progress.update(task, completed=30)
                 
-                # Add cookies
-                cookies_dict = self.video_downloader.get_cookies_dict(cookies_string)
-                for name, value in cookies_dict.items():
-                    driver.add_cookie({'name': name, 'value': value})
-                progress.update(task, completed=60)
-                
-                # Reload with cookies
+                # Load with the session cookies already in place
                 driver.get("https://online.utkorsho.tech/Routine/PastClasses")
                 time.sleep(3)
                 progress.update(task, completed=100)
@@ -249,6 +518,16 @@ class MasterDownloader:
             subject_choice = int(Prompt.ask("\n[bold blue]Choose subject number[/bold blue]")) - 1
             selected_subject = subjects[subject_choice]
             
+            # Streaming mode skips the class menu and starts downloading right away
+            if Confirm.ask("\n[bold blue]Download every class as the list loads (no class selection)?[/bold blue]", default=False):
+                subject_select.select_by_value(selected_subject['value'])
+                time.sleep(1)
+                use_youtube = Confirm.ask("\n[bold blue]Prefer YouTube version when available?[/bold blue]", default=False)
+                quality_policy = self.video_downloader.ask_quality_policy()
+                crawled = self.stream_download(cookies_string, driver, use_youtube, quality_policy, selected_subject['text'])
+                self.merge_subject_notes(selected_subject['text'], crawled)
+                return
+            
             # Select subject and load classes with progress
             with Progress(
                 SpinnerColumn(),
@@ -263,16 +542,9 @@ class MasterDownloader:
                 progress.update(task, completed=30)
                 time.sleep(2)
                 
-                # Get class links with retry
-                max_retries = 3
-                class_links = []
-                for attempt in range(max_retries):
-                    progress.update(task, completed=30 + ((attempt + 1) * 20))
-                    class_links = self.get_class_links(driver)
-                    if class_links:
-                        break
-                    time.sleep(1)
-                
+                # Waits until the listing has settled, an empty one is an answer too
+                progress.update(task, completed=50)
+                class_links = self.get_class_links(driver)
                 progress.update(task, completed=100)
             
             if not class_links:
@@ -315,101 +587,41 @@ class MasterDownloader:
             
             # Download files with nice progress
             if selected_links:
-                # Get preferences from first file
-                first_class = selected_links[0]
-                use_youtube = False
-                youtube_quality = None
-                direct_quality = None
+                # One policy for the whole batch, resolved against each class's own sources
+                use_youtube = Confirm.ask("\n[bold blue]Prefer YouTube version when available?[/bold blue]", default=False)
+                quality_policy = self.video_downloader.ask_quality_policy()
                 
-                # Initialize temp driver for getting preferences
-                temp_driver = webdriver.Chrome(options=self.chrome_options)
-                try:
-                    temp_driver.get("https://online.utkorsho.tech")
-                    for name, value in cookies_dict.items():
-                        temp_driver.add_cookie({'name': name, 'value': value})
-                        
-                    temp_driver.get(first_class['url'])
-                    time.sleep(2)
-                    
-                    self.video_downloader.switch_to_tab(temp_driver, "video")
-                    time.sleep(2)
-                    
-                    video_sources = self.video_downloader.get_video_sources(temp_driver, cookies_dict)
-                    
-                    if video_sources:
-                        # Check for YouTube
-                        youtube_id = None
-                        for source in video_sources:
-                            if source[0] == 'youtube':
-                                youtube_id = source[1]
-                                break
-                        
-                        if youtube_id:
-                            use_youtube = self.video_downloader.ask_youtube_preference(youtube_id)
-                            if use_youtube:
-                                youtube_quality = self.video_downloader.get_youtube_quality_preference(youtube_id)
-                        
-                        if not use_youtube:
-                            # Get direct download quality
-                            direct_sources = [s for s in video_sources if s[0] == 'direct']
-                            if direct_sources:
-                                resolutions = sorted([int(s[2]) for s in direct_sources], reverse=True)
-                                direct_quality = self.video_downloader.ask_resolution_preference(resolutions)[0]
-                finally:
-                    temp_driver.quit()
-                
-                # Download all files with same preferences
-                with Progress(
-                    SpinnerColumn(),
-                    TextColumn("[progress.description]{task.description}"),
-                    BarColumn(),
-                    TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                    TextColumn("•"),
-                    TextColumn("[cyan]{task.fields[speed]}[/cyan]"),
-                    console=self.console
-                ) as progress:
-                    main_task = progress.add_task(
-                        "[bold cyan]Overall progress...", 
-                        total=len(selected_links),
-                        speed="0/0 files"
-                    )
-                    
-                    for i, class_info in enumerate(selected_links, 1):
-                        progress.update(
-                            main_task, 
-                            speed=f"{i}/{len(selected_links)} files"
-                        )
-                        
-                        # Add newline before processing each file
-                        self.console.print("")
-                        self.console.print(f"[yellow]Processing: {class_info['title']}[/yellow]")
-                        
-                        if self.video_downloader.process_class_page_with_preferences(
-                            cookies_string, 
-                            class_info['url'],
-                            use_youtube=use_youtube,
-                            youtube_quality=youtube_quality,
-                            direct_quality=direct_quality
-                        ):
-                            self.console.print(f"[green]✓ Successfully downloaded {class_info['title']}[/green]")
-                        else:
-                            self.console.print(f"[red]✗ Failed to download {class_info['title']}[/red]")
-                        
-                        progress.advance(main_task)
-                
-                self.console.print("\n[bold green]╭─── Success ───╮[/bold green]")
-                self.console.print("[bold green]│ All downloads completed![/bold green]")
-                self.console.print("[bold green]╰─────────────╯[/bold green]")
+                # YouTube batches share one yt-dlp instance for the whole run
+                if use_youtube:
+                    self.download_youtube_classes(cookies_string, selected_links, quality_policy, selected_subject['text'])
+                else:
+                    # Every class becomes queued jobs, so an interrupted run can resume
+                    for class_info in selected_links:
+                        self.enqueue_class(class_info, use_youtube, quality_policy, selected_subject['text'])
+                    self.run_queue(cookies_string)
+                    self.print_job_summary()
+                self.merge_subject_notes(selected_subject['text'], selected_links)
                 
         except Exception as e:
             self.console.print("\n[red]╭─── Error ───╮[/red]")
             self.console.print(f"[red]│ {str(e)}[/red]")
             self.console.print("[red]╰────────────╯[/red]")
         finally:
-            driver.quit()
+            self.video_downloader.driver_pool.release(driver)
 
 def main():
     downloader = MasterDownloader()
+    # A mistyped --order stops here, not after the cookies and the first listing
+    from scheduler import RULES, order_from
+    try:
+        order_from(downloader.video_downloader.config, sys.argv)
+    except ValueError as e:
+        downloader.console.print(f"[red]{str(e)}[/red]")
+        downloader.console.print(f"Usage: python master_downloader.py [--order RULE,RULE...]  rules: {', '.join(RULES)} (subject:NAME)")
+        sys.exit(2)
+    # Measure from this script's own start, not from when video_downloader was imported
+    video_downloader.STARTED_AT = STARTED_AT
+    downloader.video_downloader.report_startup_time()
     
     # Try to load saved cookies
     cookies = downloader.video_downloader.load_cookies()
@@ -424,11 +636,36 @@ def main():
             if cookies:
                 downloader.video_downloader.save_cookies(cookies)
     
+    # Find out about expired cookies now, not after minutes of scraping
+    cookies = downloader.video_downloader.ensure_valid_cookies(cookies)
+    
+    # Jobs left over from an interrupted run, or dead ones the user wants back
+    if '--retry-failed' in sys.argv:
+        revived = downloader.jobs.retry_dead()
+        downloader.console.print(f"\n[cyan]Retrying {revived} failed downloads[/cyan]")
+    unfinished = downloader.jobs.unfinished()
+    if unfinished and Confirm.ask(f"\n[bold blue]Resume {unfinished} unfinished downloads from the last run?[/bold blue]", default=True):
+        downloader.jobs.unpark()
+        downloader.run_queue(cookies)
+        downloader.print_job_summary()
+    elif unfinished:
+        # Otherwise the next run_queue would pick them up anyway
+        downloader.jobs.park()
+        downloader.console.print("[cyan]Set aside, they are offered again next time[/cyan]")
+    
+    # Full-account discovery: python master_downloader.py --discover [catalogue.json]
+    if '--discover' in sys.argv:
+        args = sys.argv[sys.argv.index('--discover') + 1:]
+        path = args[0] if args and not args[0].startswith('--') else None
+        downloader.discover_catalogue(cookies, path)
+        return
+    
     while True:
         downloader.download_classes(cookies)
         if not Confirm.ask("\n[bold blue]Download more classes?[/bold blue]"):
             break
     
+    downloader.video_downloader.postprocess.close()
     downloader.console.print("\n[bold yellow]👋 Thank you for using Udvash Video Downloader![/bold yellow]")
 
 if __name__ == "__main__":
@@ -0,0 +1,168 @@
+import hashlib
+import os
+import re
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+BENGALI_DIGITS = '০১২৩৪৫৬৭৮৯'
+INVALID_CHARACTERS = '<>:"/\\|?*\n\r\t'
+# One C-level pass per title instead of a regex plus ten str.replace calls
+TRANSLATION = str.maketrans({
+    **{bengali: str(i) for i, bengali in enumerate(BENGALI_DIGITS)},
+    **{character: None for character in INVALID_CHARACTERS},
+})
+ID_PARAMETERS = ('id', 'classid', 'routineid', 'routineclassid', 'contentid')
+MAX_TITLE_LENGTH = 200
+
+
+def sanitize(text, max_length=MAX_TITLE_LENGTH):
+    """Filename-safe version of a title, Bengali digits as ASCII and spaces as underscores"""
+    return '_'.join((text or '').translate(TRANSLATION).split())[:max_length]
+
+
+def short_title(title):
+    """The class name without the chapter and topic that follow the first '-'"""
+    return (title or '').split('-', 1)[0].strip()
+
+
+def class_id(url):
+    """Stable identifier of a class from its URL, a short hash when the URL has no ID"""
+    parts = urlsplit(url or '')
+    for key, values in parse_qs(parts.query).items():
+        if key.lower() in ID_PARAMETERS and values and values[0]:
+            return sanitize(values[0], 40)
+    numbers = re.findall(r'\d{3,}', parts.path + '?' + parts.query)
+    if numbers:
+        return numbers[-1]
+    return hashlib.sha1((url or '').encode('utf-8')).hexdigest()[:8]
+
+
+def base_name(url, title):
+    """Deterministic base filename: '<title>_<class id>'"""
+    return f"{sanitize(short_title(title)) or 'video'}_{class_id(url)}"
+
+
+def legacy_bases(titles):
+    """Base names earlier versions derived from a title alone, newest layout first.
+
+    The full page title sanitized, its short part sanitized, and the raw
+    listing title the first release used as it was.
+    """
+    bases = []
+    for title in titles:
+        if not title:
+            continue
+        for base in (sanitize(title), sanitize(short_title(title)), title.strip()):
+            if base and base not in bases and not any(c in base for c in INVALID_CHARACTERS):
+                bases.append(base)
+    return bases
+
+
+class NameIndex:
+    """Finished files and class base names per download folder, for O(1) skip checks.
+
+    Folders are listed once, on first use. A file counts as finished unless
+    an unfinished download sits next to it (.aria2 control file, .parts
+    folder) or is_complete says otherwise.
+
+    Base names depend only on the class's URL and title (see base_name), so
+    every caller and every run names a class the same, whatever order
+    classes are seen in. The class ID keeps classes with the same title
+    apart; two URLs with the same ID are the same class.
+
+    Older names had no class ID, so several classes can lead to the same
+    one. Every class claims the older names it may have had (claim(),
+    base_for()); a file under an older name is only taken over when a
+    single class claims it.
+    """
+
+    def __init__(self, is_complete=None):
+        self.is_complete = is_complete
+        self._lock = threading.Lock()
+        self._files = set()
+        self._scanned = set()
+        self._legacy = {}
+        # legacy base -> class IDs that may have written files under it
+        self._claims = {}
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def _scan(self, directory):
+        key = self._key(directory)
+        if key in self._scanned:
+            return
+        self._scanned.add(key)
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        names = {entry.name for entry in entries}
+        for entry in entries:
+            if not entry.is_file() or entry.name.endswith(('.aria2', '.part', '.tmp')):
+                continue
+            if entry.name + '.aria2' in names or entry.name + '.parts' in names:
+                continue
+            if self.is_complete is not None and not self.is_complete(entry.path):
+                continue
+            self._files.add(self._key(entry.path))
+
+    def exists(self, path):
+        with self._lock:
+            self._scan(os.path.dirname(path) or '.')
+            return self._key(path) in self._files
+
+    def add(self, path):
+        with self._lock:
+            self._files.add(self._key(path))
+
+    def discard(self, path):
+        with self._lock:
+            self._files.discard(self._key(path))
+
+    def _claim(self, url, titles):
+        owner = class_id(url)
+        bases = legacy_bases(titles)
+        for legacy in bases:
+            self._claims.setdefault(legacy, set()).add(owner)
+        return bases
+
+    def claim(self, url, titles):
+        """Register the older names of a class before it is processed, e.g. for every class of a listing"""
+        with self._lock:
+            self._claim(url, titles)
+
+    def base_for(self, url, title, legacy_titles=()):
+        """base_name() for a class; remembers the names older versions gave it, see legacy_path().
+
+        title should be the class name from the listing where the caller has
+        it, else the page's title: short_title() reduces both to the same text.
+        """
+        base = base_name(url, title)
+        with self._lock:
+            known = self._legacy.setdefault(base, [])
+            for legacy in self._claim(url, (title, *legacy_titles)):
+                if legacy != base and legacy not in known:
+                    known.append(legacy)
+        return base
+
+    def legacy_path(self, path):
+        """A finished file an older version saved for the same download under its old name, or None.
+
+        path is '<base>_<suffix>' with a base from base_for(), e.g.
+        'Physics_1234_720p.mp4' may have been saved as 'Physics_720p.mp4'.
+        An older name other classes claim too is ambiguous and never used.
+        """
+        directory, name = os.path.split(path)
+        base, _, suffix = name.rpartition('_')
+        with self._lock:
+            legacy = list(self._legacy.get(base, ()))
+            self._scan(directory or '.')
+            for old in legacy:
+                if len(self._claims.get(old, ())) != 1:
+                    continue
+                candidate = os.path.join(directory, f"{old}_{suffix}")
+                if self._key(candidate) in self._files:
+                    return candidate
+        return None
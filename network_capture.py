@@ -0,0 +1,111 @@
+import json
+import re
+import time
+from stream_engine import manifest_kind
+
+# Chrome has to be started with this capability for get_log('performance')
+LOGGING_PREFS = {'performance': 'ALL'}
+
+MEDIA_EXTENSIONS = re.compile(r'\.(mp4|m4v|webm|m3u8|mpd)$', re.IGNORECASE)
+PDF_EXTENSION = re.compile(r'\.pdf$', re.IGNORECASE)
+# Headers the download engines set themselves or that only make sense to Chrome
+SKIPPED_HEADERS = {'cookie', 'range', 'host', 'content-length', 'accept-encoding'}
+
+
+def classify(url, mime_type='', resource_type=''):
+    """'video', 'pdf' or None for anything else the page loaded"""
+    path = url.split('?', 1)[0]
+    mime_type = (mime_type or '').lower()
+    if mime_type == 'application/pdf' or PDF_EXTENSION.search(path):
+        return 'pdf'
+    if (mime_type.startswith('video/') or resource_type == 'Media'
+            or MEDIA_EXTENSIONS.search(path) or manifest_kind(url, mime_type)):
+        return 'video'
+    return None
+
+
+def clean_headers(headers):
+    return {name: value for name, value in (headers or {}).items()
+            if not name.startswith(':') and name.lower() not in SKIPPED_HEADERS}
+
+
+class NetworkCapture:
+    """Media and PDF requests a pooled Chrome made, read from its DevTools network log.
+
+    Reading the log drains it, so call reset() before loading the page whose
+    requests you want.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.requests = {}
+
+    def reset(self):
+        self.requests = {}
+        try:
+            self.driver.get_log('performance')
+        except Exception:
+            pass
+
+    def poll(self):
+        """Fold new log entries into self.requests, keyed by CDP request id"""
+        try:
+            entries = self.driver.get_log('performance')
+        except Exception:
+            return
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            method = message.get('method')
+            params = message.get('params', {})
+            request_id = params.get('requestId')
+            if not request_id:
+                continue
+
+            if method == 'Network.requestWillBeSent':
+                request = params.get('request', {})
+                record = self.requests.setdefault(request_id, {})
+                record.update({
+                    'url': request.get('url', ''),
+                    'method': request.get('method', 'GET'),
+                    'headers': {**request.get('headers', {}), **record.get('headers', {})},
+                    'resource_type': params.get('type', '')
+                })
+            elif method == 'Network.requestWillBeSentExtraInfo':
+                # The headers Chrome really sent, including Referer and Origin
+                record = self.requests.setdefault(request_id, {})
+                record['headers'] = {**record.get('headers', {}), **params.get('headers', {})}
+            elif method == 'Network.responseReceived':
+                response = params.get('response', {})
+                record = self.requests.setdefault(request_id, {})
+                record.setdefault('url', response.get('url', ''))
+                record['mime_type'] = response.get('mimeType', '')
+                record['status'] = response.get('status')
+                record['resource_type'] = params.get('type', record.get('resource_type', ''))
+
+    def found(self, kind):
+        """Captured requests of one kind as dicts with url and cleaned headers, in request order"""
+        results = []
+        seen = set()
+        for record in self.requests.values():
+            url = record.get('url', '')
+            if not url.startswith('http') or url in seen:
+                continue
+            if record.get('status') and record['status'] >= 400:
+                continue
+            if classify(url, record.get('mime_type'), record.get('resource_type')) == kind:
+                seen.add(url)
+                results.append({'url': url, 'headers': clean_headers(record.get('headers'))})
+        return results
+
+    def wait_for(self, kind, timeout=10, poll_interval=0.25):
+        """Poll the log until a request of the given kind shows up"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self.poll()
+            found = self.found(kind)
+            if found or time.monotonic() >= deadline:
+                return found
+            time.sleep(poll_interval)
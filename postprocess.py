@@ -0,0 +1,204 @@
+"""Optional work on finished files, run on a process pool next to the downloads.
+
+Nothing here touches the network. Videos get their moov atom moved to the
+front (ffmpeg -c copy -movflags +faststart) and a thumbnail; a subject's
+notes are joined into one PDF in class order. Jobs are submitted without
+waiting, so a slow remux never holds up the next transfer.
+
+Worker functions are module level so the pool can pickle them.
+"""
+import concurrent.futures
+import importlib.util
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from integrity import hash_file
+
+PYPDF_AVAILABLE = importlib.util.find_spec('pypdf') is not None
+
+
+def moov_before_mdat(filename):
+    """True if the MP4 index already comes before the media data"""
+    size = os.path.getsize(filename)
+    offset = 0
+    with open(filename, 'rb') as f:
+        while offset + 8 <= size:
+            f.seek(offset)
+            box_size, box_type = struct.unpack('>I4s', f.read(8))
+            if box_type == b'moov':
+                return True
+            if box_type == b'mdat':
+                return False
+            if box_size == 1:
+                box_size = struct.unpack('>Q', f.read(8))[0]
+            elif box_size == 0:
+                break
+            if box_size < 8:
+                break
+            offset += box_size
+    return False
+
+
+def faststart(filename):
+    """Rewrite an MP4 with its index up front, returns the new file's digest or None if untouched"""
+    if moov_before_mdat(filename):
+        return None
+    tmp = filename + '.faststart.mp4'
+    result = subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-i', filename,
+         '-map', '0', '-c', 'copy', '-movflags', '+faststart', tmp],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise RuntimeError(result.stderr.strip()[-300:] or f"ffmpeg exited with {result.returncode}")
+    os.replace(tmp, filename)
+    return hash_file(filename).digest()
+
+
+def thumbnail(filename, at=30):
+    """Save one frame as '<video>.jpg', from the start if the video is shorter than `at` seconds"""
+    output = os.path.splitext(filename)[0] + '.jpg'
+    if os.path.exists(output):
+        return output
+    for seek in (at, 0):
+        result = subprocess.run(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-ss', str(seek), '-i', filename,
+             '-frames:v', '1', '-vf', 'scale=640:-2', '-q:v', '4', output],
+            capture_output=True, text=True
+        )
+        if result.returncode == 0 and os.path.exists(output):
+            return output
+    raise RuntimeError(result.stderr.strip()[-300:] or "no frame could be extracted")
+
+
+def process_video(filename, thumbnails=True):
+    """faststart, then the thumbnail from the rewritten file, returns (digest, thumbnail path)"""
+    digest = faststart(filename)
+    try:
+        return digest, thumbnail(filename) if thumbnails else None
+    except RuntimeError:
+        # A missing thumbnail is no reason to lose the remux result
+        return digest, None
+
+
+def merge_pdfs(sources, output):
+    """Concatenate PDFs in the given order, with pypdf or the qpdf command line tool"""
+    tmp = output + '.tmp'
+    if PYPDF_AVAILABLE:
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for source in sources:
+            writer.append(source)
+        with open(tmp, 'wb') as f:
+            writer.write(f)
+        writer.close()
+    elif shutil.which('qpdf'):
+        result = subprocess.run(['qpdf', '--empty', '--pages', *sources, '--', tmp], capture_output=True, text=True)
+        # 3 means warnings only, the output is still written
+        if result.returncode not in (0, 3):
+            raise RuntimeError(result.stderr.strip()[-300:])
+    else:
+        raise RuntimeError("install pypdf (pip install pypdf) or qpdf to merge notes")
+    os.replace(tmp, output)
+    return output
+
+
+class PostProcessor:
+    """Fire-and-forget post-processing, enabled with 'post_process': true in config.json.
+
+    The pool is started on the first submit. Results are reported from the
+    pool's callback thread; a remuxed video is re-recorded with the
+    integrity index and the dedup store so later checks match the new file.
+    """
+
+    def __init__(self, config, console, integrity=None, dedup=None):
+        self.config = config
+        self.console = console
+        self.integrity = integrity
+        self.dedup = dedup
+        self.enabled = bool(config.get('post_process'))
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: the workers must not inherit Chrome drivers or the render thread
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.config.get('post_process_workers', 1),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def _submit(self, label, on_result, fn, *args):
+        future = self.pool.submit(fn, *args)
+        with self._lock:
+            self._pending.add(future)
+
+        def done(future):
+            with self._lock:
+                self._pending.discard(future)
+            try:
+                on_result(future.result())
+            except Exception as e:
+                self.console.print(f"[yellow]Post-processing skipped for {label}: {e}[/yellow]")
+
+        future.add_done_callback(done)
+        return future
+
+    def submit_video(self, filename):
+        """Queue faststart and a thumbnail for a finished MP4, returns at once"""
+        if not self.enabled or not filename.lower().endswith(('.mp4', '.m4v')):
+            return
+        if not shutil.which('ffmpeg'):
+            self.console.print("[yellow]ffmpeg not found, skipping post-processing[/yellow]")
+            self.enabled = False
+            return
+        name = os.path.basename(filename)
+
+        def processed(result):
+            digest, _ = result
+            if digest is None:
+                return
+            if self.integrity is not None:
+                entry = self.integrity.entry(filename)
+                self.integrity.record(filename, entry.get('url'), digest['size'], digest=digest, remote=entry.get('remote'))
+            if self.dedup is not None:
+                self.dedup.add(filename, digest['content_hash'])
+            self.console.print(f"[dim]⚡ {name} moved to faststart[/dim]")
+
+        self._submit(name, processed, process_video, filename, self.config.get('post_process_thumbnails', True))
+
+    def submit_merge(self, sources, output):
+        """Queue one PDF made of `sources` in order, skipped if it is already up to date"""
+        sources = [path for path in sources if os.path.exists(path)]
+        if not self.enabled or len(sources) < 2:
+            return
+        if os.path.exists(output):
+            newest = max(os.path.getmtime(path) for path in sources)
+            if os.path.getmtime(output) >= newest:
+                return
+        self._submit(
+            os.path.basename(output),
+            lambda path: self.console.print(f"[green]📚 Merged {len(sources)} notes into {os.path.basename(path)}[/green]"),
+            merge_pdfs, sources, output
+        )
+
+    def close(self):
+        """Let queued jobs finish, then stop the workers"""
+        with self._lock:
+            pool, pending = self._pool, len(self._pending)
+        if pool is None:
+            return
+        if pending:
+            self.console.print(f"[cyan]Waiting for {pending} post-processing jobs...[/cyan]")
+        pool.shutdown(wait=True)
+        with self._lock:
+            self._pool = None
@@ -0,0 +1,173 @@
+import heapq
+import threading
+import time
+from rich.console import Console, Group
+from rich.live import Live
+from rich.progress_bar import ProgressBar
+from rich.table import Table
+from rich.text import Text
+from throughput import ThroughputMeter, format_speed, format_eta
+
+
+def format_size(num_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024 or unit == 'GB':
+            return f"{num_bytes:.1f} {unit}" if unit != 'B' else f"{num_bytes} B"
+        num_bytes /= 1024
+
+
+class TaskRecord:
+    """Counters one worker updates, the render thread only reads them"""
+
+    __slots__ = ('description', 'total', 'completed', 'status', 'meter', 'started', 'updated')
+
+    def __init__(self, description, total=0, status=''):
+        self.description = description
+        self.total = total
+        self.completed = 0
+        self.status = status
+        self.meter = ThroughputMeter()
+        self.started = self.updated = time.monotonic()
+
+    @property
+    def speed(self):
+        return self.meter.speed
+
+    @property
+    def eta(self):
+        return self.meter.eta(self.total)
+
+
+class ProgressHub:
+    """One render thread for every transfer in the process.
+
+    Workers only bump counters on their TaskRecord. The screen is repainted
+    at a fixed frame rate with the top_n most recently active tasks and
+    totals for the rest, so drawing costs the same for 3 or 300 downloads.
+    The method names follow rich's Progress, so callers read the same.
+    With display off nothing is drawn and snapshot() is the only reader,
+    e.g. in shard workers whose parent draws the one view.
+    """
+
+    def __init__(self, console=None, fps=4, top_n=8, display=True):
+        self.console = console or Console()
+        self.display = display
+        self.interval = 1.0 / max(1, fps)
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._active = set()
+        self._thread = None
+        self._wake = threading.Event()
+        # Finished tasks are folded into these and then forgotten
+        self.finished = 0
+        self.failed = 0
+        self.finished_bytes = 0
+
+    def add_task(self, description, total=0, status=''):
+        task = TaskRecord(description, total, status)
+        with self._lock:
+            self._active.add(task)
+            if self._thread is None and self.display:
+                self._wake.clear()
+                self._thread = threading.Thread(target=self._render_loop, name='progress-hub', daemon=True)
+                self._thread.start()
+        return task
+
+    def update(self, task, completed=None, total=None, advance=None, status=None, description=None):
+        """Report progress in bytes, speed and ETA are worked out by the task's meter"""
+        now = time.monotonic()
+        if total is not None:
+            task.total = total
+        if completed is not None or advance is not None:
+            task.completed = completed if completed is not None else task.completed + advance
+            task.meter.update(task.completed, now)
+            # Real progress replaces a placeholder like "Queued"
+            task.status = '' if status is None else status
+        elif status is not None:
+            task.status = status
+        if description is not None:
+            task.description = description
+        task.updated = now
+
+    def finish(self, task, ok=True):
+        """Retire a task into the totals, the live view stops once none are left"""
+        with self._lock:
+            if task not in self._active:
+                return
+            self._active.discard(task)
+            if ok:
+                self.finished += 1
+                self.finished_bytes += task.completed
+            else:
+                self.failed += 1
+            idle = not self._active
+            thread = self._thread
+        if idle and thread is not None:
+            self._wake.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    @property
+    def active(self):
+        return len(self._active)
+
+    def total_speed(self):
+        """Combined bytes/s of every active transfer"""
+        with self._lock:
+            active = list(self._active)
+        return sum(task.speed for task in active)
+
+    def snapshot(self):
+        """Active tasks and totals as plain data, for callers that are not a terminal"""
+        with self._lock:
+            active = list(self._active)
+            finished, failed, finished_bytes = self.finished, self.failed, self.finished_bytes
+        return {
+            'active': [
+                {'description': task.description, 'total': task.total or 0, 'completed': task.completed,
+                 'status': task.status, 'speed': task.speed, 'eta': task.eta}
+                for task in sorted(active, key=lambda t: t.started)
+            ],
+            'finished': finished,
+            'failed': failed,
+            'finished_bytes': finished_bytes,
+            'speed': sum(task.speed for task in active)
+        }
+
+    def _render_loop(self):
+        with Live(self._render(), console=self.console, auto_refresh=False, transient=True) as live:
+            while not self._wake.wait(self.interval):
+                live.update(self._render(), refresh=True)
+        with self._lock:
+            self._thread = None
+            # A task added while the view was shutting down needs a new thread
+            if self._active:
+                self._wake.clear()
+                self._thread = threading.Thread(target=self._render_loop, name='progress-hub', daemon=True)
+                self._thread.start()
+
+    def _render(self):
+        with self._lock:
+            active = list(self._active)
+            finished, failed, finished_bytes = self.finished, self.failed, self.finished_bytes
+
+        shown = heapq.nlargest(self.top_n, active, key=lambda t: t.updated)
+        table = Table.grid(padding=(0, 1))
+        for task in shown:
+            total = task.total or 0
+            percent = f"{task.completed * 100 / total:>3.0f}%" if total else "  ?%"
+            table.add_row(
+                Text(task.description[:40], overflow='ellipsis', no_wrap=True),
+                ProgressBar(total=total or None, completed=task.completed, width=30),
+                percent,
+                Text(task.status or f"{format_speed(task.speed)} • ETA {format_eta(task.eta)}", style='cyan')
+            )
+
+        done_bytes = finished_bytes + sum(t.completed for t in active)
+        summary = f"[bold]{len(active)} active[/bold] • {finished} done"
+        if failed:
+            summary += f" • [red]{failed} failed[/red]"
+        summary += f" • {format_size(done_bytes)} • {format_speed(sum(t.speed for t in active))}"
+        if len(active) > len(shown):
+            summary += f" • {len(active) - len(shown)} more not shown"
+        return Group(table, Text.from_markup(summary))
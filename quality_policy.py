@@ -0,0 +1,177 @@
+import re
+
+
+STANDARD_HEIGHTS = [360, 480, 720, 1080]
+# Without a size budget, 'efficient' may pay this much more per line of
+# resolution than the cheapest source does
+EFFICIENT_SLACK = 1.5
+
+POLICY_PRESETS = [
+    'best',
+    'max 1080p',
+    'max 720p',
+    'max 480p',
+    'smallest over 480p',
+    'best bitrate per MB',
+    'best under 500MB',
+]
+
+
+class QualityPolicy:
+    """Resolve a declared quality policy against one class's own sources.
+
+    Modes:
+        best      - highest resolution available
+        max       - highest resolution not above `height`
+        min       - smallest resolution not below `height`
+        nearest   - resolution closest to `height` (ties go to the higher one)
+        efficient - highest resolution within a size budget (`budget` bytes),
+                    or without one, whose MB per line of resolution stays
+                    within EFFICIENT_SLACK of the cheapest source's
+    """
+
+    MODES = ('best', 'max', 'min', 'nearest', 'efficient')
+
+    def __init__(self, mode='best', height=None, budget=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown quality mode: {mode}")
+        if mode in ('max', 'min', 'nearest') and not height:
+            raise ValueError(f"Quality mode '{mode}' needs a resolution")
+        self.mode = mode
+        self.height = int(height) if height else None
+        self.budget = int(budget) if budget else None
+
+    @classmethod
+    def parse(cls, text):
+        """Parse strings like 'max 720p', 'smallest over 480p', '720', 'best bitrate per MB', 'best under 500MB'"""
+        text = (text or '').strip().lower()
+        if not text or text == 'best':
+            return cls('best')
+        if 'per mb' in text or text in ('efficient', 'bitrate'):
+            return cls('efficient')
+        budget = re.search(r'(?:under|within|below|<)\s*(\d+(?:\.\d+)?)\s*(mb|gb)', text)
+        if budget:
+            return cls('efficient', budget=float(budget.group(1)) * 1024 ** (2 if budget.group(2) == 'mb' else 3))
+
+        match = re.search(r'(\d{3,4})', text)
+        height = int(match.group(1)) if match else None
+        if height is None:
+            raise ValueError(f"Could not understand quality policy: {text}")
+
+        if text.startswith(('max', 'up to', 'at most', '<=')):
+            return cls('max', height)
+        if text.startswith(('min', 'smallest', 'at least', '>=')):
+            return cls('min', height)
+        return cls('nearest', height)
+
+    def __str__(self):
+        if self.mode == 'best':
+            return 'best'
+        if self.mode == 'efficient':
+            return f'best under {self.budget // (1024 * 1024)}MB' if self.budget else 'best bitrate per MB'
+        if self.mode == 'min':
+            return f'smallest over {self.height}p'
+        return f'{self.mode} {self.height}p'
+
+    @property
+    def max_height(self):
+        """Ceiling for sources that choose their own variant (HLS/DASH manifests), None for none"""
+        return self.height if self.mode == 'max' else None
+
+    def pick(self, candidates):
+        """Pick from (height, size_bytes, item) tuples, size may be 0 when unknown"""
+        candidates = [c for c in candidates if c[0]]
+        if not candidates:
+            return None
+
+        if self.mode == 'best':
+            return max(candidates, key=lambda c: (c[0], -(c[1] or 0)))[2]
+
+        if self.mode == 'max':
+            fitting = [c for c in candidates if c[0] <= self.height]
+            if fitting:
+                return max(fitting, key=lambda c: (c[0], -(c[1] or 0)))[2]
+            # Nothing small enough, take the smallest there is
+            return min(candidates, key=lambda c: (c[0], c[1] or 0))[2]
+
+        if self.mode == 'min':
+            fitting = [c for c in candidates if c[0] >= self.height]
+            if fitting:
+                return min(fitting, key=lambda c: (c[0], c[1] or 0))[2]
+            return max(candidates, key=lambda c: (c[0], -(c[1] or 0)))[2]
+
+        if self.mode == 'nearest':
+            return min(candidates, key=lambda c: (abs(c[0] - self.height), -c[0], c[1] or 0))[2]
+
+        # efficient: unknown sizes fall back to best
+        sized = [c for c in candidates if c[1]]
+        if not sized:
+            return max(candidates, key=lambda c: c[0])[2]
+        if self.budget:
+            fitting = [c for c in sized if c[1] <= self.budget]
+            if not fitting:
+                # Nothing fits, the smallest file overshoots the least
+                return min(sized, key=lambda c: c[1])[2]
+        else:
+            cheapest = min(c[1] / c[0] for c in sized)
+            fitting = [c for c in sized if c[1] / c[0] <= cheapest * EFFICIENT_SLACK]
+        return max(fitting, key=lambda c: (c[0], -c[1]))[2]
+
+    def select_direct(self, video_sources, size_lookup=None):
+        """Choose one ('direct', url, resolution) source, size_lookup(url) is only used when needed"""
+        candidates = []
+        for source in video_sources:
+            if source[0] != 'direct':
+                continue
+            try:
+                height = int(source[2])
+            except (TypeError, ValueError, IndexError):
+                continue
+            size = 0
+            if self.mode == 'efficient' and size_lookup:
+                size = size_lookup(source[1]) or 0
+            candidates.append((height, size, source))
+        return self.pick(candidates)
+
+    def select_youtube_format(self, formats):
+        """Choose what yt-dlp downloads: the best video-only stream the policy allows plus the best audio.
+
+        YouTube serves progressive (video with sound) formats at 360p only, so
+        those are the fallback when a video has no separate streams. mp4/m4a
+        are preferred, they merge into an mp4 without re-encoding.
+        """
+        def size(f):
+            return f.get('filesize') or f.get('filesize_approx') or 0
+
+        def mp4_first(pool, ext):
+            return [f for f in pool if f.get('ext') == ext] or pool
+
+        video_only = mp4_first([f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') == 'none'
+                                and f.get('height')], 'mp4')
+        audio_only = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')]
+        if video_only and audio_only:
+            audio = max(mp4_first(audio_only, 'm4a'), key=lambda f: (f.get('abr') or f.get('tbr') or 0, size(f)))
+            video = self.pick([(f['height'], size(f) and size(f) + size(audio), f) for f in video_only])
+            if video is not None:
+                # The shape yt-dlp documents for a merged pick of a custom format selector
+                return {
+                    'format_id': f"{video['format_id']}+{audio['format_id']}",
+                    'ext': 'mp4' if video.get('ext') == 'mp4' and audio.get('ext') == 'm4a' else 'mkv',
+                    'requested_formats': [video, audio],
+                    'protocol': f"{video.get('protocol')}+{audio.get('protocol')}",
+                }
+
+        progressive = [
+            f for f in formats
+            if f.get('vcodec') != 'none' and f.get('acodec') != 'none' and f.get('height')
+        ]
+        candidates = [(f.get('height', 0), size(f), f) for f in mp4_first(progressive, 'mp4')]
+        return self.pick(candidates)
+
+    def as_ytdlp_selector(self):
+        """Return a callable usable as yt-dlp's 'format' option, evaluated per video"""
+        def selector(ctx):
+            chosen = self.select_youtube_format(ctx.get('formats', []))
+            if chosen:
+                yield chosen
+        return selector
@@ -0,0 +1,165 @@
+import threading
+import time
+from rich.console import Console
+from lazy import lazy_import
+
+requests = lazy_import('requests')
+
+BASE_URL = "https://online.utkorsho.tech"
+SITE_DOMAIN = "online.utkorsho.tech"
+PROBE_URL = f"{BASE_URL}/Routine/PastClasses"
+
+
+def parse_cookie_string(cookies_string):
+    cookies = {}
+    for cookie in (cookies_string or '').split(';'):
+        if cookie.strip():
+            try:
+                key, value = cookie.strip().split('=', 1)
+                cookies[key] = value
+            except ValueError:
+                continue
+    return cookies
+
+
+class SessionManager:
+    """One cookie jar shared by the HTTP session and every browser in the driver pool"""
+
+    def __init__(self, config, console=None, cookies_file='cookies.txt', fixtures=None):
+        self.config = config
+        self.console = console or Console()
+        # FixtureArchive when recording or replaying, see fixtures.py
+        self.fixtures = fixtures
+        self.cookies_file = cookies_file
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._session = None
+        self._egress = None
+        self._loaded_from = None
+        self._last_probe = None
+
+    @property
+    def egress(self):
+        """EgressPool of the configured routes, shared with aria2 and yt-dlp (see egress.py)"""
+        if self._egress is None:
+            with self._lock:
+                if self._egress is None:
+                    from egress import EgressPool
+                    self._egress = EgressPool(self.config, self.console)
+        return self._egress
+
+    @property
+    def session(self):
+        """The shared requests.Session, created on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    session.headers.update(self.config['headers'])
+                    pool_size = max(10, self.config['max_parallel_downloads'] * 4)
+                    if self.fixtures is not None:
+                        from fixtures import FixtureAdapter
+                        adapter = FixtureAdapter(self.fixtures, pool_connections=pool_size, pool_maxsize=pool_size)
+                    elif self.egress.enabled:
+                        from egress import EgressAdapter
+                        adapter = EgressAdapter(self.egress, pool_size)
+                    else:
+                        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.hooks['response'].append(self._on_response)
+                    self._session = session
+        return self._session
+
+    def load(self, cookies_string):
+        """Parse a raw cookie string into the jar, a no-op when it is the one already loaded.
+
+        Values refreshed later by the site stay in the jar, callers that keep
+        passing the original string around do not reset them.
+        """
+        with self._lock:
+            if cookies_string == self._loaded_from:
+                return
+            jar = self.session.cookies
+            jar.clear()
+            for name, value in parse_cookie_string(cookies_string).items():
+                # Same key as the site's own Set-Cookie, so refreshes replace them
+                jar.set(name, value, domain=SITE_DOMAIN, path='/')
+            self._loaded_from = cookies_string
+            self._last_probe = None
+            self.generation += 1
+
+    def cookies_dict(self, cookies_string=None):
+        if cookies_string is not None:
+            self.load(cookies_string)
+        with self._lock:
+            return {cookie.name: cookie.value for cookie in self.session.cookies}
+
+    def cookie_string(self):
+        return '; '.join(f"{k}={v}" for k, v in self.cookies_dict().items())
+
+    def save(self):
+        try:
+            with open(self.cookies_file, 'w') as f:
+                f.write(self.cookie_string())
+        except OSError as e:
+            self.console.print(f"[red]Failed to save cookies: {str(e)}[/red]")
+
+    def probe(self, max_age=300):
+        """Cheap authenticated request to check the cookies before any scraping starts"""
+        if self._last_probe and time.time() - self._last_probe[0] < max_age:
+            return self._last_probe[1]
+        try:
+            response = self.session.get(PROBE_URL, timeout=15)
+            valid = response.ok and 'login' not in response.url.lower()
+        except Exception as e:
+            self.console.print(f"[yellow]Could not check cookies: {str(e)}[/yellow]")
+            # Network trouble says nothing about the cookies themselves
+            return True
+        self._last_probe = (time.time(), valid)
+        return valid
+
+    def _on_response(self, response, *args, **kwargs):
+        # requests already stores Set-Cookie values in the jar, we only have to
+        # pass them on to the browsers and keep cookies.txt current
+        if 'set-cookie' in response.headers and SITE_DOMAIN in response.url:
+            with self._lock:
+                self.generation += 1
+            self.save()
+        elif 'login' in response.url.lower() and SITE_DOMAIN in response.url:
+            self._last_probe = (time.time(), False)
+            self.console.print("[red]Session expired, the site redirected to the login page. Please update your cookies.[/red]")
+
+    def apply_to_driver(self, driver):
+        """Put the whole jar into a browser, in one CDP call where available"""
+        cookies = self.cookies_dict()
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setCookies', {'cookies': [
+                {'name': name, 'value': value, 'domain': SITE_DOMAIN, 'path': '/', 'secure': True}
+                for name, value in cookies.items()
+            ]})
+        except Exception:
+            # Not a Chromium driver, fall back to one add_cookie per cookie
+            driver.get(BASE_URL)
+            for name, value in cookies.items():
+                driver.add_cookie({'name': name, 'value': value})
+
+    def absorb_driver(self, driver):
+        """Pick up cookies the site refreshed inside a browser"""
+        try:
+            browser_cookies = driver.get_cookies()
+        except Exception:
+            return
+        with self._lock:
+            jar = self.session.cookies
+            current = {cookie.name: cookie.value for cookie in jar}
+            changed = False
+            for cookie in browser_cookies:
+                if SITE_DOMAIN.endswith(cookie.get('domain', '').lstrip('.')) and current.get(cookie['name']) != cookie['value']:
+                    jar.set(cookie['name'], cookie['value'], domain=SITE_DOMAIN, path='/')
+                    changed = True
+            if changed:
+                self.generation += 1
+        if changed:
+            self.save()
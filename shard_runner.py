@@ -0,0 +1,358 @@
+"""Run a class catalogue across several worker processes or machines.
+
+Classes are split into shards by a stable hash of their URL. Every worker
+takes a lock file in the shared download folder before touching a class,
+so workers on different hosts that share the library never download the
+same class twice. Each worker writes its own report, and the reports are
+merged at the end.
+
+Workers share the library's SQLite indexes (.integrity.sqlite3,
+.dedup.sqlite3, see integrity.py and dedup.py), run their own aria2c on
+their own RPC port and draw nothing themselves: their output and progress
+go to the parent, which shows one view for the whole host.
+
+    python shard_runner.py catalogue.json --shards 8
+    python shard_runner.py catalogue.json --shards 8 --only 0,1,2,3   # on host A
+    python shard_runner.py catalogue.json --shards 8 --only 4,5,6,7   # on host B
+    python shard_runner.py catalogue.json --merge-only
+"""
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from rich.console import Console, Group
+from rich.live import Live
+from rich.table import Table
+from rich.text import Text
+from progress_hub import format_size
+from throughput import format_speed
+
+LOCK_DIR = '.locks'
+REPORT_DIR = '.shards'
+STALE_LOCK_SECONDS = 6 * 60 * 60
+PROGRESS_INTERVAL = 1.0
+
+
+def class_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def shard_of(url, shards):
+    """Stable across processes and hosts, unlike the built-in hash()"""
+    return int(class_key(url)[:8], 16) % shards
+
+
+def process_alive(pid):
+    """Whether a process of this host still runs; unknown counts as alive"""
+    if not pid:
+        return True
+    if sys.platform == 'win32':
+        # os.kill(pid, 0) would send CTRL_C_EVENT there, ask the process table instead
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            # ERROR_INVALID_PARAMETER: no such process; anything else (access denied) means it exists
+            return kernel32.GetLastError() != 87
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class ClassLock:
+    """Lock file per class in the shared library, created atomically with O_EXCL"""
+
+    def __init__(self, library_path, url):
+        self.dir = os.path.join(library_path, LOCK_DIR)
+        key = class_key(url)
+        self.lock_path = os.path.join(self.dir, f"{key}.lock")
+        self.done_path = os.path.join(self.dir, f"{key}.done")
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def is_done(self):
+        return os.path.exists(self.done_path)
+
+    def _is_stale(self):
+        try:
+            with open(self.lock_path, 'r') as f:
+                owner = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if time.time() - owner.get('time', 0) > STALE_LOCK_SECONDS:
+            return True
+        # A dead process on this host will never release its lock
+        return owner.get('host') == socket.gethostname() and not process_alive(owner.get('pid'))
+
+    def acquire(self):
+        os.makedirs(self.dir, exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if self._is_stale():
+                    try:
+                        os.remove(self.lock_path)
+                    except OSError:
+                        pass
+                    continue
+                return False
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time()}, f)
+            return True
+        return False
+
+    def release(self, done):
+        if done:
+            with open(self.done_path, 'w') as f:
+                json.dump({'owner': self.owner, 'time': time.time()}, f)
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+
+class ShardOutput:
+    """Stands in for a worker's stdout/stderr and sends whole lines to the parent"""
+
+    def __init__(self, events, shard_index):
+        self.events = events
+        self.shard_index = shard_index
+        self._buffer = ''
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            self._buffer += text
+            *lines, self._buffer = self._buffer.split('\n')
+        for line in lines:
+            self.events.put(('output', self.shard_index, line))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        # The parent's terminal shows it, so keep rich's colours
+        return True
+
+
+def report_progress(events, shard_index, progress, stop):
+    while not stop.wait(PROGRESS_INTERVAL):
+        events.put(('progress', shard_index, progress.snapshot()))
+
+
+def run_shard(shard_index, shards, catalogue_path, options, events=None):
+    """Worker process body, downloads every class of one shard"""
+    if events is not None:
+        # Before anything creates a console or a log handler on the real streams
+        sys.stdout = sys.stderr = ShardOutput(events, shard_index)
+    from catalogue import load_catalogue
+    from quality_policy import QualityPolicy
+    from video_downloader import VideoDownloader
+
+    downloader = VideoDownloader(overrides={
+        # Every worker on a host runs its own aria2c, each needs its own port
+        'aria2_rpc_port': options['aria2_rpc_port'] + shard_index,
+        'progress_display': events is None
+    })
+    downloader.driver_pool.size = options['drivers_per_worker']
+    console = downloader.console
+    stop = threading.Event()
+    if events is not None:
+        threading.Thread(target=report_progress, args=(events, shard_index, downloader.progress, stop),
+                         daemon=True).start()
+    library = downloader.config['download_path']
+
+    cookies = downloader.load_cookies()
+    policy = QualityPolicy.parse(options['policy'])
+    catalogue = load_catalogue(catalogue_path)['classes']
+    # Every class of the catalogue, not just this shard's, so older names two classes share are left alone
+    for class_info in catalogue:
+        downloader.names.claim(class_info['url'], (class_info.get('title'),))
+    classes = [c for c in catalogue if shard_of(c['url'], shards) == shard_index]
+
+    report = {
+        'host': socket.gethostname(),
+        'shard': shard_index,
+        'shards': shards,
+        'started_at': time.time(),
+        'downloaded': [],
+        'failed': [],
+        'skipped': []
+    }
+    for class_info in classes:
+        lock = ClassLock(library, class_info['url'])
+        if lock.is_done() or not lock.acquire():
+            report['skipped'].append(class_info['url'])
+            continue
+        ok = False
+        try:
+            console.print(f"[yellow][shard {shard_index}] Processing: {class_info['title']}[/yellow]")
+            ok = downloader.process_class_page_with_preferences(
+                cookies, class_info['url'],
+                use_youtube=options['use_youtube'],
+                quality_policy=policy,
+                title=class_info.get('title')
+            )
+        except Exception as e:
+            console.print(f"[red][shard {shard_index}] {str(e)}[/red]")
+        finally:
+            lock.release(done=ok)
+        report['downloaded' if ok else 'failed'].append(class_info['url'])
+
+    report['finished_at'] = time.time()
+    write_report(library, report)
+    downloader.driver_pool.close_all()
+    stop.set()
+    return report
+
+
+class ShardDisplay:
+    """The one live view of a host's workers, fed by their output and progress snapshots"""
+
+    def __init__(self, console, events):
+        self.console = console
+        self.events = events
+        self.progress = {}
+
+    def run(self, workers):
+        """Show everything the workers send until the last one has exited"""
+        with Live(self._render(), console=self.console, auto_refresh=False, transient=True) as live:
+            while True:
+                try:
+                    kind, shard_index, data = self.events.get(timeout=PROGRESS_INTERVAL / 4)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        break
+                    continue
+                if kind == 'output':
+                    live.console.print(Text.from_ansi(data))
+                else:
+                    self.progress[shard_index] = data
+                live.update(self._render(), refresh=True)
+
+    def _render(self):
+        table = Table.grid(padding=(0, 2))
+        for shard_index, data in sorted(self.progress.items()):
+            current = data['active'][0] if data['active'] else None
+            table.add_row(
+                f"[bold]shard {shard_index}[/bold]",
+                f"{len(data['active'])} active • {data['finished']} done" +
+                (f" • [red]{data['failed']} failed[/red]" if data['failed'] else ''),
+                f"{format_size(data['finished_bytes'] + sum(t['completed'] for t in data['active']))}",
+                f"[cyan]{format_speed(data['speed'])}[/cyan]",
+                Text(current['description'][:40], overflow='ellipsis', no_wrap=True) if current else ''
+            )
+        speed = sum(data['speed'] for data in self.progress.values())
+        return Group(table, Text.from_markup(f"[bold]{len(self.progress)} workers[/bold] • {format_speed(speed)}"))
+
+
+def write_report(library, report):
+    report_dir = os.path.join(library, REPORT_DIR)
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"report-{report['host']}-{report['shard']}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def merge_reports(library):
+    merged = {'downloaded': [], 'failed': [], 'skipped': [], 'shards': []}
+    for path in sorted(glob.glob(os.path.join(library, REPORT_DIR, 'report-*.json'))):
+        with open(path, 'r') as f:
+            report = json.load(f)
+        merged['shards'].append({
+            'host': report['host'],
+            'shard': report['shard'],
+            'seconds': round(report.get('finished_at', 0) - report['started_at'], 1),
+            'downloaded': len(report['downloaded']),
+            'failed': len(report['failed'])
+        })
+        for key in ('downloaded', 'failed', 'skipped'):
+            merged[key].extend(report[key])
+
+    # A class skipped by one worker because another one was busy with it
+    # shows up as downloaded or failed in that other worker's report
+    finished = set(merged['downloaded'])
+    merged['failed'] = sorted(set(merged['failed']) - finished)
+    merged['skipped'] = sorted(set(merged['skipped']) - finished - set(merged['failed']))
+    merged['downloaded'] = sorted(finished)
+    return merged
+
+
+def print_report(console, merged):
+    console.print("\n[yellow]╭─── Shard Report ───╮[/yellow]")
+    for shard in merged['shards']:
+        console.print(f"[cyan]│ {shard['host']} #{shard['shard']}: {shard['downloaded']} ok, "
+                      f"{shard['failed']} failed in {shard['seconds']}s[/cyan]")
+    console.print(f"[green]│ Downloaded: {len(merged['downloaded'])}[/green]")
+    console.print(f"[red]│ Failed: {len(merged['failed'])}[/red]")
+    console.print(f"[cyan]│ Skipped (already done elsewhere): {len(merged['skipped'])}[/cyan]")
+    console.print("[yellow]╰────────────────────╯[/yellow]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded catalogue downloader")
+    parser.add_argument('catalogue', help="catalogue file from master_downloader.py --discover")
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--only', help="comma-separated shard numbers to run on this host")
+    parser.add_argument('--policy', default='best', help="quality policy, e.g. 'max 720p'")
+    parser.add_argument('--youtube', action='store_true', help="prefer the YouTube version")
+    parser.add_argument('--drivers-per-worker', type=int, default=1,
+                        help="browsers per worker, one is enough since sources come from the page's network log")
+    parser.add_argument('--merge-only', action='store_true', help="only merge existing reports")
+    args = parser.parse_args()
+
+    console = Console()
+    config = {}
+    if os.path.exists('config.json'):
+        with open('config.json', 'r') as f:
+            config = json.load(f)
+    library = config.get('download_path', 'downloads')
+
+    if not args.merge_only:
+        shard_ids = [int(x) for x in args.only.split(',')] if args.only else list(range(args.shards))
+        options = {
+            'policy': args.policy,
+            'use_youtube': args.youtube,
+            'drivers_per_worker': args.drivers_per_worker,
+            # Above the port an interactive run on the same host uses
+            'aria2_rpc_port': config.get('aria2_rpc_port', 6800) + 1
+        }
+        # spawn gives every worker a clean interpreter, no inherited browsers or sockets
+        ctx = multiprocessing.get_context('spawn')
+        events = ctx.Queue()
+        workers = [
+            ctx.Process(target=run_shard, args=(i, args.shards, args.catalogue, options, events), name=f"shard-{i}")
+            for i in shard_ids
+        ]
+        for worker in workers:
+            worker.start()
+        ShardDisplay(console, events).run(workers)
+        for worker in workers:
+            worker.join()
+            if worker.exitcode:
+                console.print(f"[red]{worker.name} exited with code {worker.exitcode}[/red]")
+
+    print_report(console, merge_reports(library))
+
+
+if __name__ == "__main__":
+    main()
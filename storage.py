@@ -0,0 +1,179 @@
+"""Free space, reservations and writer slots for the download roots.
+
+Every transfer reserves its expected size on the target volume before the
+first byte arrives, so several parallel downloads cannot together overrun
+a disk that each alone would fit on. When a volume is short, reserve()
+waits until space is freed instead of failing halfway and deleting the
+partial file, for at most 'space_wait_timeout' seconds; after that the job
+fails with InsufficientSpace and is retried later like any other error.
+
+Output can be spread over several roots ('download_roots' in config.json).
+Each new file goes to the root with the most headroom, a file that already
+exists (finished or partial) stays where it is. Every device gets its own
+writer queue: a spinning disk takes one writer at a time so parallel
+downloads do not make its head seek between files, an SSD takes
+max_parallel_downloads.
+"""
+import contextlib
+import os
+import shutil
+import sys
+import threading
+import time
+from rich.console import Console
+
+
+class InsufficientSpace(OSError):
+    pass
+
+
+def existing_parent(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def is_rotational(device):
+    """True for a spinning disk, Linux only; everything else counts as solid state"""
+    if not sys.platform.startswith('linux'):
+        return False
+    major, minor = os.major(device), os.minor(device)
+    # A partition has no queue of its own, its parent disk does
+    for candidate in (f'/sys/dev/block/{major}:{minor}/queue/rotational',
+                      f'/sys/dev/block/{major}:{minor}/../queue/rotational'):
+        try:
+            with open(candidate) as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return False
+
+
+def ytdlp_size(info):
+    """Expected bytes of the formats yt-dlp picked, 0 when it does not say"""
+    formats = info.get('requested_formats') or [info]
+    return sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in formats)
+
+
+class StorageManager:
+    def __init__(self, config, console=None):
+        self.config = config
+        self.console = console or Console()
+        self.roots = config.get('download_roots') or [config['download_path']]
+        self.min_free = config.get('min_free_space', 1024 ** 3)
+        self.poll_interval = config.get('space_poll_interval', 30)
+        self.wait_timeout = config.get('space_wait_timeout', 3600)
+        self._lock = threading.Lock()
+        # device -> {token: (path, final size)} of the transfers in progress
+        self._reservations = {}
+        self._writers = {}
+
+    def device(self, path):
+        return os.stat(existing_parent(path)).st_dev
+
+    def _outstanding(self, device):
+        """Reserved bytes not on disk yet; a preallocated file has already taken its space"""
+        total = 0
+        for path, size in self._reservations.get(device, {}).values():
+            try:
+                written = os.path.getsize(path)
+            except OSError:
+                written = 0
+            total += max(0, size - written)
+        return total
+
+    def available(self, path):
+        """Bytes that may still be written to path's volume, after reservations and the safety margin"""
+        device = self.device(path)
+        with self._lock:
+            outstanding = self._outstanding(device)
+        return shutil.disk_usage(existing_parent(path)).free - outstanding - self.min_free
+
+    def _writer_slot(self, device, path):
+        with self._lock:
+            slot = self._writers.get(device)
+            if slot is None:
+                writers = self.config.get('writers_per_device') or (
+                    1 if is_rotational(device) else max(1, self.config.get('max_parallel_downloads', 3)))
+                slot = self._writers[device] = threading.BoundedSemaphore(writers)
+            return slot
+
+    def path_for(self, name, size=0, exists=os.path.exists):
+        """Where a download named `name` goes: its existing location, else the root with most room"""
+        if len(self.roots) == 1:
+            return os.path.join(self.roots[0], name)
+        candidates = [os.path.join(root, name) for root in self.roots]
+        for path in candidates:
+            if exists(path) or os.path.exists(path) or os.path.exists(path + '.aria2') or os.path.exists(path + '.parts'):
+                return path
+        return max(candidates, key=lambda path: self.available(path) - size)
+
+    def low(self):
+        """True when no root has room left above the safety margin"""
+        return all(self.available(root) <= 0 for root in self.roots)
+
+    def wait_for_space(self):
+        """Pause while every root is below the safety margin"""
+        announced = False
+        while self.low():
+            if not announced:
+                self.console.print(
+                    f"[red]Download folders are almost full (less than {self.min_free / 1024 ** 3:.1f} GB free), "
+                    f"paused until space is freed...[/red]"
+                )
+                announced = True
+            time.sleep(self.poll_interval)
+        if announced:
+            self.console.print("[green]Enough free space again, resuming[/green]")
+
+    @contextlib.contextmanager
+    def reserve(self, path, size=0):
+        """Hold `size` bytes and a writer slot on path's device for one transfer.
+
+        Bytes already on disk from an earlier attempt are not reserved twice.
+        Waits while the volume is short, raises InsufficientSpace if the file
+        could never fit or no room came free within wait_timeout seconds.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        device = self.device(path)
+        size = size or 0
+        existing = os.path.getsize(path) if os.path.exists(path) else 0
+        needed = max(0, size - existing)
+        if needed > shutil.disk_usage(existing_parent(path)).total:
+            raise InsufficientSpace(f"{os.path.basename(path)} needs {needed / 1024 ** 3:.1f} GB, more than the whole disk")
+
+        token = object()
+        announced = False
+        deadline = time.monotonic() + self.wait_timeout if self.wait_timeout else None
+        while True:
+            with self._lock:
+                free = shutil.disk_usage(existing_parent(path)).free - self._outstanding(device)
+                if not needed or free - self.min_free >= needed:
+                    self._reservations.setdefault(device, {})[token] = (path, size)
+                    break
+            if not announced:
+                self.console.print(
+                    f"[red]Not enough space for {os.path.basename(path)} "
+                    f"({needed / 1024 ** 3:.2f} GB needed, {max(0, free) / 1024 ** 3:.2f} GB free), "
+                    f"waiting for space...[/red]"
+                )
+                announced = True
+            if deadline is not None and time.monotonic() >= deadline:
+                raise InsufficientSpace(
+                    f"No room for {os.path.basename(path)} after waiting {self.wait_timeout} s "
+                    f"({needed / 1024 ** 3:.2f} GB needed, {max(0, free) / 1024 ** 3:.2f} GB free)"
+                )
+            time.sleep(self.poll_interval if deadline is None else
+                       max(0, min(self.poll_interval, deadline - time.monotonic())))
+
+        slot = self._writer_slot(device, path)
+        try:
+            with slot:
+                yield
+        finally:
+            with self._lock:
+                self._reservations[device].pop(token, None)
@@ -0,0 +1,414 @@
+"""Segmented stream (HLS / DASH) downloads.
+
+Segments are fetched concurrently over the shared session's connection pool
+into a `<output>.parts` folder next to the output file, then remuxed into
+one MP4 by ffmpeg without re-encoding. A segment only gets its final name
+once it is complete, so an interrupted download resumes from the segments
+that are already there. A playlist URL that only changed its query (a
+rotated signature) is planned again and keeps the segments whose source
+stayed the same; any other new plan starts from an empty folder.
+Segments keep their remote extension (.ts, .m4s, .aac, ...), ffmpeg's HLS
+demuxer refuses segments named after another format.
+
+HLS variants that take their audio from a separate #EXT-X-MEDIA rendition
+get that playlist too, and #EXT-X-BYTERANGE sub-ranges are fetched with
+Range requests into segments of their own.
+"""
+import concurrent.futures
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin, urlsplit
+
+from fast_io import stream_to_file
+
+HLS_CONTENT_TYPES = ('application/vnd.apple.mpegurl', 'application/x-mpegurl', 'audio/mpegurl')
+DASH_CONTENT_TYPES = ('application/dash+xml',)
+URI_ATTRIBUTE = re.compile(r'URI="([^"]+)"')
+BYTERANGE_ATTRIBUTE = re.compile(r',?BYTERANGE="[^"]*"')
+# Bumped whenever plan.json changes shape, an older plan is replaced
+PLAN_VERSION = 3
+SEGMENT_EXTENSIONS = ('.ts', '.mp4', '.m4s', '.m4v', '.m4a', '.aac', '.mp3', '.ac3', '.ec3', '.cmfv', '.cmfa',
+                      '.webm', '.vtt')
+
+
+def manifest_kind(url, content_type=None):
+    """'hls', 'dash' or None for a plain file"""
+    path = url.split('?', 1)[0].lower()
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if path.endswith('.m3u8') or content_type in HLS_CONTENT_TYPES:
+        return 'hls'
+    if path.endswith('.mpd') or content_type in DASH_CONTENT_TYPES:
+        return 'dash'
+    return None
+
+
+def segment_extension(url, default='.ts'):
+    """The media extension of a segment URL, default when it has none we know"""
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    return extension if extension in SEGMENT_EXTENSIONS else default
+
+
+def without_query(url):
+    """A URL without its query and fragment, where signed URLs keep their rotating tokens"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+def same_sources(old_plan, new_plan):
+    """True if every segment name of both plans still stands for the same remote bytes"""
+    def sources(plan):
+        return [(name, without_query(url), byterange) for name, url, byterange in plan['segments']]
+    return old_plan.get('kind') == new_plan.get('kind') and sources(old_plan) == sources(new_plan)
+
+
+def parse_attributes(text):
+    """Attribute list of an HLS tag, e.g. BANDWIDTH=800000,RESOLUTION=1280x720"""
+    attributes = {}
+    for match in re.finditer(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', text):
+        attributes[match.group(1)] = match.group(2).strip('"')
+    return attributes
+
+
+def parse_iso_duration(text):
+    """Seconds in an ISO 8601 duration like PT1H2M3.5S"""
+    match = re.match(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?)?', text or '')
+    if not match:
+        return 0.0
+    days, hours, minutes, seconds = (float(x) if x else 0.0 for x in match.groups())
+    return days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+
+def byte_range(spec, url, next_offset):
+    """[first, last] byte of an EXT-X-BYTERANGE 'length[@offset]', None without one.
+
+    Without an offset the range follows the previous one of the same URL,
+    next_offset keeps track of where that ended.
+    """
+    if not spec:
+        return None
+    length, _, offset = spec.partition('@')
+    start = int(offset) if offset else next_offset.get(url, 0)
+    next_offset[url] = start + int(length)
+    return [start, start + int(length) - 1]
+
+
+def expand_template(template, representation_id, bandwidth, number=None, time=None):
+    def substitute(match):
+        name, width = match.group(1), match.group(2)
+        value = {'RepresentationID': representation_id, 'Bandwidth': bandwidth,
+                 'Number': number, 'Time': time}.get(name)
+        if value is None:
+            return match.group(0)
+        return (width % int(value)) if width else str(value)
+    return re.sub(r'\$(RepresentationID|Bandwidth|Number|Time)(%0\d+d)?\$', substitute, template).replace('$$', '$')
+
+
+class StreamDownloader:
+    def __init__(self, config, sessions, progress, console):
+        self.config = config
+        self.sessions = sessions
+        self.progress = progress
+        self.console = console
+        self.workers = max(1, config.get('stream_concurrent_segments', 8))
+
+    def fetch_text(self, url, headers):
+        response = self.sessions.session.get(url, headers=headers, timeout=30)
+        response.raise_for_status()
+        return response.text, response.url
+
+    # -- HLS ---------------------------------------------------------------
+
+    def resolve_hls(self, url, headers, max_height=None):
+        """Follow a master playlist to its best variant.
+
+        Returns [(track, playlist text, playlist url)]: the variant as 'video'
+        and, when the variant's audio is a separate rendition, 'audio'.
+        """
+        text, url = self.fetch_text(url, headers)
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if not any(line.startswith('#EXT-X-STREAM-INF') for line in lines):
+            return [('video', text, url)]
+
+        renditions = {}
+        variants = []
+        for i, line in enumerate(lines):
+            if line.startswith('#EXT-X-MEDIA:'):
+                attributes = parse_attributes(line.split(':', 1)[1])
+                # Without a URI the audio is muxed into the variants themselves
+                if attributes.get('TYPE') == 'AUDIO' and attributes.get('URI'):
+                    renditions.setdefault(attributes.get('GROUP-ID'), []).append(attributes)
+            elif line.startswith('#EXT-X-STREAM-INF') and i + 1 < len(lines):
+                attributes = parse_attributes(line.split(':', 1)[1])
+                height = int(attributes.get('RESOLUTION', 'x0').split('x')[-1] or 0)
+                variants.append((height, int(attributes.get('BANDWIDTH', 0)), urljoin(url, lines[i + 1]),
+                                 attributes.get('AUDIO')))
+        fitting = [v for v in variants if not max_height or v[0] <= max_height] or variants
+        _, _, variant_url, audio_group = max(fitting, key=lambda v: (v[0], v[1]))
+        tracks = self.resolve_hls(variant_url, headers)
+
+        group = renditions.get(audio_group) or []
+        audio = next((r for r in group if r.get('DEFAULT') == 'YES'), group[0] if group else None)
+        if audio is not None:
+            audio_text, audio_url = self.fetch_text(urljoin(url, audio['URI']), headers)
+            tracks.append(('audio', audio_text, audio_url))
+        return tracks
+
+    def plan_hls(self, url, headers, max_height=None):
+        """Segments to fetch plus a local playlist per track that points at them"""
+        resources = []
+        playlists = []
+        for track, text, track_url in self.resolve_hls(url, headers, max_height):
+            local_lines = []
+            next_offset = {}
+            pending_range = None
+            for line in text.splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith('#EXT-X-BYTERANGE:'):
+                    # Applies to the next segment, which becomes a file of its own
+                    pending_range = line.split(':', 1)[1]
+                    continue
+                if line.startswith(('#EXT-X-KEY', '#EXT-X-MAP')) and 'URI="' in line:
+                    # Keys and init sections are fetched too, so ffmpeg never goes online
+                    remote = urljoin(track_url, URI_ATTRIBUTE.search(line).group(1))
+                    # An init section is media too, a key is just bytes
+                    extension = segment_extension(remote, '.bin') if line.startswith('#EXT-X-MAP') else '.bin'
+                    name = f"r{len(resources):05d}{extension}"
+                    spec = parse_attributes(line.split(':', 1)[1]).get('BYTERANGE')
+                    resources.append((name, remote, byte_range(spec, remote, next_offset)))
+                    line = BYTERANGE_ATTRIBUTE.sub('', URI_ATTRIBUTE.sub(f'URI="{name}"', line))
+                elif not line.startswith('#'):
+                    remote = urljoin(track_url, line)
+                    name = f"s{len(resources):05d}{segment_extension(remote)}"
+                    resources.append((name, remote, byte_range(pending_range, remote, next_offset)))
+                    pending_range = None
+                    line = name
+                local_lines.append(line)
+            playlists.append((f"{track}.m3u8", '\n'.join(local_lines) + '\n'))
+        return {'kind': 'hls', 'segments': resources, 'playlists': playlists}
+
+    # -- DASH --------------------------------------------------------------
+
+    def plan_dash(self, url, headers, max_height=None):
+        """Segments of the best video and audio representation of the first period"""
+        text, url = self.fetch_text(url, headers)
+        root = ET.fromstring(text)
+        ns = {'mpd': root.tag[1:].split('}')[0]} if root.tag.startswith('{') else {}
+        q = (lambda tag: f"mpd:{tag}") if ns else (lambda tag: tag)
+
+        def base(element, current):
+            base_url = element.find(q('BaseURL'), ns)
+            return urljoin(current, base_url.text.strip()) if base_url is not None and base_url.text else current
+
+        total_duration = parse_iso_duration(root.get('mediaPresentationDuration'))
+        base_url = base(root, url)
+        period = root.find(q('Period'), ns)
+        base_url = base(period, base_url)
+        duration = parse_iso_duration(period.get('duration')) or total_duration
+
+        tracks = {}
+        for adaptation in period.findall(q('AdaptationSet'), ns):
+            adaptation_base = base(adaptation, base_url)
+            for representation in adaptation.findall(q('Representation'), ns):
+                mime = representation.get('mimeType') or adaptation.get('mimeType') or ''
+                content = adaptation.get('contentType') or mime.split('/')[0]
+                if content not in ('video', 'audio'):
+                    continue
+                height = int(representation.get('height') or adaptation.get('height') or 0)
+                if content == 'video' and max_height and height > max_height:
+                    candidate_key = (0, -height, 0)
+                else:
+                    candidate_key = (1, height, int(representation.get('bandwidth') or 0))
+                if content not in tracks or candidate_key > tracks[content][0]:
+                    tracks[content] = (candidate_key, adaptation, representation, adaptation_base)
+
+        segments = []
+        track_files = []
+        for content, (_, adaptation, representation, adaptation_base) in sorted(tracks.items(), reverse=True):
+            prefix = content[0]
+            urls = self._dash_urls(adaptation, representation, base(representation, adaptation_base), duration, ns, q)
+            names = [f"{prefix}{i:05d}.m4s" for i in range(len(urls))]
+            segments.extend((name, segment_url, None) for name, segment_url in zip(names, urls))
+            track_files.append((f"{content}.mp4", names))
+        return {'kind': 'dash', 'segments': segments, 'tracks': track_files}
+
+    def _dash_urls(self, adaptation, representation, base_url, duration, ns, q):
+        rep_id = representation.get('id', '')
+        bandwidth = representation.get('bandwidth', '')
+        template = representation.find(q('SegmentTemplate'), ns)
+        if template is None:
+            template = adaptation.find(q('SegmentTemplate'), ns)
+        if template is not None:
+            urls = []
+            init = template.get('initialization')
+            if init:
+                urls.append(urljoin(base_url, expand_template(init, rep_id, bandwidth)))
+            media = template.get('media')
+            number = int(template.get('startNumber', 1))
+            timeline = template.find(q('SegmentTimeline'), ns)
+            if timeline is not None:
+                time = 0
+                for s in timeline.findall(q('S'), ns):
+                    time = int(s.get('t', time))
+                    for _ in range(int(s.get('r', 0)) + 1):
+                        urls.append(urljoin(base_url, expand_template(media, rep_id, bandwidth, number, time)))
+                        time += int(s.get('d'))
+                        number += 1
+            else:
+                timescale = int(template.get('timescale', 1))
+                seg_duration = int(template.get('duration')) / timescale
+                count = int(-(-duration // seg_duration))
+                for n in range(number, number + count):
+                    urls.append(urljoin(base_url, expand_template(media, rep_id, bandwidth, n)))
+            return urls
+
+        segment_list = representation.find(q('SegmentList'), ns)
+        if segment_list is not None:
+            urls = []
+            init = segment_list.find(q('Initialization'), ns)
+            if init is not None and init.get('sourceURL'):
+                urls.append(urljoin(base_url, init.get('sourceURL')))
+            urls.extend(urljoin(base_url, s.get('media')) for s in segment_list.findall(q('SegmentURL'), ns))
+            return urls
+
+        # SegmentBase: the whole track is one file at the BaseURL
+        return [base_url]
+
+    # -- download ------------------------------------------------------------
+
+    def plan(self, url, headers, kind=None, max_height=None):
+        kind = kind or manifest_kind(url)
+        if kind == 'dash':
+            return self.plan_dash(url, headers, max_height)
+        return self.plan_hls(url, headers, max_height)
+
+    def fetch_segment(self, url, path, headers, on_chunk, byterange=None):
+        tmp = path + '.part'
+        if byterange:
+            headers = {**headers, 'Range': f"bytes={byterange[0]}-{byterange[1]}"}
+        for attempt in range(self.config.get('max_retries', 3) + 1):
+            response = None
+            try:
+                started = time.monotonic()
+                with self.sessions.session.get(url, headers=headers, stream=True, timeout=60) as response:
+                    response.raise_for_status()
+                    if byterange and response.status_code != 206:
+                        # The whole resource instead of the sub-range would corrupt the stream
+                        raise IOError(f"server ignored the byte range of {url}")
+                    size = stream_to_file(response, tmp, on_chunk, 256 * 1024)
+                    # Each segment picks its route afresh, this scores the one it took
+                    self.sessions.egress.observe(response, size, time.monotonic() - started)
+                os.replace(tmp, path)
+                return size
+            except Exception:
+                if response is not None:
+                    self.sessions.egress.broken(response)
+                if attempt == self.config.get('max_retries', 3):
+                    raise
+
+    def download(self, url, filename, headers, progress=None, task=None, kind=None, max_height=None):
+        """Download a manifest into filename, returns True on success"""
+        if not shutil.which('ffmpeg'):
+            self.console.print("[red]ffmpeg is needed to join stream segments, please install it[/red]")
+            return False
+
+        progress = progress or self.progress
+        work_dir = filename + '.parts'
+        os.makedirs(work_dir, exist_ok=True)
+        plan_file = os.path.join(work_dir, 'plan.json')
+
+        # Resuming keeps the plan from the first run, the segment names must not shift
+        previous = plan = None
+        if os.path.exists(plan_file):
+            with open(plan_file, 'r') as f:
+                previous = json.load(f)
+            if previous.get('version') != PLAN_VERSION:
+                previous = None
+            elif previous.get('url') == url:
+                plan = previous
+        if plan is None:
+            plan = self.plan(url, headers, kind, max_height)
+            plan['url'] = url
+            plan['version'] = PLAN_VERSION
+            if previous is None or without_query(previous['url']) != without_query(url) \
+                    or not same_sources(previous, plan):
+                # Segments of another plan share names with this one's, none may be kept
+                shutil.rmtree(work_dir, ignore_errors=True)
+                os.makedirs(work_dir, exist_ok=True)
+            with open(plan_file, 'w') as f:
+                json.dump(plan, f)
+
+        segments = plan['segments']
+        pending = [segment for segment in segments if not os.path.exists(os.path.join(work_dir, segment[0]))]
+        done = len(segments) - len(pending)
+        done_bytes = sum(os.path.getsize(os.path.join(work_dir, name)) for name, _, _ in segments
+                         if os.path.exists(os.path.join(work_dir, name)))
+        if done:
+            self.console.print(f"[cyan]Resuming stream: {done}/{len(segments)} segments already there[/cyan]")
+
+        if task is not None:
+            progress.update(task, completed=done_bytes)
+
+        lock = threading.Lock()
+
+        def on_chunk(chunk):
+            if task is not None:
+                with lock:
+                    progress.update(task, advance=len(chunk))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.fetch_segment, seg_url, os.path.join(work_dir, name), headers, on_chunk,
+                                       byterange)
+                       for name, seg_url, byterange in pending]
+            for future in concurrent.futures.as_completed(futures):
+                done_bytes += future.result()
+                done += 1
+                # The real size is only known at the end, extrapolate from what arrived
+                if task is not None:
+                    progress.update(task, total=int(done_bytes / done * len(segments)))
+
+        if not self.remux(plan, work_dir, filename):
+            return False
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return True
+
+    def remux(self, plan, work_dir, filename):
+        """Join the segments into an MP4 with ffmpeg, stream copy only"""
+        tmp = filename + '.remux.mp4'
+        command = ['ffmpeg', '-y', '-loglevel', 'error']
+        if plan['kind'] == 'hls':
+            for playlist_name, playlist_text in plan['playlists']:
+                playlist = os.path.join(work_dir, playlist_name)
+                with open(playlist, 'w') as f:
+                    f.write(playlist_text)
+                command += ['-allowed_extensions', 'ALL', '-protocol_whitelist', 'file,crypto,data', '-i', playlist]
+            if len(plan['playlists']) > 1:
+                # Picture from the variant, sound from the separate rendition
+                command += ['-map', '0:v', '-map', '1:a']
+        else:
+            # fMP4 tracks are valid once the init segment and fragments are concatenated
+            for track_name, names in plan['tracks']:
+                with open(os.path.join(work_dir, track_name), 'wb') as out:
+                    for name in names:
+                        with open(os.path.join(work_dir, name), 'rb') as part:
+                            shutil.copyfileobj(part, out, 1024 * 1024)
+                command += ['-i', os.path.join(work_dir, track_name)]
+            for i in range(len(plan['tracks'])):
+                command += ['-map', str(i)]
+        command += ['-c', 'copy', '-movflags', '+faststart', tmp]
+
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            self.console.print(f"[red]ffmpeg could not join the stream: {result.stderr.strip()[-300:]}[/red]")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return False
+        os.replace(tmp, filename)
+        return True
@@ -0,0 +1,91 @@
+import io
+import os
+import pytest
+from rich.console import Console
+from dedup import DedupStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DedupStore({'download_path': str(tmp_path)}, Console(file=io.StringIO()))
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_identical_files_are_hardlinked(tmp_path, store):
+    first = write(tmp_path / 'a.mp4', b'same content' * 1000)
+    second = write(tmp_path / 'b.mp4', b'same content' * 1000)
+
+    assert store.add(first) == 0
+    assert store.add(second) == 12000
+    assert os.path.samefile(first, second)
+
+    duplicates, wasted, shared = store.report()
+    assert [sorted(paths) for paths in duplicates] == [sorted([first, second])]
+    assert (wasted, shared) == (0, 12000)
+
+
+def test_different_files_stay_separate(tmp_path, store):
+    first = write(tmp_path / 'a.mp4', b'one')
+    second = write(tmp_path / 'b.mp4', b'two')
+    store.add(first)
+    assert store.add(second) == 0
+    assert not os.path.samefile(first, second)
+    assert store.report() == ([], 0, 0)
+
+
+def test_a_refreshed_file_is_no_link_source_for_its_old_content(tmp_path, store):
+    first = write(tmp_path / 'a.mp4', b'old content')
+    store.add(first)
+    # Re-downloaded with new content: the row moves to the new hash
+    write(tmp_path / 'a.mp4', b'new content, longer')
+    store.add(first)
+
+    second = write(tmp_path / 'b.mp4', b'old content')
+    assert store.add(second) == 0
+    assert not os.path.samefile(first, second)
+
+
+def test_a_source_changed_behind_the_index_is_not_linked(tmp_path, store):
+    first = write(tmp_path / 'a.mp4', b'original')
+    store.add(first)
+    write(tmp_path / 'a.mp4', b'edited elsewhere')
+
+    second = write(tmp_path / 'b.mp4', b'original')
+    assert store.add(second) == 0
+    assert (tmp_path / 'a.mp4').read_bytes() == b'edited elsewhere'
+
+
+def test_a_source_edited_in_place_with_the_same_size_is_not_linked(tmp_path, store):
+    first = write(tmp_path / 'a.mp4', b'original')
+    store.add(first)
+    write(tmp_path / 'a.mp4', b'tampered')
+    stat = os.stat(first)
+    os.utime(first, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    second = write(tmp_path / 'b.mp4', b'original')
+    assert store.add(second) == 0
+    assert (tmp_path / 'b.mp4').read_bytes() == b'original'
+    # The edited file is indexed under what it holds now
+    third = write(tmp_path / 'c.mp4', b'tampered')
+    assert store.add(third) == len(b'tampered')
+    assert os.path.samefile(first, third)
+
+
+def test_scan_rebuilds_the_index_and_links_on_request(tmp_path, store):
+    folder = tmp_path / 'Physics'
+    folder.mkdir()
+    paths = [write(folder / f'{name}.mp4', b'duplicate') for name in ('x', 'y', 'z')]
+    write(folder / 'w.mp4.aria2', b'duplicate')
+
+    assert store.scan() == 0
+    duplicates, wasted, _ = store.report()
+    assert [sorted(group) for group in duplicates] == [sorted(paths)]
+    assert wasted == 2 * len(b'duplicate')
+
+    assert store.scan(link=True) == 2 * len(b'duplicate')
+    assert store.report()[1:] == (0, 2 * len(b'duplicate'))
+
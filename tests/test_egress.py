@@ -0,0 +1,33 @@
+import io
+import pytest
+from rich.console import Console
+from egress import EgressPool, Endpoint, NoRoute
+
+
+def pool(routes):
+    return EgressPool({'egress': routes}, Console(file=io.StringIO()))
+
+
+def test_aria2_only_speaks_plain_http_proxies():
+    assert Endpoint.parse('http://10.0.0.2:3128').aria2_options() == {'all-proxy': 'http://10.0.0.2:3128'}
+    assert Endpoint.parse('192.168.1.20').aria2_options() == {'interface': '192.168.1.20'}
+    assert Endpoint.parse('socks5://127.0.0.1:1080').aria2_options() is None
+    assert Endpoint.parse('https://proxy.example.com:443').aria2_options() is None
+
+
+def test_a_lease_no_route_can_serve_blames_no_route():
+    routes = pool(['socks5://127.0.0.1:1080'])
+    for _ in range(5):
+        with pytest.raises(NoRoute):
+            with routes.lease(accept=lambda e: e.aria2_capable):
+                pass
+    socks = routes.endpoints[0]
+    assert (socks.failures, socks.active, socks.cooldown_until) == (0, 0, 0.0)
+
+
+def test_lease_picks_among_accepted_routes_only():
+    routes = pool(['socks5://127.0.0.1:1080', 'http://10.0.0.2:3128'])
+    with routes.lease(accept=lambda e: e.aria2_capable) as endpoint:
+        assert endpoint.name == 'http://10.0.0.2:3128'
+    with pool([]).lease() as endpoint:
+        assert endpoint is None
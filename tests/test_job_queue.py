@@ -0,0 +1,93 @@
+import pytest
+from job_queue import JobQueue
+
+CLASS = 'https://online.utkorsho.tech/Routine/ClassDetails?id=101'
+OTHER = 'https://online.utkorsho.tech/Routine/ClassDetails?id=102'
+
+
+@pytest.fixture
+def queue(tmp_path):
+    jobs = JobQueue({'download_path': str(tmp_path), 'max_retries': 2, 'retry_backoff': 30})
+    yield jobs
+    jobs.close()
+
+
+def test_enqueue_is_idempotent_per_class_and_artifact(queue):
+    first = queue.enqueue(CLASS, 'video:direct', 'Class 1')
+    assert queue.enqueue(CLASS, 'video:direct', 'Class 1') == first
+    assert queue.enqueue(CLASS, 'note', 'Class 1') != first
+    assert queue.counts()['pending'] == 2
+
+
+def test_claim_class_takes_every_due_job_of_one_class(queue):
+    video = queue.enqueue(CLASS, 'video:direct', 'Class 1')
+    note = queue.enqueue(CLASS, 'note', 'Class 1')
+    queue.enqueue(OTHER, 'note', 'Class 2')
+
+    claimed = queue.claim_class()
+    assert {job['id'] for job in claimed} == {video, note}
+    assert queue.counts() == {'pending': 1, 'running': 2, 'done': 0, 'dead': 0, 'parked': 0}
+
+
+def test_failure_backs_off_then_goes_dead(queue):
+    job_id = queue.enqueue(CLASS, 'note', 'Class 1')
+    queue.claim_class()
+
+    assert queue.settle(job_id, False, "timeout") == 'pending'
+    # Backing off, not due yet
+    assert queue.claim_class() == []
+    assert queue.next_wakeup() > 0
+
+    queue.claim(job_id)
+    assert queue.settle(job_id, False, "timeout again") == 'dead'
+    assert [job['last_error'] for job in queue.dead_letters()] == ["timeout again"]
+
+    assert queue.retry_dead() == 1
+    assert queue.get(job_id)['attempts'] == 0
+
+
+def test_requeue_restarts_finished_jobs_only_when_asked(queue):
+    job_id = queue.enqueue(CLASS, 'note', 'Class 1')
+    queue.claim(job_id)
+    queue.settle(job_id, True)
+
+    queue.enqueue(CLASS, 'note', 'Class 1')
+    assert queue.get(job_id)['state'] == 'done'
+    queue.enqueue(CLASS, 'note', 'Class 1', requeue=True)
+    assert queue.get(job_id)['state'] == 'pending'
+
+
+def test_parked_jobs_are_skipped_until_unparked_or_queued_again(queue):
+    first = queue.enqueue(CLASS, 'note', 'Class 1', options={'policy': 'max'})
+    second = queue.enqueue(OTHER, 'note', 'Class 2')
+
+    assert queue.park() == 2
+    assert queue.claim_class() == []
+    assert queue.unfinished() == 2
+
+    # Queued again with other options: back to pending and takes them
+    queue.enqueue(CLASS, 'note', 'Class 1', options={'policy': 'max 720p'})
+    job = queue.get(first)
+    assert (job['state'], job['options']) == ('pending', {'policy': 'max 720p'})
+    assert queue.get(second)['state'] == 'parked'
+
+    assert queue.unpark() == 1
+    assert queue.get(second)['state'] == 'pending'
+
+
+def test_recover_returns_interrupted_jobs_to_pending(queue):
+    queue.enqueue(CLASS, 'note', 'Class 1')
+    queue.claim_class()
+    assert queue.recover() == 1
+    assert queue.counts()['pending'] == 1
+
+
+def test_changed_since_follows_an_updated_at_and_id_cursor(queue):
+    first = queue.enqueue(CLASS, 'note', 'Class 1')
+    second = queue.enqueue(OTHER, 'note', 'Class 2')
+    # Two changes within the same clock tick
+    queue._db.execute("UPDATE jobs SET updated_at = 100")
+
+    assert [job['id'] for job in queue.changed_since(99)] == [first, second]
+    assert [job['id'] for job in queue.changed_since(100, first)] == [second]
+    assert queue.changed_since(100, second) == []
@@ -0,0 +1,92 @@
+import os
+from naming import NameIndex, base_name, class_id, legacy_bases, sanitize, short_title
+
+URL = 'https://online.utkorsho.tech/Routine/ClassDetails?id=4521'
+TITLE = 'Physics Class ০৩ - Vectors: dot & cross'
+
+
+def test_sanitize_and_short_title():
+    assert sanitize('Class ০৩: "Vectors"  / part 2') == 'Class_03_Vectors_part_2'
+    assert sanitize('a' * 300) == 'a' * 200
+    assert short_title(TITLE) == 'Physics Class ০৩'
+    assert short_title(None) == ''
+
+
+def test_class_id_from_query_path_or_hash():
+    assert class_id(URL) == '4521'
+    assert class_id('https://online.utkorsho.tech/Routine/ClassDetails?RoutineClassId=77') == '77'
+    assert class_id('https://online.utkorsho.tech/Routine/Class/98765') == '98765'
+    hashed = class_id('https://online.utkorsho.tech/Routine/Class')
+    assert len(hashed) == 8 and hashed == class_id('https://online.utkorsho.tech/Routine/Class')
+
+
+def test_base_name_depends_only_on_url_and_short_title():
+    assert base_name(URL, TITLE) == 'Physics_Class_03_4521'
+    # The page title and the listing title of a class give the same name
+    assert base_name(URL, 'Physics Class ০৩') == base_name(URL, TITLE)
+    assert base_name(URL, None) == 'video_4521'
+
+
+def test_same_title_different_classes_stay_apart():
+    index = NameIndex()
+    first = index.base_for(URL, TITLE)
+    second = index.base_for(URL.replace('4521', '4522'), TITLE)
+    assert first != second
+    # Asked again in any order, a class keeps its name
+    assert index.base_for(URL, TITLE) == first
+
+
+def test_legacy_bases_newest_layout_first():
+    assert legacy_bases(['Physics Class 3 - Vectors', None]) == [
+        'Physics_Class_3_-_Vectors', 'Physics_Class_3', 'Physics Class 3 - Vectors'
+    ]
+    # A raw title with characters no file name can hold was never saved as is
+    assert legacy_bases([TITLE]) == ['Physics_Class_03_-_Vectors_dot_&_cross', 'Physics_Class_03']
+
+
+def test_index_skips_unfinished_files(tmp_path):
+    for name in ('done.mp4', 'partial.mp4', 'partial.mp4.aria2', 'stream.mp4', 'bad.mp4'):
+        (tmp_path / name).write_bytes(b'x')
+    (tmp_path / 'stream.mp4.parts').mkdir()
+    index = NameIndex(is_complete=lambda path: not path.endswith('bad.mp4'))
+
+    assert index.exists(str(tmp_path / 'done.mp4'))
+    for name in ('partial.mp4', 'stream.mp4', 'bad.mp4', 'missing.mp4'):
+        assert not index.exists(str(tmp_path / name))
+
+    index.add(str(tmp_path / 'missing.mp4'))
+    assert index.exists(str(tmp_path / 'missing.mp4'))
+    index.discard(str(tmp_path / 'done.mp4'))
+    assert not index.exists(str(tmp_path / 'done.mp4'))
+
+
+def test_legacy_path_finds_files_of_older_versions(tmp_path):
+    old = tmp_path / 'Physics_Class_03_720p.mp4'
+    old.write_bytes(b'x')
+    index = NameIndex()
+    base = index.base_for(URL, TITLE)
+
+    assert index.legacy_path(os.path.join(str(tmp_path), f"{base}_720p.mp4")) == str(old)
+    assert index.legacy_path(os.path.join(str(tmp_path), f"{base}_note.pdf")) is None
+    # Not a base this index handed out
+    assert index.legacy_path(os.path.join(str(tmp_path), 'Other_1_720p.mp4')) is None
+
+
+def test_an_older_name_two_classes_share_is_not_reused(tmp_path):
+    # The batch downloader named both 'Physics_Class_03_720p.mp4'
+    (tmp_path / 'Physics_Class_03_720p.mp4').write_bytes(b'x')
+    index = NameIndex()
+    index.claim(URL, ['Physics Class ০৩ - Vectors'])
+    index.claim(URL.replace('4521', '4522'), ['Physics Class ০৩ - Motion'])
+
+    for url, title in ((URL, 'Physics Class ০৩ - Vectors'), (URL.replace('4521', '4522'), 'Physics Class ০৩ - Motion')):
+        base = index.base_for(url, title)
+        assert index.legacy_path(os.path.join(str(tmp_path), f"{base}_720p.mp4")) is None
+
+    # The full-title name is still one class's own
+    (tmp_path / 'Physics_Class_03_-_Vectors_720p.mp4').write_bytes(b'x')
+    index = NameIndex()
+    index.claim(URL.replace('4521', '4522'), ['Physics Class ০৩ - Motion'])
+    base = index.base_for(URL, 'Physics Class ০৩ - Vectors')
+    assert index.legacy_path(os.path.join(str(tmp_path), f"{base}_720p.mp4")) == \
+        str(tmp_path / 'Physics_Class_03_-_Vectors_720p.mp4')
@@ -0,0 +1,42 @@
+from quality_policy import QualityPolicy
+
+FORMATS = [
+    {'format_id': '18', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360, 'protocol': 'https'},
+    {'format_id': '137', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'none', 'height': 1080, 'protocol': 'https',
+     'filesize': 300 * 1024 ** 2},
+    {'format_id': '136', 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'protocol': 'https',
+     'filesize': 150 * 1024 ** 2},
+    {'format_id': '248', 'ext': 'webm', 'vcodec': 'vp9', 'acodec': 'none', 'height': 1080, 'protocol': 'https'},
+    {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a', 'abr': 128, 'protocol': 'https',
+     'filesize': 10 * 1024 ** 2},
+    {'format_id': '251', 'ext': 'webm', 'vcodec': 'none', 'acodec': 'opus', 'abr': 160, 'protocol': 'https'},
+]
+
+
+def chosen(policy, formats=FORMATS):
+    return QualityPolicy.parse(policy).select_youtube_format(formats)['format_id']
+
+
+def test_parse_round_trips():
+    for text in ('best', 'max 720p', 'smallest over 480p', 'nearest 480p', 'best bitrate per MB', 'best under 500MB'):
+        assert str(QualityPolicy.parse(text)) == text
+
+
+def test_youtube_pairs_the_best_allowed_video_with_audio():
+    assert chosen('best') == '137+140'
+    assert chosen('max 720p') == '136+140'
+    assert chosen('best under 200MB') == '136+140'
+    merged = QualityPolicy.parse('best').select_youtube_format(FORMATS)
+    assert merged['ext'] == 'mp4' and [f['format_id'] for f in merged['requested_formats']] == ['137', '140']
+
+
+def test_youtube_falls_back_to_progressive_formats():
+    progressive = [f for f in FORMATS if f['format_id'] in ('18', '140')]
+    assert chosen('best', progressive) == '18'
+
+
+def test_direct_sources_follow_the_policy():
+    sources = [('direct', 'https://cdn/a_360.mp4', '360'), ('direct', 'https://cdn/a_720.mp4', '720'),
+               ('youtube', 'abc')]
+    assert QualityPolicy.parse('max 480p').select_direct(sources)[2] == '360'
+    assert QualityPolicy.parse('nearest 1080p').select_direct(sources)[2] == '720'
@@ -0,0 +1,71 @@
+import pytest
+from job_queue import JobQueue
+from scheduler import DEFAULT_ORDER, QueueOrder, order_from
+
+
+def url(number):
+    return f'https://online.utkorsho.tech/Routine/ClassDetails?id={number}'
+
+
+def make_queue(tmp_path, rules):
+    return JobQueue({'download_path': str(tmp_path), 'max_retries': 3}, order=QueueOrder(rules))
+
+
+def claimed(queue):
+    return [(job['class_number'], job['artifact']) for job in queue.claim_class()]
+
+
+def test_order_from_prefers_the_command_line():
+    assert str(order_from({'queue_order': ['newest']}, ['prog', '--order', 'notes,oldest'])) == 'notes,oldest'
+    assert str(order_from({'queue_order': 'subject:Physics,newest'})) == 'subject:Physics,newest'
+    assert str(order_from({})) == ','.join(DEFAULT_ORDER)
+
+
+def test_unknown_rule_is_rejected():
+    with pytest.raises(ValueError):
+        order_from({}, ['prog', '--order', 'biggest'])
+
+
+def test_default_order_keeps_classes_together():
+    assert QueueOrder(DEFAULT_ORDER).together
+    assert not QueueOrder(['shortest']).together
+    assert not QueueOrder(['subject:Math', 'notes']).together
+
+
+def test_smallest_claims_the_smallest_class_whole(tmp_path):
+    queue = make_queue(tmp_path, ['smallest'])
+    big = queue.enqueue(url(1), 'video:direct')
+    queue.enqueue(url(1), 'note')
+    small = queue.enqueue(url(2), 'video:direct')
+    queue.enqueue(url(2), 'note')
+    queue.set_size(big, 900 * 1024 ** 2)
+    queue.set_size(small, 50 * 1024 ** 2)
+
+    assert sorted(claimed(queue)) == [(2, 'note'), (2, 'video:direct')]
+    assert sorted(claimed(queue)) == [(1, 'note'), (1, 'video:direct')]
+
+
+def test_shortest_splits_a_class_by_size(tmp_path):
+    queue = make_queue(tmp_path, ['shortest'])
+    video = queue.enqueue(url(1), 'video:direct')
+    queue.enqueue(url(1), 'note')
+    queue.set_size(video, 10 * 1024 ** 2)
+    queue.enqueue(url(2), 'video:direct')
+
+    # Known note size estimate beats a known 10 MB video, which beats an unknown video
+    assert claimed(queue) == [(1, 'note')]
+    assert claimed(queue) == [(1, 'video:direct')]
+    assert claimed(queue) == [(2, 'video:direct')]
+
+
+def test_newest_subject_and_listing(tmp_path):
+    queue = make_queue(tmp_path, ['subject:physics', 'newest'])
+    queue.enqueue(url(5), 'note', subject='Chemistry')
+    queue.enqueue(url(3), 'note', subject='Physics 1st Paper')
+    queue.enqueue(url(4), 'note', subject='Physics 2nd Paper')
+    assert [claimed(queue) for _ in range(3)] == [[(4, 'note')], [(3, 'note')], [(5, 'note')]]
+
+    listing = make_queue(tmp_path / 'listing', ['listing'])
+    for number in (9, 7, 8):
+        listing.enqueue(url(number), 'note')
+    assert [claimed(listing) for _ in range(3)] == [[(9, 'note')], [(7, 'note')], [(8, 'note')]]
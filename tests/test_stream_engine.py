@@ -0,0 +1,184 @@
+import pytest
+from stream_engine import (StreamDownloader, byte_range, expand_template, manifest_kind, parse_iso_duration,
+                           same_sources, segment_extension, without_query)
+
+BASE = 'https://cdn.example.com/live/'
+
+MASTER = """#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="en",DEFAULT=NO,URI="audio/en.m3u8"
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="bn",DEFAULT=YES,URI="audio/bn.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,AUDIO="aud"
+360p.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720,AUDIO="aud"
+720p.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080,AUDIO="aud"
+1080p.m3u8
+"""
+
+VIDEO = """#EXTM3U
+#EXT-X-VERSION:4
+#EXT-X-MAP:URI="init.mp4",BYTERANGE="720@0"
+#EXTINF:6.0,
+#EXT-X-BYTERANGE:1000@720
+video.mp4
+#EXTINF:6.0,
+#EXT-X-BYTERANGE:1500
+video.mp4
+#EXT-X-ENDLIST
+"""
+
+AUDIO = """#EXTM3U
+#EXT-X-KEY:METHOD=AES-128,URI="https://keys.example.com/k1"
+#EXTINF:6.0,
+a0.aac
+#EXT-X-ENDLIST
+"""
+
+MPD = """<?xml version="1.0"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" mediaPresentationDuration="PT10S">
+  <BaseURL>https://cdn.example.com/dash/</BaseURL>
+  <Period>
+    <AdaptationSet contentType="video" mimeType="video/mp4">
+      <SegmentTemplate initialization="$RepresentationID$/init.mp4" media="$RepresentationID$/$Number%03d$.m4s"
+                       startNumber="1" duration="4" timescale="1"/>
+      <Representation id="v360" bandwidth="500000" height="360"/>
+      <Representation id="v1080" bandwidth="4000000" height="1080"/>
+    </AdaptationSet>
+    <AdaptationSet contentType="audio" mimeType="audio/mp4">
+      <Representation id="a1" bandwidth="128000">
+        <SegmentList>
+          <Initialization sourceURL="audio/init.mp4"/>
+          <SegmentURL media="audio/1.m4s"/>
+          <SegmentURL media="audio/2.m4s"/>
+        </SegmentList>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+
+class FakeResponse:
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """Serves the manifests above and records which URLs were fetched"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.fetched = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.fetched.append(url)
+        return FakeResponse(url, self.documents[url])
+
+
+class FakeSessions:
+    def __init__(self, documents):
+        self.session = FakeSession(documents)
+
+
+@pytest.fixture
+def hls():
+    documents = {
+        BASE + 'master.m3u8': MASTER,
+        BASE + '360p.m3u8': VIDEO.replace('video.mp4', 'low.mp4'),
+        BASE + '720p.m3u8': VIDEO,
+        BASE + '1080p.m3u8': VIDEO.replace('video.mp4', 'high.mp4'),
+        BASE + 'audio/bn.m3u8': AUDIO,
+        BASE + 'audio/en.m3u8': AUDIO,
+    }
+    return StreamDownloader({}, FakeSessions(documents), None, None)
+
+
+def test_manifest_kind():
+    assert manifest_kind('https://x/a/master.m3u8?token=1') == 'hls'
+    assert manifest_kind('https://x/play', 'application/dash+xml; charset=utf-8') == 'dash'
+    assert manifest_kind('https://x/video.mp4', 'video/mp4') is None
+
+
+def test_small_helpers():
+    assert parse_iso_duration('PT1H2M3.5S') == 3723.5
+    offsets = {}
+    assert byte_range('100@50', 'u', offsets) == [50, 149]
+    # No offset: continues after the previous range of the same URL
+    assert byte_range('10', 'u', offsets) == [150, 159]
+    assert byte_range(None, 'u', offsets) is None
+    assert expand_template('$RepresentationID$/$Number%05d$.m4s', 'v1', 1000, 7) == 'v1/00007.m4s'
+
+
+def test_hls_picks_the_best_variant_under_the_height_cap(hls):
+    plan = hls.plan(BASE + 'master.m3u8', {}, max_height=720)
+    urls = {url for _, url, _ in plan['segments']}
+    assert BASE + 'video.mp4' in urls
+    assert not any('high' in url or 'low' in url for url in urls)
+
+
+def test_hls_adds_the_default_audio_rendition(hls):
+    plan = hls.plan(BASE + 'master.m3u8', {}, max_height=720)
+    assert [name for name, _ in plan['playlists']] == ['video.m3u8', 'audio.m3u8']
+    assert BASE + 'audio/bn.m3u8' in hls.sessions.session.fetched
+    assert BASE + 'audio/en.m3u8' not in hls.sessions.session.fetched
+    segments = {url: name for name, url, _ in plan['segments']}
+    # The key is fetched as a local resource too
+    assert 'https://keys.example.com/k1' in segments
+    assert BASE + 'audio/a0.aac' in segments
+
+
+def test_hls_byte_ranges_become_separate_segments(hls):
+    plan = hls.plan(BASE + 'master.m3u8', {}, max_height=720)
+    # The video track comes first: its init section and two ranges of one file
+    assert plan['segments'][:3] == [
+        ('r00000.mp4', BASE + 'init.mp4', [0, 719]),
+        ('s00001.mp4', BASE + 'video.mp4', [720, 1719]),
+        ('s00002.mp4', BASE + 'video.mp4', [1720, 3219]),
+    ]
+
+    playlist = dict(plan['playlists'])['video.m3u8']
+    assert 'BYTERANGE' not in playlist
+    assert '#EXT-X-MAP:URI="r00000.mp4"' in playlist
+    assert 's00001.mp4' in playlist and 's00002.mp4' in playlist
+
+
+def test_local_segment_names_keep_the_remote_format(hls):
+    plan = hls.plan(BASE + 'master.m3u8', {}, max_height=720)
+    names = {url: name for name, url, _ in plan['segments']}
+    assert names[BASE + 'audio/a0.aac'].endswith('.aac')
+    # A key has no media format of its own
+    assert names['https://keys.example.com/k1'].endswith('.bin')
+    assert segment_extension('https://cdn.example.com/seg-1.m4s?token=abc') == '.m4s'
+    assert segment_extension('https://cdn.example.com/segment.php?n=1') == '.ts'
+
+
+def test_a_rotated_signature_keeps_the_plan_sources(hls):
+    signed = BASE + 'master.m3u8?sig=one'
+    hls.sessions.session.documents[signed] = MASTER
+    first = hls.plan(signed, {}, max_height=720)
+    rotated = {**first, 'segments': [(name, url + '?sig=two', byterange) for name, url, byterange in first['segments']]}
+    assert without_query(BASE + 'master.m3u8?sig=two#t=1') == BASE + 'master.m3u8'
+    assert same_sources(first, rotated)
+    assert not same_sources(first, hls.plan(BASE + 'master.m3u8', {}, max_height=1080))
+
+
+def test_dash_picks_the_best_video_and_lists_every_segment():
+    downloader = StreamDownloader({}, FakeSessions({'https://cdn.example.com/stream.mpd': MPD}), None, None)
+    plan = downloader.plan('https://cdn.example.com/stream.mpd', {})
+    assert plan['kind'] == 'dash'
+    urls = [url for _, url, _ in plan['segments']]
+    assert urls[:4] == ['https://cdn.example.com/dash/v1080/init.mp4', 'https://cdn.example.com/dash/v1080/001.m4s',
+                        'https://cdn.example.com/dash/v1080/002.m4s', 'https://cdn.example.com/dash/v1080/003.m4s']
+    assert urls[4:] == ['https://cdn.example.com/dash/audio/init.mp4', 'https://cdn.example.com/dash/audio/1.m4s',
+                        'https://cdn.example.com/dash/audio/2.m4s']
+    assert [track for track, _ in plan['tracks']] == ['video.mp4', 'audio.mp4']
+
+
+def test_dash_height_cap():
+    downloader = StreamDownloader({}, FakeSessions({'https://cdn.example.com/stream.mpd': MPD}), None, None)
+    plan = downloader.plan('https://cdn.example.com/stream.mpd', {}, max_height=720)
+    assert plan['segments'][0][1] == 'https://cdn.example.com/dash/v360/init.mp4'
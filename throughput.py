@@ -0,0 +1,103 @@
+import collections
+import time
+
+
+class ThroughputMeter:
+    """Speed and ETA of one transfer from a sliding window of byte counts.
+
+    Feed it the running byte total with update() (or deltas with add()) as
+    often as you like; samples are kept at most every `resolution` seconds,
+    so the window never holds more than window / resolution entries.
+
+        speed    - bytes/s over the last `window` seconds, 0 once stalled
+        smoothed - EWMA of the per-sample rate, steadier for decisions
+        average  - bytes/s since the first byte
+    """
+
+    __slots__ = ('window', 'resolution', 'alpha', 'completed', 'started', '_samples', '_ewma')
+
+    def __init__(self, window=5.0, resolution=0.25, alpha=0.3):
+        self.window = window
+        self.resolution = resolution
+        self.alpha = alpha
+        self.completed = 0
+        self.started = None
+        self._samples = collections.deque(maxlen=int(window / resolution) + 2)
+        self._ewma = None
+
+    def reset(self):
+        self.completed = 0
+        self.started = None
+        self._samples.clear()
+        self._ewma = None
+
+    def update(self, completed, now=None):
+        now = time.monotonic() if now is None else now
+        if completed < self.completed:
+            # The engine restarted the file, old samples describe another transfer
+            self.reset()
+        if self.started is None:
+            self.started = now
+            self._samples.append((now, completed))
+            self.completed = completed
+            return
+
+        self.completed = completed
+        last_time, last_bytes = self._samples[-1]
+        # Samples closer together than the resolution only move the running total
+        if now - last_time >= self.resolution:
+            rate = (completed - last_bytes) / (now - last_time)
+            self._ewma = rate if self._ewma is None else self.alpha * rate + (1 - self.alpha) * self._ewma
+            self._samples.append((now, completed))
+
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+            self._samples.popleft()
+
+    def add(self, nbytes, now=None):
+        self.update(self.completed + nbytes, now)
+
+    @property
+    def speed(self):
+        samples = self._samples
+        if not samples:
+            return 0.0
+        first_time, first_bytes = samples[0]
+        now = time.monotonic()
+        # Nothing arrived for a whole window, the transfer is stalled
+        if now - samples[-1][0] > self.window:
+            return 0.0
+        elapsed = now - first_time
+        return (self.completed - first_bytes) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def smoothed(self):
+        return self._ewma or 0.0
+
+    @property
+    def average(self):
+        if self.started is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, total):
+        """Seconds left for `total` bytes, None while the speed is unknown"""
+        if not total:
+            return None
+        speed = self.speed or self.smoothed
+        if speed <= 0:
+            return None
+        return max(0.0, (total - self.completed) / speed)
+
+
+def format_speed(bytes_per_second):
+    return f"{bytes_per_second / (1024 * 1024):.1f} MB/s"
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
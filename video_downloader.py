@@ -1,30 +1,39 @@
-# Try to import aria2p
-try:
-    import aria2p
-    ARIA2_AVAILABLE = True
-except ImportError:
-    ARIA2_AVAILABLE = False
-
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import time
-import requests
+STARTED_AT = time.perf_counter()
+
 import os
+import sys
 import json
-from tqdm import tqdm
-import concurrent.futures
+import shutil
 import logging
-from urllib.parse import urlparse, unquote
+import threading
+import atexit
+import importlib.util
 import re
-from bs4 import BeautifulSoup
+from html import unescape
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn
-from rich.panel import Panel
 from rich.text import Text
-from rich import print as rprint
+from lazy import lazy_import
+from integrity import IntegrityChecker, BlockHasher, conditional_headers, remote_validators
+from dedup import DedupStore
+from fast_io import stream_to_file
+from session_manager import SessionManager
+from driver_pool import DriverPool
+from progress_hub import ProgressHub
+from stream_engine import StreamDownloader, manifest_kind
+from network_capture import NetworkCapture
+from chrome_profile import apply_blocking, build_chrome_options
+from naming import NameIndex, sanitize
+from postprocess import PostProcessor
+from storage import StorageManager, ytdlp_size
+
+# Heavy dependencies are only imported once a code path actually needs them
+By = lazy_import('selenium.webdriver.common.by', 'By')
+WebDriverWait = lazy_import('selenium.webdriver.support.ui', 'WebDriverWait')
+EC = lazy_import('selenium.webdriver.support.expected_conditions')
+
+# Checking for aria2p is cheap, importing it is not
+ARIA2_AVAILABLE = importlib.util.find_spec('aria2p') is not None
 
 # Configure logging
 logging.basicConfig(
@@ -36,43 +45,156 @@ logging.basicConfig(
     ]
 )
 
+VIDEO_TAB_ATTRIBUTE = re.compile(r'data-all-(video-source|resolution)\s*=\s*["\']([^"\']*)["\']')
+
+
+def page_video_sources(page):
+    """('direct', url, resolution) sources from a class page's markup, like get_video_sources() reads them"""
+    values = {name: unescape(value) for name, value in VIDEO_TAB_ATTRIBUTE.findall(page or '')}
+    sources = values.get('video-source', '').split(',')
+    resolutions = values.get('resolution', '').split(',')
+    return [('direct', source.strip(), resolutions[i].strip() if i < len(resolutions) else '')
+            for i, source in enumerate(sources) if source.strip()]
+
+
 class VideoDownloader:
-    def __init__(self, config_file='config.json'):
+    def __init__(self, config_file='config.json', overrides=None):
         self.config = self.load_config(config_file)
-        self.setup_chrome_options()
+        # Settings a caller fixes for this instance only, e.g. a shard worker's aria2 port
+        self.config.update(overrides or {})
+        if '--fast-start' in sys.argv:
+            self.config['aria2_startup'] = 'lazy'
+        if '--refresh' in sys.argv:
+            self.config['refresh'] = True
+        self._chrome_options = None
+        self._aria2_available = False
         self.console = Console()
+        # Record / replay archive, opened before anything that could use the network
+        self.fixtures = None
+        if '--record' in sys.argv or '--replay' in sys.argv:
+            from fixtures import FixtureArchive, fixture_mode
+            mode, path = fixture_mode(sys.argv)
+            self.fixtures = FixtureArchive(path, mode, self.config['fixtures_max_body'], self.console)
+            # Registered first so it closes after the drivers took their last snapshots
+            atexit.register(self.fixtures.close)
+            self.console.print(f"[cyan]{mode.capitalize()}ing fixtures: {path} (aria2 off, YouTube not covered)[/cyan]")
+        # Every download reports into this one hub instead of its own Progress
+        self.progress = ProgressHub(self.console, self.config['progress_fps'], self.config['progress_top_n'],
+                                    self.config['progress_display'])
+        self.sessions = SessionManager(self.config, self.console, fixtures=self.fixtures)
+        self.streams = StreamDownloader(self.config, self.sessions, self.progress, self.console)
+        # Request headers Chrome used for sources found in its network log
+        self.source_headers = {}
+        self.remote_sizes = {}
+        # class URL -> {artifact: bytes} seen by process_class_artifacts, for the queue's ordering
+        self.class_sizes = {}
+        # Free space, reservations and output roots, see storage.py
+        self.storage = StorageManager(self.config, self.console)
+        self.integrity = IntegrityChecker(self.config, self.console, self.sessions)
+        self.dedup = DedupStore(self.config, self.console)
+        # Off by default, runs on its own processes so downloads never wait for it
+        self.postprocess = PostProcessor(self.config, self.console, self.integrity, self.dedup)
+        atexit.register(self.postprocess.close)
+        # Finished files and class base names, answers "already downloaded?" in O(1)
+        self.names = NameIndex(self.is_finished_file)
+        self.driver_pool = DriverPool(
+            lambda: self.chrome_options, self.sessions, self.config['max_drivers'],
+            setup=self.setup_driver
+        )
+        atexit.register(self.driver_pool.close_all)
         
-        # Try to start aria2c daemon if not running
-        try:
-            import aria2p
-            import subprocess
-            
-            # Check if aria2c is installed
-            try:
-                subprocess.run(['aria2c', '--version'], capture_output=True)
-                
-                # Start aria2c daemon if not running
-                subprocess.Popen(
-                    ['aria2c', '--enable-rpc', '--rpc-listen-all=false', '--rpc-listen-port=6800'],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL
-                )
-                
-            except FileNotFoundError:
-                self.console.print("[yellow]aria2c not found. For faster downloads, install aria2c:[/yellow]")
-                self.console.print("[yellow]Windows: choco install aria2[/yellow]")
-                self.console.print("[yellow]Linux: sudo apt install aria2[/yellow]")
-                self.console.print("[yellow]macOS: brew install aria2[/yellow]")
-                
-        except ImportError:
-            pass
+        # aria2c is discovered and started off the main thread (or on first use
+        # with --fast-start) so the first prompt does not wait for it
+        self._aria2_lock = threading.Lock()
+        self._aria2_ready = threading.Event()
+        self._aria2_started = False
+        if ARIA2_AVAILABLE and self.fixtures is None and self.config['aria2_startup'] == 'background':
+            threading.Thread(target=self.ensure_aria2, daemon=True).start()
+
+    @property
+    def chrome_options(self):
+        if self._chrome_options is None:
+            self.setup_chrome_options()
+        return self._chrome_options
+
+    def setup_driver(self, driver):
+        """Prepare a new pooled driver, wrapped for recording or replay when enabled"""
+        apply_blocking(driver, self.config)
+        if self.fixtures is not None:
+            return self.fixtures.wrap_driver(driver)
+        return driver
+
+    def ensure_aria2(self, timeout=10):
+        """Start the aria2c RPC daemon once, returns True if it can be used"""
+        with self._aria2_lock:
+            if not self._aria2_started:
+                self._aria2_started = True
+                try:
+                    self._start_aria2()
+                finally:
+                    self._aria2_ready.set()
+        self._aria2_ready.wait(timeout)
+        return self._aria2_available
+
+    def _start_aria2(self):
+        import subprocess
+        
+        self._aria2_available = False
+        if not shutil.which('aria2c'):
+            self.console.print("[yellow]aria2c not found. For faster downloads, install aria2c:[/yellow]")
+            self.console.print("[yellow]Windows: choco install aria2[/yellow]")
+            self.console.print("[yellow]Linux: sudo apt install aria2[/yellow]")
+            self.console.print("[yellow]macOS: brew install aria2[/yellow]")
+            return
+        
+        # Start aria2c daemon if not running
+        subprocess.Popen(
+            ['aria2c', '--enable-rpc', '--rpc-listen-all=false', f"--rpc-listen-port={self.config['aria2_rpc_port']}"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        self._aria2_available = True
+
+    def report_startup_time(self):
+        elapsed = time.perf_counter() - STARTED_AT
+        logging.getLogger(__name__).debug(f"Time to first prompt: {elapsed:.3f}s")
+        if self.config['aria2_startup'] == 'lazy':
+            self.console.print(f"[dim]Ready in {elapsed:.2f}s[/dim]")
 
     def load_config(self, config_file):
         default_config = {
             'download_path': 'downloads',
             'max_retries': 3,
+            'retry_backoff': 30,
             'chunk_size': 8192,
+            'io_buffer_size': 4 * 1024 * 1024,
             'max_parallel_downloads': 3,
+            'max_drivers': 3,
+            'youtube_concurrent_videos': 3,
+            'youtube_concurrent_fragments': 8,
+            'aria2_startup': 'background',
+            'progress_fps': 4,
+            'progress_top_n': 8,
+            'progress_display': True,
+            'aria2_rpc_port': 6800,
+            'stream_concurrent_segments': 8,
+            'capture_timeout': 10,
+            'listing_idle_timeout': 10,
+            'chrome_profile': 'lean',
+            'post_process': False,
+            'refresh': False,
+            'fixtures_max_body': 16 * 1024 * 1024,
+            'download_roots': [],
+            'min_free_space': 1024 ** 3,
+            'space_wait_timeout': 3600,
+            'writers_per_device': 0,
+            'aria2_file_allocation': 'falloc',
+            'queue_order': ['smallest'],
+            'size_probe_workers': 2,
+            'egress': [],
+            'egress_cooldown': 60,
+            'post_process_workers': 1,
+            'post_process_thumbnails': True,
             'headers': {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
@@ -84,13 +206,7 @@ class VideoDownloader:
         return default_config
 
     def setup_chrome_options(self):
-        self.chrome_options = Options()
-        self.chrome_options.add_argument('--headless')
-        self.chrome_options.add_argument('--disable-gpu')
-        self.chrome_options.add_argument('--no-sandbox')
-        self.chrome_options.add_argument('--disable-dev-shm-usage')
-        self.chrome_options.add_argument('--log-level=3')
-        self.chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+        self._chrome_options = build_chrome_options(self.config)
         
         # Suppress TensorFlow and other messages
         import os
@@ -108,241 +224,238 @@ class VideoDownloader:
         warnings.filterwarnings('ignore')
 
     def get_cookies_dict(self, cookies_string):
-        cookies = {}
-        for cookie in cookies_string.split(';'):
-            if cookie.strip():
-                try:
-                    key, value = cookie.strip().split('=', 1)
-                    cookies[key] = value
-                except:
-                    continue
-        return cookies
+        """Current cookies from the shared jar, the string is only parsed when it changes"""
+        return self.sessions.cookies_dict(cookies_string)
+
+    @property
+    def http(self):
+        """Shared requests.Session carrying the cookie jar and pooled connections"""
+        return self.sessions.session
+
+    @property
+    def egress(self):
+        """Route pool shared by the session, aria2 and yt-dlp"""
+        return self.sessions.egress
 
     def get_video_url(self, cookies_string, class_url):
-        driver = webdriver.Chrome(options=self.chrome_options)
+        """Direct video URL of a class from the requests its page makes, for pages without source attributes"""
+        self.get_cookies_dict(cookies_string)
+        driver = self.driver_pool.acquire()
         try:
-            # Initial setup
-            driver.get("https://online.utkorsho.tech")
-            cookies_dict = self.get_cookies_dict(cookies_string)
-            for name, value in cookies_dict.items():
-                driver.add_cookie({'name': name, 'value': value})
-            
-            # Load class page
-            driver.get(class_url)
-            time.sleep(3)  # Increased wait time
+            capture = self.load_class_page(driver, class_url)
+            sources = self.network_video_sources(capture)
+            if sources:
+                return sources[0][1]
             
-            # Switch to video tab if needed
-            if "video-section" not in driver.current_url:
-                self.switch_to_tab(driver, "video")
-                time.sleep(2)
-            
-            # Wait for video element
-            try:
-                video_element = WebDriverWait(driver, 20).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "video"))
-                )
-                video_url = video_element.get_attribute('src')
-                
-                if not video_url:
-                    # Try to get from source element
-                    source_elements = driver.find_elements(By.TAG_NAME, "source")
-                    for source in source_elements:
-                        video_url = source.get_attribute('src')
-                        if video_url:
-                            break
-                
-                if not video_url:
-                    # Try to get from data attributes
-                    video_container = driver.find_element(By.ID, "video-section")
-                    video_url = video_container.get_attribute('data-video-source')
-                    
-                if not video_url:
-                    # Try to get from video-js element
-                    video_js = driver.find_element(By.CLASS_NAME, "video-js")
-                    video_url = video_js.get_attribute('data-setup')
-                    if video_url:
-                        # Parse JSON to get URL
-                        import json
-                        try:
-                            data = json.loads(video_url)
-                            video_url = data.get('sources', [{}])[0].get('src', '')
-                        except:
-                            pass
-                
-                return video_url
-                
-            except Exception as e:
-                self.console.print(f"[yellow]Warning: Could not find video element, trying alternative method...[/yellow]")
-                
-                # Try alternative method - get from network requests
-                try:
-                    video_requests = [log for log in driver.get_log('performance') 
-                                    if 'mp4' in str(log) or 'm3u8' in str(log)]
-                    
-                    for request in video_requests:
-                        if isinstance(request, dict) and 'message' in request:
-                            message = json.loads(request['message'])
-                            request_url = message.get('message', {}).get('params', {}).get('request', {}).get('url', '')
-                            if '.mp4' in request_url or '.m3u8' in request_url:
-                                return request_url
-                except:
-                    pass
-                
-                return None
+            # The player may have its URL in the markup without having requested it yet
+            for element in driver.find_elements(By.CSS_SELECTOR, "video[src], video source[src]"):
+                video_url = element.get_attribute('src')
+                if video_url and video_url.startswith('http'):
+                    return video_url
+            return None
                 
         except Exception as e:
             self.console.print(f"[red]Error getting video URL: {str(e)}[/red]")
             return None
         finally:
-            driver.quit()
+            self.driver_pool.release(driver)
+
+    def load_class_page(self, driver, class_url):
+        """Open a class page with a clean network log, returns the capture for it"""
+        capture = NetworkCapture(driver)
+        capture.reset()
+        driver.get(class_url)
+        return capture
+
+    def network_video_sources(self, capture, timeout=None):
+        """('direct', url, resolution) sources from the captured requests, best guess at resolution"""
+        timeout = self.config['capture_timeout'] if timeout is None else timeout
+        sources = []
+        for request in capture.wait_for('video', timeout):
+            match = re.search(r'(\d{3,4})p', request['url'])
+            self.source_headers[request['url']] = request['headers']
+            sources.append(('direct', request['url'], match.group(1) if match else '720'))
+        return sources
+
+    def network_note_url(self, capture):
+        capture.poll()
+        notes = capture.found('pdf')
+        if not notes:
+            return None
+        self.source_headers[notes[0]['url']] = notes[0]['headers']
+        return notes[0]['url']
 
     def download_chunk(self, url, start_byte, end_byte, cookies, headers, filename):
         headers['Range'] = f'bytes={start_byte}-{end_byte}'
-        response = requests.get(url, headers=headers, cookies=cookies, stream=True)
+        response = self.http.get(url, headers=headers, cookies=cookies, stream=True)
         
         temp_filename = f"{filename}.part{start_byte}"
-        with open(temp_filename, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=self.config['chunk_size']):
-                if chunk:
-                    f.write(chunk)
+        stream_to_file(response, temp_filename, buffer_size=self.config['io_buffer_size'])
         return temp_filename
 
-    def download_video(self, url, cookies_string, filename, progress, task):
-        """Download video with progress tracking"""
+    def download_video(self, url, cookies_string, filename, progress, task, max_height=None):
+        """Download video with progress tracking, max_height caps the variant of a manifest"""
         try:
-            headers = self.config['headers']
+            headers = {**self.config['headers'], **self.source_headers.get(url, {})}
             cookies = self.get_cookies_dict(cookies_string)
             
             # Create download directory if not exists
             os.makedirs(os.path.dirname(filename), exist_ok=True)
             
-            # Try aria2c first if available
-            if ARIA2_AVAILABLE:
-                try:
-                    import aria2p
-                    
-                    # Initialize aria2
-                    aria2 = aria2p.API(
-                        aria2p.Client(
-                            host="http://localhost",
-                            port=6800,
-                            secret=""
-                        )
-                    )
-                    
-                    # Add download
-                    download = aria2.add_uris(
-                        [url],
-                        options={
-                            "dir": os.path.dirname(filename),
-                            "out": os.path.basename(filename),
-                            "header": [f"{k}: {v}" for k, v in headers.items()],
-                            "header": f"Cookie: {'; '.join([f'{k}={v}' for k,v in cookies.items()])}",
-                            "max-connection-per-server": "16",
-                            "split": "16",
-                            "min-split-size": "1M",
-                            "max-concurrent-downloads": "16",
-                            "file-allocation": "none",
-                            "continue": "true"
-                        }
-                    )
-                    
-                    # Track download progress
-                    prev_completed = 0
-                    start_time = time.time()
-                    
-                    while not download.is_complete:
-                        download.update()
-                        
-                        # Calculate progress
-                        total = download.total_length
-                        completed = download.completed_length
-                        if total > 0:
-                            percentage = (completed * 100) / total
-                            
-                            # Calculate speed
-                            elapsed = time.time() - start_time
-                            if elapsed > 0:
-                                speed = (completed - prev_completed) / (1024 * 1024 * elapsed)  # MB/s
-                                
-                                # Update progress
-                                progress.update(
-                                    task,
-                                    completed=percentage,
-                                    speed=f"{speed:.1f} MB/s"
-                                )
-                                
-                                # Reset for next update
-                                prev_completed = completed
-                                start_time = time.time()
-                        
-                        time.sleep(0.1)
-                    
-                    return True
-                    
-                except Exception as e:
-                    self.console.print("[yellow]aria2c download failed, falling back to regular download...[/yellow]")
+            # Reserve the whole file on its volume first, manifests only take a writer slot
+            size = 0 if manifest_kind(url) else self.get_remote_size(url, cookies_string)
+            with self.storage.reserve(filename, size):
+                return self._download_video(url, filename, headers, cookies, size, progress, task, max_height)
             
-            # Fallback to regular download
-            # Get total size first
-            response = requests.head(url, headers=headers, cookies=cookies)
-            total_size = int(response.headers.get('content-length', 0))
+        except Exception as e:
+            self.console.print(f"[red]Error downloading video: {str(e)}[/red]")
+            if os.path.exists(filename):
+                os.remove(filename)
+            return False
+
+    def _download_video(self, url, filename, headers, cookies, size, progress, task, max_height=None):
+        """aria2 when available, else the native engine, streams go to the segment engine"""
+        # HLS / DASH manifests go to the segment engine
+        if manifest_kind(url):
+            return self.download_stream(url, filename, headers, cookies, progress, task, max_height=max_height)
+        
+        # Try aria2c first if available, its connections cannot be recorded or replayed
+        if ARIA2_AVAILABLE and self.fixtures is None and self.ensure_aria2():
+            try:
+                return self.download_with_aria2(url, filename, headers, cookies, size, progress, task)
+            except Exception as e:
+                self.console.print("[yellow]aria2c download failed, falling back to regular download...[/yellow]")
+        
+        return self.download_native(url, filename, headers, cookies, progress, task, max_height)
+
+    def download_with_aria2(self, url, filename, headers, cookies, size, progress, task):
+        """One aria2 download over the best egress route, raises to fall back to the native engine"""
+        import aria2p
+        
+        # Initialize aria2
+        aria2 = aria2p.API(
+            aria2p.Client(
+                host="http://localhost",
+                port=self.config['aria2_rpc_port'],
+                secret=""
+            )
+        )
+        
+        # Only routes aria2 can speak through; without one the native engine takes over
+        with self.egress.lease(accept=lambda e: e.aria2_capable) as endpoint:
+            route = endpoint.aria2_options() if endpoint else {}
             
-            if total_size == 0:
-                # Try GET request to get size
-                response = requests.get(url, headers=headers, cookies=cookies, stream=True)
-                total_size = int(response.headers.get('content-length', 0))
-                
-            if total_size == 0:
-                self.console.print("[red]Could not get file size[/red]")
-                return False
+            # One list, aria2 takes a single "header" option: the captured
+            # Referer/Origin and the session cookies both have to be in it
+            header = [f"{k}: {v}" for k, v in headers.items()]
+            if cookies:
+                header.append(f"Cookie: {'; '.join([f'{k}={v}' for k,v in cookies.items()])}")
             
-            # Download with progress tracking
-            downloaded = 0
-            last_update_time = time.time()
-            last_downloaded = 0
-            chunk_size = 1024 * 1024  # 1MB chunks
+            # Add download, preallocated so a full disk shows up now and not halfway
+            self.integrity.mark_pending(filename, url, size)
+            started = time.monotonic()
+            download = aria2.add_uris(
+                [url],
+                options={
+                    "dir": os.path.dirname(filename),
+                    "out": os.path.basename(filename),
+                    "header": header,
+                    "max-connection-per-server": "16",
+                    "split": "16",
+                    "min-split-size": "1M",
+                    "max-concurrent-downloads": "16",
+                    "file-allocation": self.config['aria2_file_allocation'],
+                    "continue": "true",
+                    **route
+                }
+            )
             
-            with requests.get(url, stream=True, headers=headers, cookies=cookies) as r:
-                r.raise_for_status()
-                with open(filename, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=chunk_size):
-                        if chunk:
-                            size = len(chunk)
-                            downloaded += size
-                            f.write(chunk)
-                            
-                            # Update progress every 0.5 seconds
-                            current_time = time.time()
-                            if current_time - last_update_time >= 0.5:
-                                # Calculate speed
-                                time_diff = current_time - last_update_time
-                                bytes_diff = downloaded - last_downloaded
-                                speed = bytes_diff / (1024 * 1024 * time_diff)  # MB/s
-                                
-                                # Calculate percentage
-                                percentage = (downloaded * 100) / total_size
-                                
-                                # Update progress
-                                progress.update(
-                                    task,
-                                    completed=percentage,
-                                    speed=f"{speed:.1f} MB/s"
-                                )
-                                
-                                # Update last values
-                                last_update_time = current_time
-                                last_downloaded = downloaded
+            # Track download progress, the hub's meter turns byte counts into speed
+            while not download.is_complete:
+                download.update()
+                if download.has_failed:
+                    raise RuntimeError(download.error_message or "aria2 reported an error")
+                
+                total = download.total_length
+                if total > 0:
+                    progress.update(task, total=total, completed=download.completed_length)
+                
+                time.sleep(0.1)
             
-            # Ensure 100% progress at the end
-            progress.update(task, completed=100, speed="Done!")
-            return True
+            if endpoint is not None:
+                self.egress.succeeded(endpoint, download.total_length, time.monotonic() - started)
+        
+        # aria2 does not hand back response headers, ask for the validators separately
+        try:
+            remote = remote_validators(self.http.head(url, headers=headers, cookies=cookies, allow_redirects=True).headers)
+        except Exception:
+            remote = None
+        return self.finish_download(filename, url, cookies, headers, download.total_length, remote=remote)
+
+    def download_native(self, url, filename, headers, cookies, progress, task, max_height=None):
+        """Streaming download over the shared session, the regular fallback"""
+        # Get total size first
+        response = self.http.head(url, headers=headers, cookies=cookies)
+        total_size = int(response.headers.get('content-length', 0))
+        
+        # A manifest without a telling extension
+        kind = manifest_kind(url, response.headers.get('content-type'))
+        if kind:
+            return self.download_stream(url, filename, headers, cookies, progress, task, kind, max_height)
+        
+        if total_size == 0:
+            # Try GET request to get size
+            response = self.http.get(url, headers=headers, cookies=cookies, stream=True)
+            total_size = int(response.headers.get('content-length', 0))
             
-        except Exception as e:
-            self.console.print(f"[red]Error downloading video: {str(e)}[/red]")
-            if os.path.exists(filename):
-                os.remove(filename)
+        if total_size == 0:
+            self.console.print("[red]Could not get file size[/red]")
             return False
+        
+        # Download with progress tracking
+        progress.update(task, total=total_size)
+        hasher = BlockHasher()
+        
+        def on_chunk(chunk):
+            hasher.update(chunk)
+            progress.update(task, advance=len(chunk))
+        
+        started = time.monotonic()
+        with self.http.get(url, stream=True, headers=headers, cookies=cookies) as r:
+            r.raise_for_status()
+            self.integrity.mark_pending(filename, url, total_size)
+            try:
+                written = stream_to_file(r, filename, on_chunk, self.config['io_buffer_size'], total_size)
+            except Exception:
+                self.egress.broken(r)
+                raise
+            self.egress.observe(r, written, time.monotonic() - started)
+        
+        # Ensure 100% progress at the end
+        progress.update(task, completed=total_size, status="Done!")
+        return self.finish_download(filename, url, cookies, headers, total_size, hasher, remote_validators(r.headers))
+
+    def download_stream(self, url, filename, headers, cookies, progress, task, kind=None, max_height=None):
+        """Segmented stream download, resumable from the segments already on disk"""
+        if not self.streams.download(url, filename, headers, progress, task, kind, max_height):
+            return False
+        # The remuxed file has no single source URL to repair ranges from
+        return self.finish_download(filename, None, cookies, headers)
+
+    def finish_download(self, filename, url, cookies, headers, expected_size=0, hasher=None, remote=None):
+        """Verify a finished file, repair it if needed and register it for deduplication"""
+        self.integrity.record(filename, url, expected_size, hasher, remote=remote)
+        if not self.integrity.verify_and_repair(filename, url, cookies, headers):
+            self.names.discard(filename)
+            return False
+        self.names.add(filename)
+        
+        # aria2 and yt-dlp downloads have no streamed hash, dedup hashes them from disk
+        entry = self.integrity.entry(filename)
+        content_hash = entry.get('content_hash') if entry.get('size') == os.path.getsize(filename) else None
+        self.dedup.add(filename, content_hash)
+        self.postprocess.submit_video(filename)
+        return True
 
     def _fallback_download(self, url, cookies_string, filename, progress, task):
         """Regular download method as fallback"""
@@ -351,7 +464,7 @@ class VideoDownloader:
             cookies = self.get_cookies_dict(cookies_string)
             
             # Get total size first
-            response = requests.head(url, headers=headers, cookies=cookies)
+            response = self.http.head(url, headers=headers, cookies=cookies)
             total_size = int(response.headers.get('content-length', 0))
             
             if total_size == 0:
@@ -359,37 +472,25 @@ class VideoDownloader:
                 return False
             
             # Download with progress tracking
-            downloaded = 0
-            start_time = time.time()
-            chunk_size = 8192 * 16  # Increased chunk size
+            progress.update(task, total=total_size)
+            hasher = BlockHasher()
+            
+            def on_chunk(chunk):
+                hasher.update(chunk)
+                progress.update(task, advance=len(chunk))
             
-            with requests.get(url, stream=True, headers=headers, cookies=cookies) as r:
+            started = time.monotonic()
+            with self.http.get(url, stream=True, headers=headers, cookies=cookies) as r:
                 r.raise_for_status()
-                with open(filename, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=chunk_size):
-                        if chunk:
-                            size = len(chunk)
-                            downloaded += size
-                            f.write(chunk)
-                            
-                            # Calculate speed and update progress
-                            elapsed = time.time() - start_time
-                            if elapsed > 0:
-                                speed = downloaded / (1024 * 1024 * elapsed)  # MB/s
-                                percentage = (downloaded * 100) / total_size
-                                
-                                progress.update(
-                                    task,
-                                    completed=percentage,
-                                    speed=f"{speed:.1f} MB/s"
-                                )
-                            
-                            # Update time every second for accurate speed
-                            if elapsed > 1:
-                                start_time = time.time()
-                                downloaded = 0
+                self.integrity.mark_pending(filename, url, total_size)
+                try:
+                    written = stream_to_file(r, filename, on_chunk, self.config['io_buffer_size'], total_size)
+                except Exception:
+                    self.egress.broken(r)
+                    raise
+                self.egress.observe(r, written, time.monotonic() - started)
             
-            return True
+            return self.finish_download(filename, url, cookies, headers, total_size, hasher)
             
         except Exception as e:
             self.console.print(f"[red]Error downloading video: {str(e)}[/red]")
@@ -439,25 +540,24 @@ class VideoDownloader:
             return None
 
     def download_with_progress(self, url, filename, cookies, headers):
-        response = requests.get(url, stream=True, cookies=cookies, headers=headers)
-        total_size = int(response.headers.get('content-length', 0))
-        block_size = 1024  # 1 KB
-
-        with open(filename, 'wb') as f:
-            with tqdm(total=total_size, unit='B', unit_scale=True, desc=filename) as pbar:
-                start_time = time.time()
-                downloaded = 0
-                for data in response.iter_content(block_size):
-                    downloaded += len(data)
-                    f.write(data)
-                    
-                    # Calculate speed
-                    elapsed_time = time.time() - start_time
-                    if elapsed_time > 0:
-                        speed = downloaded / (1024 * 1024 * elapsed_time)  # MB/s
-                        pbar.set_postfix(speed=f"{speed:.2f} MB/s", refresh=True)
-                    
-                    pbar.update(len(data))
+        started = time.monotonic()
+        with self.http.get(url, stream=True, cookies=cookies, headers=headers) as response:
+            total_size = int(response.headers.get('content-length', 0))
+            task = self.progress.add_task(os.path.basename(filename), total=total_size)
+            ok = False
+            try:
+                written = stream_to_file(
+                    response, filename,
+                    lambda chunk: self.progress.update(task, advance=len(chunk)),
+                    self.config['io_buffer_size'], total_size
+                )
+                self.egress.observe(response, written, time.monotonic() - started)
+                ok = True
+            except Exception:
+                self.egress.broken(response)
+                raise
+            finally:
+                self.progress.finish(task, ok)
 
     def download_note(self, url, cookies_string, filename):
         try:
@@ -465,14 +565,33 @@ class VideoDownloader:
             headers = {
                 **self.config['headers'],
                 'Referer': 'https://online.utkorsho.tech/',
-                'Accept': 'application/pdf'
+                'Accept': 'application/pdf',
+                **self.source_headers.get(url, {})
             }
             
+            # On --refresh an existing note is only fetched again if the server has a newer one
+            refreshing = self.config['refresh'] and self.names.exists(filename)
+            remote = self.integrity.entry(filename).get('remote') if refreshing else None
+            conditional = conditional_headers(remote or {})
+            
             # Hide long URL
             self.console.print("[cyan]Downloading note...[/cyan]")
             
-            response = requests.get(url, cookies=cookies, headers=headers, stream=True)
+            response = self.http.get(url, cookies=cookies, headers={**headers, **conditional}, stream=True)
+            if response.status_code == 304:
+                response.close()
+                self.console.print(f"[green]✓ Note unchanged: {os.path.basename(filename)}[/green]")
+                return True
             response.raise_for_status()
+            if refreshing and not remote and int(response.headers.get('content-length', 0)) == os.path.getsize(filename):
+                # Saved before validators were kept, same size counts as unchanged
+                response.close()
+                self.integrity.remember_remote(filename, remote_validators(response.headers))
+                self.console.print(f"[green]✓ Note unchanged: {os.path.basename(filename)}[/green]")
+                return True
+            if os.path.exists(filename):
+                # Unlink instead of overwriting, the old file may be hardlinked to a duplicate
+                os.remove(filename)
             
             # Verify it's a PDF
             content_type = response.headers.get('content-type', '').lower()
@@ -481,29 +600,34 @@ class VideoDownloader:
             
             total_size = int(response.headers.get('content-length', 0))
             
-            with Progress(
-                SpinnerColumn(),
-                TextColumn("[progress.description]{task.description}"),
-                BarColumn(),
-                TaskProgressColumn(),
-                console=self.console
-            ) as progress:
-                task = progress.add_task("Downloading note...", total=100)
-                
-                with open(filename, 'wb') as f:
-                    downloaded = 0
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            downloaded += len(chunk)
-                            f.write(chunk)
-                            if total_size:
-                                progress.update(task, completed=(downloaded * 100 / total_size))
-                                
-            if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            task = self.progress.add_task(f"Note: {os.path.basename(filename)}", total=total_size)
+            hasher = BlockHasher()
+            
+            def on_chunk(chunk):
+                hasher.update(chunk)
+                self.progress.update(task, advance=len(chunk))
+            
+            ok = False
+            try:
+                # Notes are small, a smaller buffer keeps the progress bar moving
+                with self.storage.reserve(filename, total_size):
+                    self.integrity.mark_pending(filename, url, total_size)
+                    started = time.monotonic()
+                    try:
+                        written = stream_to_file(response, filename, on_chunk, 256 * 1024, total_size)
+                    except Exception:
+                        self.egress.broken(response)
+                        raise
+                    self.egress.observe(response, written, time.monotonic() - started)
+                ok = self.finish_download(filename, url, cookies, headers, total_size, hasher, remote_validators(response.headers))
+            finally:
+                self.progress.finish(task, ok)
+            
+            if ok:
                 self.console.print(f"[green]✓ Note downloaded successfully[/green]")
                 return True
             else:
-                self.console.print("[red]✗ Downloaded file is empty[/red]")
+                self.console.print("[red]✗ Downloaded note is incomplete or not a PDF[/red]")
                 if os.path.exists(filename):
                     os.remove(filename)
                 return False
@@ -516,26 +640,60 @@ class VideoDownloader:
 
     def sanitize_filename(self, filename):
         """Sanitize filename to be safe for all operating systems"""
-        # Remove invalid characters
-        filename = re.sub(r'[<>:"/\\|?*\n\r]', '', filename)
-        
-        # Replace Bengali characters with English
-        bengali_to_english = {
-            '০': '0', '১': '1', '২': '2', '৩': '3', '৪': '4',
-            '৫': '5', '৬': '6', '৭': '7', '৮': '8', '৯': '9'
-        }
-        
-        for ben, eng in bengali_to_english.items():
-            filename = filename.replace(ben, eng)
-        
-        # Limit length and remove extra spaces
-        filename = ' '.join(filename.split())  # Replace multiple spaces with single space
-        filename = filename[:200]  # Limit length
-        
-        # Replace spaces with underscores
-        filename = filename.replace(' ', '_')
-        
-        return filename
+        return sanitize(filename)
+
+    def already_downloaded(self, filename):
+        if self.names.exists(filename):
+            self.console.print(f"[green]✓ Already downloaded: {os.path.basename(filename)}[/green]")
+            return True
+        return False
+
+    def up_to_date(self, filename, url, cookies_string):
+        """already_downloaded(), and on --refresh also unchanged on the server.
+
+        A changed file is removed so the next download starts from scratch.
+        """
+        if not self.already_downloaded(filename):
+            return False
+        if not self.config['refresh'] or not url:
+            return True
+        headers = {**self.config['headers'], **self.source_headers.get(url, {})}
+        try:
+            changed = self.integrity.remote_changed(filename, url, self.get_cookies_dict(cookies_string), headers)
+        except Exception as e:
+            self.console.print(f"[yellow]Could not check {os.path.basename(filename)} for changes, keeping it: {str(e)}[/yellow]")
+            return True
+        if not changed:
+            return True
+        self.console.print(f"[cyan]↻ {os.path.basename(filename)} changed on the server, downloading again[/cyan]")
+        self.names.discard(filename)
+        for path in (filename, filename + '.aria2'):
+            if os.path.exists(path):
+                os.remove(path)
+        return False
+
+    def output_path(self, name, size=0):
+        """Full path for a download, on whichever root already holds it or has the most room.
+
+        A file an earlier version saved under its old name (no class ID) is
+        used where it is instead of being downloaded again.
+        """
+        path = self.storage.path_for(name, size, self.names.exists)
+        if self.names.exists(path):
+            return path
+        for root in self.storage.roots:
+            legacy = self.names.legacy_path(os.path.join(root, name))
+            if legacy:
+                return legacy
+        return path
+
+    def is_finished_file(self, path):
+        """A file on disk is finished unless it is still being written or has the wrong size"""
+        entry = self.integrity.entry(path)
+        if entry.get('pending'):
+            return False
+        expected = entry.get('expected_size')
+        return not expected or os.path.getsize(path) == expected
 
     def get_note_url_from_embed(self, driver):
         try:
@@ -606,6 +764,15 @@ class VideoDownloader:
             except:
                 self.console.print("[red]Please enter a valid number.[/red]")
 
+    def class_base(self, driver, class_url, title=None):
+        """(base filename, page title) of a class; the name comes from the listing title when known.
+
+        The page title still counts for the names older versions gave the
+        class's files, see NameIndex.legacy_path().
+        """
+        page_title = self.get_full_title(driver)
+        return self.names.base_for(class_url, title or page_title, (page_title,)), page_title
+
     def get_full_title(self, driver):
         try:
             # Get main title
@@ -683,7 +850,7 @@ class VideoDownloader:
                             filesize = f.get('filesize', 0)
                             if filesize == 0:  # If filesize not available, try to get from URL
                                 try:
-                                    response = requests.head(f['url'])
+                                    response = self.http.head(f['url'])
                                     filesize = int(response.headers.get('content-length', 0))
                                 except:
                                     pass
@@ -722,41 +889,28 @@ class VideoDownloader:
                 # Update options with selected format
                 ydl_opts['format'] = selected_format
                 
-                # Add progress hook with speed display
-                with Progress(
-                    SpinnerColumn(),
-                    TextColumn("[progress.description]{task.description}"),
-                    BarColumn(),
-                    TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                    TextColumn("•"),
-                    TextColumn("[cyan]{task.fields[speed]}[/cyan]"),
-                    console=self.console
-                ) as progress:
-                    task = progress.add_task("Downloading...", total=100, speed="0 MB/s")
-                    
-                    def progress_hook(d):
-                        if d['status'] == 'downloading':
-                            # Calculate speed in MB/s
-                            speed = d.get('speed', 0)
-                            if speed:
-                                speed_mb = speed / (1024 * 1024)
-                                speed_text = f"{speed_mb:.1f} MB/s"
-                            else:
-                                speed_text = "-- MB/s"
-                            
-                            # Update progress
-                            downloaded = d.get('downloaded_bytes', 0)
-                            total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
-                            if total:
-                                percentage = (downloaded / total) * 100
-                                progress.update(task, completed=percentage, speed=speed_text)
+                # Add progress hook, speed comes from the hub's meter like every other engine
+                task = self.progress.add_task(f"YouTube: {os.path.basename(filename)}")
                 
-                    ydl_opts['progress_hooks'] = [progress_hook]
-                    
-                    # Download video
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        ydl.download([f'https://www.youtube.com/watch?v={video_id}'])
+                def progress_hook(d):
+                    if d['status'] == 'downloading':
+                        downloaded = d.get('downloaded_bytes', 0)
+                        total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
+                        self.progress.update(task, total=total or None, completed=downloaded)
+            
+                ydl_opts['progress_hooks'] = [progress_hook]
                 
+                # Download video
+                ok = False
+                try:
+                    self.run_ytdlp(ydl_opts, video_id, filename)
+                    ok = True
+                finally:
+                    self.progress.finish(task, ok)
+                
+                # Integrity, dedup, the name index and post-processing like every other engine
+                if not self.finish_download(filename, None, None, None):
+                    return False
                 self.console.print("[green]✓ Successfully downloaded YouTube version[/green]")
                 return True
                 
@@ -771,15 +925,28 @@ class VideoDownloader:
                 self.console.print("[yellow]Please install yt-dlp first: pip install yt-dlp[/yellow]")
             return False
 
+    def run_ytdlp(self, ydl_opts, video_id, filename):
+        """Download one YouTube video over the best egress route, its size reserved first"""
+        import yt_dlp
+        with self.egress.lease() as endpoint:
+            if endpoint is not None:
+                ydl_opts = {**ydl_opts, **endpoint.ytdlp_options()}
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                # Format selection first, so the chosen size can be reserved
+                info = ydl.extract_info(f'https://www.youtube.com/watch?v={video_id}', download=False)
+                size = ytdlp_size(info)
+                with self.storage.reserve(filename, size):
+                    started = time.monotonic()
+                    ydl.process_info(info)
+            if endpoint is not None:
+                self.egress.succeeded(endpoint, size, time.monotonic() - started)
+
     def process_class_page(self, cookies_string, class_url):
-        driver = webdriver.Chrome(options=self.chrome_options)
+        cookies_dict = self.get_cookies_dict(cookies_string)
+        driver = self.driver_pool.acquire()
         try:
             # Initial setup
             self.console.print("\n[bold]🔄 Initializing...[/bold]")
-            driver.get("https://online.utkorsho.tech")
-            cookies_dict = self.get_cookies_dict(cookies_string)
-            for name, value in cookies_dict.items():
-                driver.add_cookie({'name': name, 'value': value})
             
             # Load page
             self.console.print("[bold]📥 Loading class page...[/bold]")
@@ -787,12 +954,9 @@ class VideoDownloader:
             time.sleep(2)
             
             # Get video title
-            video_title = self.get_full_title(driver)
+            base_filename, video_title = self.class_base(driver, class_url)
             if video_title:
-                base_filename = self.sanitize_filename(video_title)
                 self.console.print(f"\n[bold green]📝 Class Title:[/bold green] {video_title}")
-            else:
-                base_filename = "video"
 
             # Try to get video sources
             video_sources = []
@@ -815,10 +979,7 @@ class VideoDownloader:
 
             # Ask for YouTube preference first
             if youtube_id and self.ask_youtube_preference(youtube_id):
-                filename = os.path.join(
-                    self.config['download_path'], 
-                    f"{base_filename}_youtube.mp4"
-                )
+                filename = self.output_path(f"{base_filename}_youtube.mp4")
                 if not self.download_youtube(youtube_id, filename):
                     self.console.print("[yellow]Falling back to direct download...[/yellow]")
                     # Process direct video sources
@@ -835,19 +996,8 @@ class VideoDownloader:
                 note_url = self.get_note_url_from_link(driver)
 
             if note_url:
-                note_filename = os.path.join(
-                    self.config['download_path'], 
-                    f"{base_filename}_note.pdf"
-                )
-                self.console.print("[cyan]Downloading note...[/cyan]")
-                
-                try:
-                    response = requests.get(note_url, cookies=cookies_dict, headers=self.config['headers'])
-                    with open(note_filename, 'wb') as f:
-                        f.write(response.content)
-                    self.console.print("[green]✓ Note downloaded successfully[/green]")
-                except Exception as e:
-                    self.console.print(f"[red]✗ Failed to download note: {str(e)}[/red]")
+                note_filename = self.output_path(f"{base_filename}_note.pdf")
+                self.download_note(note_url, cookies_string, note_filename)
 
             return True
 
@@ -856,7 +1006,7 @@ class VideoDownloader:
             return False
             
         finally:
-            driver.quit()
+            self.driver_pool.release(driver)
 
     def process_direct_sources(self, video_sources, base_filename, cookies_string):
         self.console.print(f"[green]Found {len(video_sources)} video sources[/green]")
@@ -881,25 +1031,19 @@ class VideoDownloader:
                 if int(resolution) not in selected_resolutions:
                     continue
                     
-                filename = os.path.join(
-                    self.config['download_path'], 
-                    f"{base_filename}_{resolution}p.mp4"
-                )
+                filename = self.output_path(f"{base_filename}_{resolution}p.mp4")
                 
-                if not os.path.exists(filename):
+                if self.names.exists(filename):
+                    self.console.print(f"[green]✓ Already downloaded: {os.path.basename(filename)}[/green]")
+                else:
                     self.console.print(f"[cyan]Downloading {resolution}p video...[/cyan]")
-                    with Progress(
-                        SpinnerColumn(),
-                        TextColumn("[progress.description]{task.description}"),
-                        BarColumn(),
-                        TaskProgressColumn(),
-                        console=self.console
-                    ) as progress:
-                        task = progress.add_task(f"Downloading...", total=100)
-                        if self.download_video(url, cookies_string, filename, progress, task):
-                            self.console.print(f"[green]✓ Successfully downloaded {resolution}p version[/green]")
-                        else:
-                            self.console.print(f"[red]✗ Failed to download {resolution}p version[/red]")
+                    task = self.progress.add_task(f"{resolution}p: {os.path.basename(filename)}")
+                    ok = self.download_video(url, cookies_string, filename, self.progress, task)
+                    self.progress.finish(task, ok)
+                    if ok:
+                        self.console.print(f"[green]✓ Successfully downloaded {resolution}p version[/green]")
+                    else:
+                        self.console.print(f"[red]✗ Failed to download {resolution}p version[/red]")
         return True
 
     def show_welcome(self):
@@ -933,6 +1077,22 @@ class VideoDownloader:
             pass
         return None
 
+    def ensure_valid_cookies(self, cookies_string):
+        """Probe the site with the cookies and ask for new ones until they work"""
+        while cookies_string:
+            self.sessions.load(cookies_string)
+            self.console.print("[cyan]Checking cookies...[/cyan]")
+            if self.sessions.probe():
+                self.console.print("[green]✓ Cookies are valid[/green]")
+                return cookies_string
+            self.console.print("[red]✗ Cookies are expired or invalid[/red]")
+            new_cookies = self.console.input("[bold blue]🔑 Enter new cookies (or press Enter to continue anyway):[/bold blue] ").strip()
+            if not new_cookies:
+                return cookies_string
+            self.save_cookies(new_cookies)
+            cookies_string = new_cookies
+        return cookies_string
+
     def get_youtube_quality_preference(self, video_id):
         """Get YouTube quality preference without downloading"""
         try:
@@ -975,121 +1135,228 @@ class VideoDownloader:
         except:
             return None
 
-    def process_class_page_with_preferences(self, cookies_string, class_url, use_youtube=False, youtube_quality=None, direct_quality=None):
-        driver = webdriver.Chrome(options=self.chrome_options)
-        video_downloaded = False
+    def ask_quality_policy(self):
+        """Ask once for a quality policy that is resolved per class, see quality_policy.py"""
+        from quality_policy import QualityPolicy, POLICY_PRESETS
+
+        self.console.print("\n[yellow]╭─── Quality Policy ───╮[/yellow]")
+        for i, preset in enumerate(POLICY_PRESETS, 1):
+            self.console.print(f"[cyan]│ {i}. {preset}[/cyan]")
+        self.console.print("[yellow]╰──────────────────────╯[/yellow]")
+
+        while True:
+            choice = self.console.input("\n[bold blue]Choose policy (number) or type one, e.g. 'max 720p':[/bold blue] ").strip()
+            if choice.isdigit() and 1 <= int(choice) <= len(POLICY_PRESETS):
+                choice = POLICY_PRESETS[int(choice) - 1]
+            try:
+                return QualityPolicy.parse(choice)
+            except ValueError as e:
+                self.console.print(f"[red]{str(e)}. Try again.[/red]")
+
+    def get_remote_size(self, url, cookies_string=None):
+        """Content-Length from a HEAD, remembered so quality selection and space reservation share one request"""
+        if url in self.remote_sizes:
+            return self.remote_sizes[url]
+        try:
+            cookies = self.get_cookies_dict(cookies_string) if cookies_string else None
+            headers = {**self.config['headers'], **self.source_headers.get(url, {})}
+            response = self.http.head(url, headers=headers, cookies=cookies, allow_redirects=True)
+            size = int(response.headers.get('content-length', 0))
+        except Exception:
+            return 0
+        self.remote_sizes[url] = size
+        return size
+
+    def probe_class_size(self, class_url, quality_policy):
+        """Size of the direct video a policy would pick, from the class page's HTML and a HEAD; 0 when unknown.
+
+        Cheap enough to run when a class is queued, so the queue can be
+        ordered by real sizes before any of its videos was attempted.
+        """
+        try:
+            response = self.http.get(class_url, headers=self.config['headers'], timeout=30)
+            response.raise_for_status()
+        except Exception:
+            return 0
+        source = quality_policy.select_direct(page_video_sources(response.text), self.get_remote_size)
+        return self.get_remote_size(source[1]) if source else 0
+
+    def process_class_page_with_preferences(self, cookies_string, class_url, use_youtube=False, youtube_quality=None, direct_quality=None, quality_policy=None, title=None):
+        # A fixed resolution from older callers means "nearest to it"
+        if quality_policy is None and direct_quality:
+            from quality_policy import QualityPolicy
+            quality_policy = QualityPolicy('nearest', direct_quality)
+
+        results = self.process_class_artifacts(
+            cookies_string, class_url, ('video', 'note'),
+            use_youtube=use_youtube, youtube_quality=youtube_quality, quality_policy=quality_policy, title=title
+        )
+        return results['video'][0]
+
+    def process_class_artifacts(self, cookies_string, class_url, artifacts=('video', 'note'), use_youtube=False, youtube_quality=None, quality_policy=None, title=None):
+        """Download the requested artifacts of one class in a single page visit.
+
+        Returns {artifact: (ok, error)}, a class without a note counts as a
+        finished note. Sizes learned on the way are left in class_sizes.
+        title is the class's listing title when the caller has it.
+        """
+        cookies_dict = self.get_cookies_dict(cookies_string)
+        driver = self.driver_pool.acquire()
+        results = {}
+        sizes = self.class_sizes.setdefault(class_url, {})
         
         try:
-            # Initial setup
-            driver.get("https://online.utkorsho.tech")
-            cookies_dict = self.get_cookies_dict(cookies_string)
-            for name, value in cookies_dict.items():
-                driver.add_cookie({'name': name, 'value': value})
-            
-            # Load page
-            driver.get(class_url)
+            # Load page, recording its network requests
+            capture = self.load_class_page(driver, class_url)
             time.sleep(2)
             
-            # Get video title
-            video_title = self.get_full_title(driver)
-            if video_title:
-                # Remove topic details from filename to keep it shorter
-                title_parts = video_title.split('-', 1)
-                base_filename = self.sanitize_filename(title_parts[0].strip())
-            else:
-                base_filename = "video"
+            # Short title plus class ID, see naming.py
+            base_filename, _ = self.class_base(driver, class_url, title)
 
-            # Create filenames
-            if use_youtube:
-                filename = os.path.join(
-                    self.config['download_path'],
-                    f"{base_filename}_youtube.mp4"
-                )
-            else:
-                filename = os.path.join(
-                    self.config['download_path'],
-                    f"{base_filename}_{direct_quality}p.mp4"
+            if 'video' in artifacts:
+                results['video'] = self._process_video_artifact(
+                    driver, capture, cookies_string, cookies_dict, base_filename,
+                    use_youtube, youtube_quality, quality_policy, sizes
                 )
 
-            # For notes
-            note_filename = os.path.join(
-                self.config['download_path'],
-                f"{base_filename}_note.pdf"
+            if 'note' in artifacts:
+                note_filename = self.output_path(f"{base_filename}_note.pdf")
+                self.switch_to_tab(driver, "note")
+                time.sleep(2)
+                
+                note_url = self.get_note_url_from_link(driver) or self.network_note_url(capture)
+                # On --refresh download_note asks the server with a conditional GET instead
+                if not note_url or (not self.config['refresh'] and self.already_downloaded(note_filename)):
+                    results['note'] = (True, None)
+                elif self.download_note(note_url, cookies_string, note_filename):
+                    results['note'] = (True, None)
+                else:
+                    results['note'] = (False, "note download failed")
+                if os.path.exists(note_filename):
+                    sizes['note'] = os.path.getsize(note_filename)
+                
+        except Exception as e:
+            self.console.print(f"[red]Error processing class: {str(e)}[/red]")
+            for artifact in artifacts:
+                results.setdefault(artifact, (False, str(e)))
+        finally:
+            self.driver_pool.release(driver)
+        return results
+
+    def _process_video_artifact(self, driver, capture, cookies_string, cookies_dict, base_filename, use_youtube, youtube_quality, quality_policy, sizes=None):
+        video_downloaded = False
+
+        # Switch to video tab
+        self.switch_to_tab(driver, "video")
+        time.sleep(2)
+        
+        # Get video sources
+        video_sources = self.get_video_sources(driver, cookies_dict)
+        
+        if not video_sources:
+            # No source attributes, take what the player requested
+            video_sources = self.network_video_sources(capture)
+        
+        if not video_sources:
+            self.console.print("[red]Failed to download video[/red]")
+            return (False, "no video sources found")
+
+        # Handle YouTube download
+        if use_youtube:
+            youtube_id = next((source[1] for source in video_sources if source[0] == 'youtube'), None)
+            if youtube_id:
+                filename = self.output_path(f"{base_filename}_youtube.mp4")
+                video_downloaded = self.already_downloaded(filename) or self.download_youtube_with_quality(
+                    youtube_id, filename, youtube_quality or quality_policy
+                )
+                # yt-dlp may have left a different extension if it could not merge to mp4
+                if video_downloaded and sizes is not None and os.path.exists(filename):
+                    sizes['video'] = os.path.getsize(filename)
+        
+        # Handle direct download if YouTube failed or not chosen
+        if not video_downloaded and quality_policy:
+            direct_source = quality_policy.select_direct(
+                video_sources, lambda url: self.get_remote_size(url, cookies_string)
             )
+            if direct_source:
+                direct_quality = direct_source[2]
+                if sizes is not None:
+                    # Known from the HEAD probe even if the download fails, a retry is ordered by it
+                    sizes['video'] = self.get_remote_size(direct_source[1], cookies_string)
+                filename = self.output_path(f"{base_filename}_{direct_quality}p.mp4")
+                if self.up_to_date(filename, direct_source[1], cookies_string):
+                    return (True, None)
+                # Download video with progress
+                task = self.progress.add_task(f"{direct_quality}p: {os.path.basename(filename)}")
+                video_downloaded = self.download_video(direct_source[1], cookies_string, filename, self.progress, task,
+                                                       quality_policy.max_height)
+                self.progress.finish(task, video_downloaded)
+                if video_downloaded:
+                    self.console.print("[green]✓ Successfully downloaded video[/green]")
+                else:
+                    self.console.print("[red]✗ Failed to download video[/red]")
+        
+        if not video_downloaded:
+            self.console.print("[red]Failed to download video[/red]")
+            return (False, "video download failed")
+        return (True, None)
 
-            # Switch to video tab
-            self.switch_to_tab(driver, "video")
+    def collect_class_info(self, cookies_string, class_url, want_note=True, title=None):
+        """Scrape title, video sources and note URL of a class without downloading anything"""
+        cookies_dict = self.get_cookies_dict(cookies_string)
+        driver = self.driver_pool.acquire()
+        try:
+            capture = self.load_class_page(driver, class_url)
             time.sleep(2)
-            
-            # Get video sources
-            video_sources = self.get_video_sources(driver, cookies_dict)
-            
-            if not video_sources:
-                # Try to get direct video URL
-                video_url = self.get_video_url(cookies_string, class_url)
-                if video_url:
-                    video_sources = [('direct', video_url, '720')]
-            
-            if video_sources:
-                # Handle YouTube download
-                if use_youtube:
-                    youtube_id = next((source[1] for source in video_sources if source[0] == 'youtube'), None)
-                    if youtube_id:
-                        video_downloaded = self.download_youtube_with_quality(youtube_id, filename, youtube_quality)
-                
-                # Handle direct download if YouTube failed or not chosen
-                if not video_downloaded and direct_quality:
-                    direct_source = next((source for source in video_sources 
-                                        if source[0] == 'direct'), None)
-                    if direct_source:
-                        # Download video with progress
-                        with Progress(
-                            SpinnerColumn(),
-                            TextColumn("[progress.description]{task.description}"),
-                            BarColumn(),
-                            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                            TextColumn("•"),
-                            TextColumn("[cyan]{task.fields[speed]}[/cyan]"),
-                            console=self.console
-                        ) as progress:
-                            task = progress.add_task(
-                                f"Downloading {direct_quality}p version...", 
-                                total=100,
-                                speed="0 MB/s"
-                            )
-                            
-                            if self.download_video(direct_source[1], cookies_string, filename, progress, task):
-                                self.console.print("[green]✓ Successfully downloaded video[/green]")
-                                video_downloaded = True
-                            else:
-                                self.console.print("[red]✗ Failed to download video[/red]")
-            
-            # Handle notes
-            if not video_downloaded:
-                self.console.print("[red]Failed to download video[/red]")
-                
-            self.switch_to_tab(driver, "note")
+
+            base_filename, video_title = self.class_base(driver, class_url, title)
+
+            self.switch_to_tab(driver, "video")
             time.sleep(2)
-            
-            note_url = self.get_note_url_from_link(driver)
-            if note_url:
-                self.download_note(note_url, cookies_string, note_filename)
-            
-            return video_downloaded
-                
+            video_sources = self.get_video_sources(driver, cookies_dict) or self.network_video_sources(capture)
+
+            note_url = None
+            if want_note:
+                self.switch_to_tab(driver, "note")
+                time.sleep(2)
+                note_url = self.get_note_url_from_link(driver) or self.network_note_url(capture)
+
+            return {
+                'url': class_url,
+                'title': video_title,
+                'base_filename': base_filename,
+                'video_sources': video_sources,
+                'youtube_id': next((s[1] for s in video_sources if s[0] == 'youtube'), None),
+                'note_url': note_url
+            }
         except Exception as e:
             self.console.print(f"[red]Error processing class: {str(e)}[/red]")
-            return False
+            return None
         finally:
-            driver.quit()
+            self.driver_pool.release(driver)
+
+    def download_youtube_batch(self, jobs, format_id=None):
+        """Download (video_id, filename) pairs through one shared YoutubeDL, see youtube_batch.py"""
+        from youtube_batch import YoutubeBatchDownloader
+        results = YoutubeBatchDownloader(self.config, self.console, self.progress, self.names.exists,
+                                         self.storage, self.egress).download_all(jobs, format_id)
+        
+        # No source URL to repair from, but broken merges should still be reported
+        for filename, ok in results.items():
+            if ok:
+                results[filename] = self.finish_download(filename, None, None, None)
+        return results
 
     def download_youtube_with_quality(self, video_id, filename, format_id):
-        """Download YouTube video with specified quality"""
+        """Download YouTube video with specified quality, format_id may also be a QualityPolicy"""
         try:
-            import yt_dlp
+            if hasattr(format_id, 'as_ytdlp_selector'):
+                format_id = format_id.as_ytdlp_selector()
             ydl_opts = {
                 'format': format_id,
                 'outtmpl': filename,
+                # A policy picks separate video and audio streams, joined into the .mp4 asked for
+                'merge_output_format': 'mp4',
                 'quiet': True,
                 'no_warnings': True,
                 'external_downloader': 'aria2c',
@@ -1102,38 +1369,23 @@ class VideoDownloader:
                 ]
             }
             
-            with Progress(
-                SpinnerColumn(),
-                TextColumn("[progress.description]{task.description}"),
-                BarColumn(),
-                TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                TextColumn("•"),
-                TextColumn("[cyan]{task.fields[speed]}[/cyan]"),
-                console=self.console
-            ) as progress:
-                task = progress.add_task("Downloading...", total=100, speed="0 MB/s")
-                
-                def progress_hook(d):
-                    if d['status'] == 'downloading':
-                        speed = d.get('speed', 0)
-                        if speed:
-                            speed_mb = speed / (1024 * 1024)
-                            speed_text = f"{speed_mb:.1f} MB/s"
-                        else:
-                            speed_text = "-- MB/s"
-                        
-                        downloaded = d.get('downloaded_bytes', 0)
-                        total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
-                        if total:
-                            percentage = (downloaded / total) * 100
-                            progress.update(task, completed=percentage, speed=speed_text)
-                
-                ydl_opts['progress_hooks'] = [progress_hook]
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([f'https://www.youtube.com/watch?v={video_id}'])
-                
-                return True
+            task = self.progress.add_task(f"YouTube: {os.path.basename(filename)}")
+            
+            def progress_hook(d):
+                if d['status'] == 'downloading':
+                    downloaded = d.get('downloaded_bytes', 0)
+                    total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
+                    self.progress.update(task, total=total or None, completed=downloaded)
+            
+            ydl_opts['progress_hooks'] = [progress_hook]
+            
+            ok = False
+            try:
+                self.run_ytdlp(ydl_opts, video_id, filename)
+                ok = True
+            finally:
+                self.progress.finish(task, ok)
+            return self.finish_download(filename, None, None, None)
                 
         except Exception as e:
             self.console.print(f"[red]Failed to download YouTube version: {str(e)}[/red]")
@@ -1158,6 +1410,7 @@ def main():
     
     downloader = VideoDownloader()
     downloader.show_welcome()
+    downloader.report_startup_time()
     
     # Try to load saved cookies
     cookies = downloader.load_cookies()
@@ -1172,6 +1425,9 @@ def main():
             if cookies:
                 downloader.save_cookies(cookies)
     
+    # Find out about expired cookies now, not after minutes of scraping
+    cookies = downloader.ensure_valid_cookies(cookies)
+    
     while True:
         class_url = downloader.console.input("\n[bold blue]🔗 Enter class URL (or 'q' to quit):[/bold blue] ").strip()
         
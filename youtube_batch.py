@@ -0,0 +1,175 @@
+import concurrent.futures
+import contextlib
+import os
+import shutil
+import threading
+import time
+from rich.console import Console
+from progress_hub import ProgressHub
+from storage import ytdlp_size
+
+
+class YoutubeBatchDownloader:
+    """Download many YouTube videos, one YoutubeDL per worker thread and egress route.
+
+    YoutubeDL is not thread safe, so instances are never shared between
+    workers; a worker reuses its own across videos so the import and the
+    extractor setup still happen only a few times per batch.
+    """
+
+    def __init__(self, config, console=None, progress=None, exists=os.path.exists, storage=None, egress=None):
+        self.config = config
+        self.console = console or Console()
+        self.progress = progress or ProgressHub(self.console)
+        self.exists = exists
+        # StorageManager to reserve each video's size on its volume, optional
+        self.storage = storage
+        # EgressPool to spread videos over routes, optional; one YoutubeDL per route
+        self.egress = egress
+        self._format_spec = None
+        self._local = threading.local()
+        self._ydls = []
+        self._lock = threading.Lock()
+        self._tasks = {}
+
+    def build_options(self, format_spec):
+        ydl_opts = {
+            'format': format_spec or 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
+            # Replaced with the video's own path before each download, see download_one()
+            'outtmpl': '%(id)s.%(ext)s',
+            'merge_output_format': 'mp4',
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'concurrent_fragment_downloads': self.config.get('youtube_concurrent_fragments', 8),
+            'retries': self.config.get('max_retries', 3),
+            'fragment_retries': self.config.get('max_retries', 3),
+            'progress_hooks': [self._progress_hook],
+        }
+
+        # aria2c is only worth it for single-file http formats, fragmented
+        # formats are handled by yt-dlp's own concurrent fragment downloader
+        if shutil.which('aria2c'):
+            ydl_opts['external_downloader'] = {'http': 'aria2c'}
+            ydl_opts['external_downloader_args'] = {'aria2c': [
+                '--min-split-size=1M',
+                '--max-connection-per-server=16',
+                '--split=16',
+                f"--file-allocation={self.config.get('aria2_file_allocation', 'falloc')}"
+            ]}
+        return ydl_opts
+
+    def open(self, format_spec=None, endpoint=None):
+        """This thread's YoutubeDL for a route, created on first use"""
+        if format_spec is not None:
+            self._format_spec = format_spec
+        ydls = getattr(self._local, 'ydls', None)
+        if ydls is None:
+            ydls = self._local.ydls = {}
+        ydl = ydls.get(endpoint)
+        if ydl is None:
+            import yt_dlp
+            options = self.build_options(self._format_spec)
+            if endpoint is not None:
+                # yt-dlp reads proxy and source address once, when it is created
+                options.update(endpoint.ytdlp_options())
+            ydl = ydls[endpoint] = yt_dlp.YoutubeDL(options)
+            ydl.__enter__()
+            with self._lock:
+                self._ydls.append(ydl)
+        return ydl
+
+    def close(self):
+        with self._lock:
+            ydls, self._ydls = self._ydls, []
+        self._local = threading.local()
+        for ydl in ydls:
+            ydl.__exit__(None, None, None)
+
+    def _progress_hook(self, d):
+        info = d.get('info_dict') or {}
+        task = self._tasks.get(info.get('udvash_filename'))
+        if task is None:
+            return
+
+        if d['status'] == 'downloading':
+            downloaded = d.get('downloaded_bytes', 0)
+            total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
+            self.progress.update(task, total=total or None, completed=downloaded)
+        elif d['status'] == 'finished':
+            self.progress.update(task, status="Done!")
+
+    def download_one(self, video_id, filename):
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        lease = self.egress.lease() if self.egress else contextlib.nullcontext()
+        with lease as endpoint:
+            ydl = self.open(endpoint=endpoint)
+            info = ydl.extract_info(
+                f'https://www.youtube.com/watch?v={video_id}',
+                download=False,
+                extra_info={'udvash_filename': filename}
+            )
+            # The instance belongs to this thread, so its template can follow the video;
+            # a literal path, '%' in a title must not be read as a field
+            ydl.params['outtmpl'] = {'default': os.path.abspath(filename).replace('%', '%%')}
+            # The selected formats' size is known now, reserve it before downloading
+            size = ytdlp_size(info)
+            reserve = self.storage.reserve(filename, size) if self.storage else contextlib.nullcontext()
+            with reserve:
+                started = time.monotonic()
+                ydl.process_info(info)
+            if endpoint is not None:
+                self.egress.succeeded(endpoint, size, time.monotonic() - started)
+        return True
+
+    def download_all(self, jobs, format_spec=None):
+        """Download a list of (video_id, filename) pairs, returns {filename: success}"""
+        results = {}
+        pending = []
+        for video_id, filename in jobs:
+            if self.exists(filename):
+                self.console.print(f"[green]✓ Already downloaded: {os.path.basename(filename)}[/green]")
+                results[filename] = True
+            else:
+                pending.append((video_id, filename))
+
+        if not pending:
+            return results
+
+        try:
+            import yt_dlp  # noqa: F401
+            self._format_spec = format_spec
+        except Exception as e:
+            self.console.print(f"[red]Failed to initialise yt-dlp: {str(e)}[/red]")
+            self.console.print("[yellow]Please install yt-dlp first: pip install yt-dlp[/yellow]")
+            for _, filename in pending:
+                results[filename] = False
+            return results
+
+        max_workers = max(1, self.config.get('youtube_concurrent_videos', 3))
+        for _, filename in pending:
+            self._tasks[filename] = self.progress.add_task(
+                os.path.basename(filename)[:40], status="Queued"
+            )
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self.download_one, video_id, filename): filename
+                    for video_id, filename in pending
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    filename = futures[future]
+                    try:
+                        results[filename] = future.result()
+                    except Exception as e:
+                        results[filename] = False
+                        self.console.print(f"[red]✗ {os.path.basename(filename)}: {str(e)}[/red]")
+                    self.progress.finish(self._tasks[filename], results[filename])
+        finally:
+            # Anything not reached, e.g. after Ctrl+C, still has to leave the view
+            for filename, task in self._tasks.items():
+                self.progress.finish(task, results.get(filename, False))
+            self._tasks = {}
+            self.close()
+
+        return results